@@ -195,10 +195,16 @@ a back door installed at `d.file` in the case of a single-file data set.
 
 """
 
+import os as _os
+import time as _time
 import logging as _logging
+from collections import OrderedDict as _OrderedDict
 
 from .dataset import DataSet, WrongVersion
-from .lazy_indexer import LazyTransform
+from .lazy_indexer import (LazyTransform, ChunkCache, CostModel, IOStats, set_cost_model, get_cost_model,
+                           set_io_workers, get_io_workers, set_prefetch, get_prefetch)
+from .h5files import FilePool, open_file as _open_h5file
+from .sidecar import SensorStore
 from .concatdata import ConcatenatedDataSet
 from .h5datav1 import H5DataV1
 from .h5datav2 import H5DataV2
@@ -208,8 +214,8 @@ from .sensordata import _sensor_completer
 # Clean up top-level namespace a bit
 _dataset, _concatdata, _sensordata = dataset, concatdata, sensordata
 _h5datav1, _h5datav2, _h5datav3 = h5datav1, h5datav2, h5datav3
-_categorical, _lazy_indexer = categorical, lazy_indexer
-del dataset, concatdata, h5datav1, h5datav2, h5datav3, sensordata, categorical, lazy_indexer
+_categorical, _lazy_indexer, _h5files, _sidecar = categorical, lazy_indexer, h5files, sidecar
+del dataset, concatdata, h5datav1, h5datav2, h5datav3, sensordata, categorical, lazy_indexer, h5files, sidecar
 
 # Attempt to register custom IPython tab completer for sensor cache name lookups
 try:
@@ -259,10 +265,23 @@ else:
 #------------------------------------------------------------------------------
 
 formats = [H5DataV3, H5DataV2, H5DataV1]
+# Format class of recently seen files, keyed by (absolute path, modification time), in LRU order
+_format_cache = _OrderedDict()
+# Maximum number of files in format cache
+_FORMAT_CACHE_SIZE = 256
 
 def _file_action(action, filename, *args, **kwargs):
     """Perform action on data file using the appropriate format class.
 
+    The file is opened only once and the open file is handed to each format
+    class in turn, which checks the version and either uses the file or raises
+    :exc:`WrongVersion`. The formats of recently visited files are remembered
+    (until the file is modified), so that subsequent visits hand the file to
+    its format straight away without probing the others, which speeds up
+    tools that visit the same files repeatedly. The file is closed again if
+    no format takes it over, e.g. because of an error, and its remembered
+    format is then forgotten.
+
     Parameters
     ----------
     action : string
@@ -277,15 +296,36 @@ def _file_action(action, filename, *args, **kwargs):
         Result of action
 
     """
-    for format in formats:
-        try:
-            result = getattr(format, action)(filename, *args, **kwargs)
-            break
-        except WrongVersion:
-            continue
-    else:
-        raise WrongVersion("File '%s' has unknown data file format or version"
-                           % (filename,))
+    try:
+        key = (_os.path.abspath(filename), _os.path.getmtime(filename))
+    except OSError:
+        key = None
+    # Hand the file to its remembered format first, which makes probing the others unnecessary unless the
+    # remembered format turns out to be wrong (the same open file is handed to the formats in both cases)
+    cached = _format_cache.pop(key, None)
+    candidates = ([cached] if cached is not None else []) + [f for f in formats if f is not cached]
+    h5file = _open_h5file(filename, kwargs.get('mode', 'r'), kwargs.get('h5_options'))
+    success = False
+    try:
+        for format in candidates:
+            try:
+                result = getattr(format, action)(h5file, *args, **kwargs)
+                break
+            except WrongVersion:
+                continue
+        else:
+            raise WrongVersion("File '%s' has unknown data file format or version"
+                               % (filename,))
+        success = True
+    finally:
+        # Close the file on any error, as no format has taken it over (and its format is forgotten)
+        if not success:
+            h5file.close()
+    if key is not None:
+        # Mark format as the most recently used one and forget the least recently used ones
+        _format_cache[key] = format
+        while len(_format_cache) > _FORMAT_CACHE_SIZE:
+            _format_cache.popitem(last=False)
     return result
 
 
@@ -302,27 +342,73 @@ def open(filename, ref_ant='', time_offset=0.0, **kwargs):
         Offset to add to all timestamps, in seconds
     kwargs : dict, optional
         Extra keyword arguments are passed on to underlying accessor class:
+        chunk_cache_size : int, optional
+            [all] Byte budget of cache of decoded HDF5 chunks shared by all
+            files (default 0 disables cache, see :class:`ChunkCache`)
+        sensor_cache_size : int, optional
+            [all] Memory budget of extracted and virtual sensor data, in bytes,
+            beyond which the least recently used sensors are evicted and
+            recalculated when needed again (default 0 is unlimited). Directly
+            assigned sensors and raw sensor data are not part of the budget
+            (see :class:`SensorCache`)
+        max_open_files : int, optional
+            [H5DataV2, H5DataV3] Maximum number of files kept open at once, closing the least
+            recently used files and reopening them when their data is needed
+            (default 0 keeps all files open, see :class:`FilePool`)
         mode : string, optional
             [H5DataV*] File opening mode (e.g. 'r+' to open file in write mode)
+        h5_options : dict, optional
+            [H5DataV*] HDF5 tuning options passed to :class:`h5py.File`, e.g.
+            chunk cache settings ('rdcc_nbytes', 'rdcc_nslots', 'rdcc_w0'),
+            file driver ('driver') and page buffer size ('page_buf_size').
+            By default the chunk cache of vis, flags and weights [H5DataV2,
+            H5DataV3] is sized to hold a row of chunks along time, which is
+            disabled by setting 'auto_chunk_cache' to False
+        sidecar : {False, True}
+            [H5DataV2, H5DataV3] True if the scans, compound scans and targets
+            derived from sensors should be stored in a sidecar index file next
+            to each data file and reused on subsequent opens while fresh
+        sensor_store : {None, True, string, :class:`SensorStore` object}
+            [H5DataV2, H5DataV3] Persistent store of extracted sensor data,
+            which is reused on subsequent opens while the data files are
+            unchanged (True uses the default store in the user's cache
+            directory, and a string specifies the store directory)
         quicklook : {False, True}
-            [H5DataV2] True if synthesised timestamps should be used to
-            partition data set even if real timestamps are irregular, thereby
-            avoiding the slow loading of real timestamps at the cost of
-            slightly inaccurate label borders
+            [H5DataV2, H5DataV3] True if synthesised timestamps should be
+            used to partition data set even if real timestamps are irregular,
+            thereby avoiding the slow loading of real timestamps at the cost
+            of slightly inaccurate label borders
 
     Returns
     -------
     data : :class:`DataSet` object
-        Object providing :class:`DataSet` interface to file(s)
+        Object providing :class:`DataSet` interface to file(s), which has an
+        extra `open_timings` attribute that lists the time taken to open each
+        file (as a list of (filename, seconds) pairs)
 
     """
     filenames = [filename] if isinstance(filename, basestring) else filename
-    datasets = []
+    chunk_cache_size = kwargs.pop('chunk_cache_size', 0)
+    sensor_cache_size = kwargs.pop('sensor_cache_size', 0)
+    max_open_files = kwargs.pop('max_open_files', 0)
+    if max_open_files:
+        kwargs['file_pool'] = FilePool(max_open_files, kwargs.get('h5_options'))
+    sensor_store = kwargs.get('sensor_store')
+    if sensor_store is True or isinstance(sensor_store, basestring):
+        kwargs['sensor_store'] = SensorStore(None if sensor_store is True else sensor_store)
+    datasets, open_timings = [], []
     for f in filenames:
-        dataset = _file_action('__call__', f, ref_ant, time_offset, **kwargs)
-        datasets.append(dataset)
-    return datasets[0] if isinstance(filename, basestring) else \
-           ConcatenatedDataSet(datasets)
+        start = _time.time()
+        datasets.append(_file_action('__call__', f, ref_ant, time_offset, **kwargs))
+        open_timings.append((f, _time.time() - start))
+        logger.debug("Opened '%s' in %.3f seconds" % open_timings[-1])
+    data = datasets[0] if isinstance(filename, basestring) else ConcatenatedDataSet(datasets)
+    data.open_timings = open_timings
+    if chunk_cache_size:
+        data.chunk_cache = ChunkCache(chunk_cache_size)
+    if sensor_cache_size:
+        data.sensor.max_bytes = sensor_cache_size
+    return data
 
 
 def get_ants(filename):
@@ -481,7 +481,8 @@ def concatenate_categorical(split_data, **kwargs):
 
 
 def sensor_to_categorical(sensor_timestamps, sensor_values, dump_midtimes, dump_period,
-                          greedy_values=None, initial_value=None, transform=None, allow_repeats=False, **kwargs):
+                          greedy_values=None, initial_value=None, transform=None, allow_repeats=False,
+                          sensor_dumps=None, **kwargs):
     """Align categorical sensor events with dumps and clean up spurious events.
 
     This converts timestamped sensor data into a categorical dataset by
@@ -515,6 +516,9 @@ def sensor_to_categorical(sensor_timestamps, sensor_values, dump_midtimes, dump_
         Transform sensor values before discarding repeats and applying greed
     allow_repeats : {False, True}, optional
         If False, discard sensor events that do not change (transformed) value
+    sensor_dumps : sequence of int, length *M*, optional
+        Index of dump during which each sensor event occurred, if already known
+        (e.g. shared by sensors with identical timestamps)
 
     Returns
     -------
@@ -527,7 +531,9 @@ def sensor_to_categorical(sensor_timestamps, sensor_values, dump_midtimes, dump_
     dump_midtimes = np.atleast_1d(dump_midtimes)
     # Convert sensor event times to dump indices (pick the dump during which each sensor event occurred)
     # The last event is fixed at one-past-the-last-dump, to indicate the end of the last segment
-    events = np.r_[dump_midtimes.searchsorted(sensor_timestamps - 0.5 * dump_period), len(dump_midtimes)]
+    if sensor_dumps is None:
+        sensor_dumps = dump_midtimes.searchsorted(sensor_timestamps - 0.5 * dump_period)
+    events = np.r_[sensor_dumps, len(dump_midtimes)]
     # Cull any empty segments (i.e. when multiple sensor events occur within a single dump, only keep last one)
     # This also gets rid of excess events before the first dump and after the last dump
     non_empty = (np.diff(events) > 0)
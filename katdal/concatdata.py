@@ -1,12 +1,15 @@
 """Class for concatenating visibility data sets."""
 
+import time
 import os.path
 import itertools
+import threading
+from collections import OrderedDict
 
 import numpy as np
 
-from .lazy_indexer import LazyIndexer
-from .sensordata import SensorData, SensorCache, dummy_sensor_data
+from .lazy_indexer import LazyIndexer, IOStats, get_io_workers, _out_view, _ThreadPools, _dataset_key
+from .sensordata import SensorData, SensorCache, dummy_sensor_data, _sensor_records
 from .categorical import CategoricalData, unique_in_order, concatenate_categorical
 from .dataset import DataSet
 
@@ -15,6 +18,62 @@ class ConcatenationError(Exception):
     """Sequence of objects could not be concatenated due to incompatibility."""
     pass
 
+#--------------------------------------------------------------------------------------------------
+#--- Utility functions :  Parallel fan-out
+#--------------------------------------------------------------------------------------------------
+
+# Thread pools that read from several underlying indexers at once, keyed by number of workers
+# (these are kept apart from the lazy indexer I/O pools, which the underlying indexers use in turn)
+_fan_out_pools = _ThreadPools()
+# Flags whether the current thread is already busy with a fan-out (nested fan-outs run serially)
+_fan_out_state = threading.local()
+
+
+def _indexer_file(indexer):
+    """Name of file read by indexer (or a unique key if it reads several files or no file at all)."""
+    dataset = getattr(indexer, 'dataset', None)
+    return _dataset_key(dataset)[0] if dataset is not None else id(indexer)
+
+
+def _fan_out(func, jobs, num_workers, key=None):
+    """Call `func` on each job, spreading the jobs over a pool of worker threads.
+
+    Jobs with the same key (typically those that read the same file) are done
+    serially by a single worker, so that workers only run concurrently on
+    different files and never contend for the same file.
+
+    Parameters
+    ----------
+    func : function, signature ``func(job)``
+        Function that does a single job (the return value is ignored)
+    jobs : list
+        Jobs to do, typically one per underlying indexer
+    num_workers : int
+        Maximum number of jobs done at once (1 means do jobs serially in
+        calling thread)
+    key : function, signature ``key = f(job)``, or None, optional
+        Function that groups jobs to be done by the same worker (default is
+        to put each job in its own group)
+
+    """
+    groups = OrderedDict()
+    for job in jobs:
+        groups.setdefault(key(job) if key is not None else len(groups), []).append(job)
+    num_workers = min(num_workers, len(groups))
+    if num_workers <= 1 or getattr(_fan_out_state, 'active', False):
+        for job in jobs:
+            func(job)
+        return
+    def nested_func(group):
+        _fan_out_state.active = True
+        try:
+            for job in group:
+                func(job)
+        finally:
+            _fan_out_state.active = False
+    with _fan_out_pools.lease(num_workers) as pool:
+        pool.map(nested_func, groups.values())
+
 #--------------------------------------------------------------------------------------------------
 #--- CLASS :  ConcatenatedLazyIndexer
 #--------------------------------------------------------------------------------------------------
@@ -33,11 +92,24 @@ class ConcatenatedLazyIndexer(LazyIndexer):
         Sequence of indexers or raw arrays to be concatenated
     transforms : list of :class:`LazyTransform` objects or None, optional
         Extra chain of transforms to be applied to data after final indexing
+    prefetch : int or None, optional
+        Number of blocks to read ahead on a background thread when indexer is
+        accessed with consecutive slices along the first axis (the default is
+        the global setting, see :func:`set_prefetch`)
+    stats : :class:`IOStats` object or None, optional
+        Counters that aggregate the I/O statistics of this indexer with others
+        (the underlying indexers record their own reads as well)
+    workers : int or None, optional
+        Number of underlying indexers to read from concurrently, each filling
+        its own section of the output array (the default is the global setting,
+        see :func:`set_io_workers`)
 
     Attributes
     ----------
     name : string
         Name of first non-empty indexer (or empty string otherwise)
+    stats : :class:`IOStats` object
+        I/O statistics of this indexer, including the reads of underlying indexers
 
     Raises
     ------
@@ -45,7 +117,7 @@ class ConcatenatedLazyIndexer(LazyIndexer):
         If transform chain does not obey restrictions on changing the data shape
 
     """
-    def __init__(self, indexers, transforms=None):
+    def __init__(self, indexers, transforms=None, prefetch=None, stats=None, workers=None):
         # Only keep those indexers that have any data selected on first axis (unless nothing at all is selected)
         self.indexers = [indexer for indexer in indexers if indexer.shape[0]]
         if not self.indexers:
@@ -54,6 +126,10 @@ class ConcatenatedLazyIndexer(LazyIndexer):
         for n, indexer in enumerate(self.indexers):
             self.indexers[n] = indexer if isinstance(indexer, LazyIndexer) else LazyIndexer(indexer)
         self.transforms = [] if transforms is None else transforms
+        self.prefetch = prefetch
+        self._read_ahead = None
+        self.stats = IOStats(parent=stats)
+        self.workers = workers
         # Pick the first non-empty indexer name as overall name, or failing that, an empty string
         names = unique_in_order([indexer.name for indexer in self.indexers if indexer.name])
         self.name = (names[0] + ' etc.') if len(names) > 1 else names[0] if len(names) == 1 else ''
@@ -73,6 +149,18 @@ class ConcatenatedLazyIndexer(LazyIndexer):
             descr += ['-> ' + self._name_shape_dtype(transform.name, shape, dtype)]
         return '\n'.join(descr)
 
+    def _block_labels(self, axis):
+        """Label each first-stage index along `axis` with the chunk it falls in."""
+        if axis != 0:
+            return self.indexers[0]._block_labels(axis)
+        # Offset the chunk labels of each indexer so that blocks never straddle two indexers
+        labels, offset = [], 0
+        for indexer in self.indexers:
+            indexer_labels = indexer._block_labels(axis)
+            labels.append(indexer_labels - indexer_labels.min() + offset if len(indexer_labels) else indexer_labels)
+            offset = labels[-1].max() + 1 if len(indexer_labels) else offset
+        return np.concatenate(labels)
+
     def __getitem__(self, keep):
         """Extract a concatenated array from the underlying indexers.
 
@@ -92,6 +180,40 @@ class ConcatenatedLazyIndexer(LazyIndexer):
             Concatenated output array
 
         """
+        return self._read_sequential(keep)
+
+    def read(self, keep=slice(None), out=None):
+        """Extract a concatenated array from the underlying indexers into `out`.
+
+        This does the same as :meth:`__getitem__` but optionally fills a
+        caller-supplied output array in place. Each underlying indexer reads
+        its part directly into the corresponding section of the output array,
+        which avoids the copy involved in concatenating separate arrays.
+
+        Parameters
+        ----------
+        keep : tuple of int or slice or sequence of int or sequence of bool, optional
+            Second-stage (global) index as a valid index or slice specification
+            (supports arbitrary slicing or advanced indexing on any dimension)
+        out : array or None, optional
+            Output array with the same size as the extracted data (its shape
+            may only differ from the extracted data in singleton dimensions)
+
+        Returns
+        -------
+        data : array
+            Concatenated output array (`out` itself if provided)
+
+        Raises
+        ------
+        ValueError
+            If `out` does not match the shape of the extracted data
+
+        """
+        return self._read(keep, out)
+
+    def _extract(self, keep, out, stats):
+        """Extract concatenated array into `out`, adding the work done to `stats`."""
         ndim = len(self._initial_shape)
         # Ensure that keep is a tuple (then turn it into a list to simplify further processing)
         keep = list(keep) if isinstance(keep, tuple) else [keep]
@@ -105,38 +227,55 @@ class ConcatenatedLazyIndexer(LazyIndexer):
                        for dim_keep, dim_len in zip(keep[1:], self._initial_shape[1:])]
         indexer_starts = np.cumsum([0] + [len(indexer) for indexer in self.indexers[:-1]])
         find_indexer = lambda index: indexer_starts.searchsorted(index, side='right') - 1
+        # Read straight into caller-supplied output array if no transforms will replace the data afterwards
+        dest = out if not self.transforms else None
+        # Output array of given shape, which is a view of caller-supplied output array if possible
+        def allocate(shape, dtype):
+            if dest is not None:
+                return _out_view(dest, shape)
+            stats.add(bytes_allocated=int(np.prod(shape)) * np.dtype(dtype).itemsize)
+            return np.empty(shape, dtype=dtype)
+        # Reads of underlying indexers, as (indexer index, local first-axis selection, output selection) tuples
+        jobs = []
         # Interpret selection on first dimension, along which data will be concatenated
         if np.isscalar(keep_head):
             # If selection is a scalar, pass directly to appropriate indexer (after removing offset)
             keep_head = len(self) + keep_head if keep_head < 0 else keep_head
             ind = find_indexer(keep_head)
-            out_data = self.indexers[ind][tuple([keep_head - indexer_starts[ind]] + keep_tail)]
+            out_data = self.indexers[ind]._read(tuple([keep_head - indexer_starts[ind]] + keep_tail), dest, stats)
         elif isinstance(keep_head, slice):
             # If selection is a slice, split it into smaller slices that span individual indexers
             # Start by normalising slice to full first-stage range
             start, stop, stride = keep_head.indices(len(self))
-            chunks = []
+            # The output is always at least 1-dimensional, as scalar or singleton dimensions are upgraded
+            out_data = allocate([len(range(start, stop, stride))] + shape_tails, self._initial_dtype)
+            out_start = 0
             # Step through indexers that overlap with slice (it's guaranteed that some will overlap)
             for ind in range(find_indexer(start), find_indexer(stop) + 1):
                 chunk_start = start - indexer_starts[ind] \
                               if start >= indexer_starts[ind] else ((start - indexer_starts[ind]) % stride)
                 chunk_stop = stop - indexer_starts[ind]
-                # The final .reshape is needed to upgrade any scalar or singleton chunks to full dimension
-                chunks.append(self.indexers[ind][tuple([slice(chunk_start, chunk_stop, stride)] +
-                                                       keep_tail)].reshape(tuple([-1] + shape_tails)))
-            out_data = np.concatenate(chunks)
+                chunk_keep = slice(chunk_start, chunk_stop, stride)
+                out_stop = out_start + len(range(*chunk_keep.indices(len(self.indexers[ind]))))
+                # Each indexer fills its own section of the output array
+                jobs.append((ind, chunk_keep, slice(out_start, out_stop)))
+                out_start = out_stop
         else:
             # Anything else is advanced indexing via bool or integer sequences
             keep_head = np.atleast_1d(keep_head)
             # A boolean mask is simpler to handle (no repeated or out-of-order indexing) - partition mask over indexers
             if keep_head.dtype == np.bool and len(keep_head) == len(self):
-                chunks = []
+                out_data = allocate([keep_head.sum()] + shape_tails, self._initial_dtype)
+                out_start = 0
                 for ind in range(len(self.indexers)):
                     chunk_start = indexer_starts[ind]
                     chunk_stop = indexer_starts[ind + 1] if ind < len(indexer_starts) - 1 else len(self)
-                    chunks.append(self.indexers[ind][tuple([keep_head[chunk_start:chunk_stop]] +
-                                                           keep_tail)].reshape(tuple([-1] + shape_tails)))
-                out_data = np.concatenate(chunks)
+                    chunk_keep = keep_head[chunk_start:chunk_stop]
+                    out_stop = out_start + chunk_keep.sum()
+                    # Skip indexers that have no data selected, without touching their files at all
+                    if out_stop > out_start:
+                        jobs.append((ind, chunk_keep, slice(out_start, out_stop)))
+                    out_start = out_stop
             else:
                 # Form sequence of relevant indexer indices and local data indices with indexer offsets removed
                 indexers = find_indexer(keep_head)
@@ -144,14 +283,31 @@ class ConcatenatedLazyIndexer(LazyIndexer):
                 # Determine output data shape after second-stage selection
                 final_shape = [len(np.atleast_1d(np.arange(dim_len)[dim_keep]))
                                for dim_keep, dim_len in zip(keep, self._initial_shape)]
-                out_data = np.empty(final_shape, dtype=self.dtype)
+                out_data = allocate(final_shape, self.dtype)
                 for ind in range(len(self.indexers)):
                     chunk_mask = (indexers == ind)
                     # Insert all selected data originating from same indexer into final array
                     if chunk_mask.any():
-                        out_data[chunk_mask] = self.indexers[ind][tuple([local_indices[chunk_mask]] + keep_tail)]
+                        jobs.append((ind, local_indices[chunk_mask], chunk_mask))
+        # Read the pieces of each indexer straight into their part of the output array, concurrently if allowed
+        def fill(job):
+            ind, chunk_keep, out_select = job
+            if isinstance(out_select, slice):
+                self.indexers[ind]._read(tuple([chunk_keep] + keep_tail), out_data[out_select], stats)
+            else:
+                out_data[out_select] = self.indexers[ind]._read(tuple([chunk_keep] + keep_tail), None, stats)
+        _fan_out(fill, jobs, self.workers if self.workers is not None else get_io_workers(),
+                 key=lambda job: _indexer_file(self.indexers[job[0]]))
+        if dest is not None:
+            return dest
         # Apply transform chain to output data, if any
-        return reduce(lambda data, transform: transform(data, original_keep), self.transforms, out_data)
+        start = time.time()
+        out_data = reduce(lambda data, transform: transform(data, original_keep), self.transforms, out_data)
+        stats.add(transform_time=time.time() - start)
+        if out is None:
+            return out_data
+        _out_view(out, np.shape(out_data))[...] = out_data
+        return out
 
     @property
     def _initial_shape(self):
@@ -222,6 +378,79 @@ class ConcatenatedSensorData(SensorData):
         return np.sum([len(sd) for sd in self.data])
 
 
+def _any_selected(keep):
+    """True unless time selection `keep` is a boolean mask that selects nothing."""
+    keep = np.asarray(keep)
+    return keep.dtype != np.bool or keep.any()
+
+
+class _PaddedSensorIndex(object):
+    """Sensor index of one of several concatenated caches that pads out missing sensors.
+
+    This looks up actual sensors in the original index of the cache, and
+    replaces sensors that only occur in the other caches with dummy data of
+    the appropriate type. Only the sensors that were in the caches at the
+    time of concatenation count as actual sensors, as virtual sensors are
+    also stored in a cache once they are calculated.
+
+    Parameters
+    ----------
+    caches : sequence of :class:`SensorCache` objects
+        Sequence of underlying caches to be concatenated
+    indices : sequence of :class:`H5SensorIndex` objects or None
+        Original sensor index of each cache (or None if cache has no index)
+    n : int
+        Index of the cache that owns this index in `caches`
+    actual : sequence of dicts, optional
+        Actual sensors in each cache at the time of concatenation (defaults to
+        the current contents of `caches`)
+
+    """
+    def __init__(self, caches, indices, n, actual=None):
+        self.caches = caches
+        self.indices = indices
+        self.n = n
+        self.actual = actual if actual is not None else [dict(dict.items(cache)) for cache in caches]
+
+    def _raw(self, m, name):
+        """Actual sensor of cache `m` in its cache or original index (or None if sensor is not there)."""
+        data = self.actual[m].get(name)
+        if data is None and self.indices[m] is not None:
+            data = self.indices[m].get(name)
+        return data
+
+    def get(self, name):
+        """Raw sensor data of sensor with given name, or None if sensor is in none of the caches."""
+        data = self._raw(self.n, name)
+        if data is not None:
+            return data
+        for m in range(len(self.caches)):
+            other = self._raw(m, name) if m != self.n else None
+            if other is not None:
+                return dummy_sensor_data(name, dtype=other.dtype)
+        return None
+
+    def sensors(self):
+        """Raw sensor data of all sensors in any of the caches, as a dict keyed by sensor name."""
+        own = self.indices[self.n].sensors() if self.indices[self.n] is not None else {}
+        sensors = {}
+        for m in range(len(self.caches)):
+            if m == self.n:
+                continue
+            # Avoid the keys of the other cache itself, as this would in turn compile the list of this cache
+            others = dict(self.indices[m].sensors()) if self.indices[m] is not None else {}
+            others.update(self.actual[m])
+            for name, data in others.iteritems():
+                if name not in own and name not in sensors and not dict.__contains__(self.caches[self.n], name):
+                    sensors[name] = dummy_sensor_data(name, dtype=data.dtype)
+        sensors.update(own)
+        return sensors
+
+    def __nonzero__(self):
+        """True if any of the caches has actual sensors (without compiling the full list of sensors)."""
+        return any(self.actual) or any(index for index in self.indices if index is not None)
+
+
 def _calc_dummy(cache, name):
     """Dummy virtual sensor that returns NaNs."""
     cache[name] = sensor_data = np.nan * np.ones(len(cache.timestamps))
@@ -250,16 +479,16 @@ class ConcatenatedSensorCache(SensorCache):
     """
     def __init__(self, caches, keep=None):
         self.caches = caches
-        # Collect the names and types of all actual and virtual sensors in caches, as well as properties
-        actual, virtual, self.props = {}, {}, {}
+        # Collect the names of all virtual sensors in caches, as well as properties
+        virtual, self.props = {}, {}
         for cache in caches:
-            actual.update(zip(cache.keys(), [sd.dtype for sd in cache.itervalues()]))
             virtual.update(cache.virtual)
             self.props.update(cache.props)
-        # Pad out actual sensors on each cache (replace with default sensor values where missing)
-        for name, dtype in actual.iteritems():
-            if name not in cache:
-                cache[name] = dummy_sensor_data(name, dtype=dtype)
+        # Pad out actual sensors on each cache as they are looked up (replace with default values where missing)
+        indices = [cache.index for cache in caches]
+        actual = [dict(dict.items(cache)) for cache in caches]
+        for n, cache in enumerate(caches):
+            cache.index = _PaddedSensorIndex(caches, indices, n, actual)
         # Pad out virtual sensors with default functions (nans)
         for name in virtual:
             if name not in cache.virtual:
@@ -288,6 +517,41 @@ class ConcatenatedSensorCache(SensorCache):
             for n, cache in enumerate(self.caches):
                 cache._set_keep(keep[self._segments[n]:self._segments[n + 1]])
 
+    @property
+    def interp_selected(self):
+        """True if numerical sensors are only interpolated onto selected timestamps (see :class:`SensorCache`)."""
+        return all(cache.interp_selected for cache in self.caches)
+
+    @interp_selected.setter
+    def interp_selected(self, interp_selected):
+        for cache in self.caches:
+            cache.interp_selected = interp_selected
+
+    @property
+    def max_bytes(self):
+        """Memory budget of sensor data, shared evenly by underlying caches (see :class:`SensorCache`)."""
+        budgets = [cache.max_bytes for cache in self.caches]
+        return None if None in budgets else sum(budgets)
+
+    @max_bytes.setter
+    def max_bytes(self, max_bytes):
+        for cache in self.caches:
+            cache.max_bytes = None if max_bytes is None else max_bytes // len(self.caches)
+
+    @property
+    def nbytes(self):
+        """Number of bytes of memory occupied by sensor data in underlying caches."""
+        return sum(cache.nbytes for cache in self.caches)
+
+    @property
+    def evictable_nbytes(self):
+        """Number of bytes of memory occupied by sensor data in underlying caches that counts towards budget."""
+        return sum(cache.evictable_nbytes for cache in self.caches)
+
+    def __contains__(self, name):
+        """True if actual sensor is in any of the underlying caches."""
+        return np.any([name in cache for cache in self.caches])
+
     def get(self, name, select=False, extract=True, **kwargs):
         """Sensor values interpolated to correlator data timestamps.
 
@@ -321,11 +585,15 @@ class ConcatenatedSensorCache(SensorCache):
             If sensor name was not found in cache and did not match virtual template
 
         """
+        caches = self.caches
+        # Selected data only comes from caches with selected timestamps (but keep one to get the correct data type)
+        if select and extract:
+            caches = [cache for cache in self.caches if _any_selected(cache.keep)] or self.caches[:1]
         # Get array, categorical data or raw sensor data from each cache
-        split_data = [cache.get(name, select, extract, **kwargs) for cache in self.caches]
+        split_data = [cache.get(name, select, extract, **kwargs) for cache in caches]
         # If this sensor has already been partially extracted, we are forced to extract it in rest of caches too
         if not extract and not np.all([isinstance(data, SensorData) for data in split_data]):
-            split_data = [cache.get(name, select, True, **kwargs) for cache in self.caches]
+            split_data = [cache.get(name, select, True, **kwargs) for cache in caches]
         if isinstance(split_data[0], SensorData):
             return ConcatenatedSensorData(split_data)
         elif isinstance(split_data[0], CategoricalData):
@@ -341,6 +609,46 @@ class ConcatenatedSensorCache(SensorCache):
         else:
             return np.concatenate(split_data)
 
+    def get_many(self, names, select=False, extract=True, workers=None, as_array=False, **kwargs):
+        """Sensor values of many sensors interpolated to correlator data timestamps.
+
+        The sensors are first extracted in bulk from each underlying cache
+        (see :meth:`SensorCache.get_many`) and then concatenated.
+
+        Parameters
+        ----------
+        names : sequence of strings
+            Sensor names
+        select : {False, True}, optional
+            True if preset time selection will be applied to returned data
+        extract : {True, False}, optional
+            True if sensor data should be extracted from HDF5 file and cached
+        workers : int or None, optional
+            Number of threads that read raw sensor data of each cache in parallel
+        as_array : {False, True}, optional
+            True to return a record array with one field per sensor instead of
+            a dict
+        kwargs : dict, optional
+            Additional parameters are passed to underlying sensor caches
+
+        Returns
+        -------
+        data : dict mapping string to sensor data, or :class:`numpy.recarray`
+            Sensor data of each sensor, as returned by :meth:`get` (or as a
+            record array of values, one per (selected) timestamp)
+
+        """
+        names = list(names)
+        if extract:
+            # Selected data only comes from caches with selected timestamps (but keep one to get the correct data type)
+            caches = self.caches
+            if select:
+                caches = [cache for cache in self.caches if _any_selected(cache.keep)] or self.caches[:1]
+            for cache in caches:
+                cache.get_many([name for name in names if name in cache], workers=workers, **kwargs)
+        sensors = dict([(name, self.get(name, select, extract, **kwargs)) for name in names])
+        return _sensor_records(names, sensors) if as_array else sensors
+
     def __setitem__(self, name, data):
         """Assign data to sensor, splitting it across underlying caches.
 
@@ -361,10 +669,27 @@ class ConcatenatedSensorCache(SensorCache):
             for n, cache in enumerate(self.caches):
                 cache[name] = data[self._segments[n]:self._segments[n + 1]]
 
+    def _known_keys(self):
+        """Names of actual sensors already in any of the underlying caches, without consulting their indices."""
+        return unique_in_order(reduce(lambda x, y: x + y, [cache._known_keys() for cache in self.caches]))
+
+    def _index_pending(self):
+        """True if the index of any of the underlying caches may still contain sensors not in cache yet."""
+        return any(cache._index_pending() for cache in self.caches)
+
+    def __nonzero__(self):
+        """True if any of the underlying caches has actual sensors."""
+        return any(self.caches)
+
     def iterkeys(self):
-        """Key iterator that iterates through sensor names."""
-        # Run through first cache's keys, as they should all be identical
-        return self.caches[0].iterkeys()
+        """Key iterator that iterates through sensor names.
+
+        This compiles the full list of sensors in each underlying cache (see
+        :meth:`SensorCache.iterkeys`), which visits every sensor in every file.
+
+        """
+        # Run through the keys of all caches, as the padding of missing sensors is done on demand
+        return iter(unique_in_order(reduce(lambda x, y: x + y, [cache.keys() for cache in self.caches])))
 
 #--------------------------------------------------------------------------------------------------
 #--- CLASS :  ConcatenatedDataSet
@@ -391,6 +716,9 @@ class ConcatenatedDataSet(DataSet):
         decorated_datasets = [(d.start_time, d) for d in datasets]
         decorated_datasets.sort()
         self.datasets = datasets = [d[-1] for d in decorated_datasets]
+        # Aggregate I/O statistics of the underlying data sets
+        for d in datasets:
+            d.io_stats.parent = self.io_stats
 
         # Merge high-level metadata
         names = unique_in_order([d.name for d in datasets])
@@ -470,6 +798,8 @@ class ConcatenatedDataSet(DataSet):
             Boolean selection mask with one entry per correlation product
 
         """
+        # Indexers of the old selection are stale
+        self._indexers.clear()
         if time_keep is not None:
             self._time_keep = time_keep
             for n, d in enumerate(self.datasets):
@@ -486,6 +816,18 @@ class ConcatenatedDataSet(DataSet):
             for n, d in enumerate(self.datasets):
                 d._set_keep(corrprod_keep=self._corrprod_keep)
 
+    @property
+    def chunk_cache(self):
+        """Cache of decoded HDF5 chunks shared by all underlying data sets."""
+        return self._chunk_cache
+
+    @chunk_cache.setter
+    def chunk_cache(self, cache):
+        self._chunk_cache = cache
+        # This is called by DataSet.__init__ before the underlying data sets are known
+        for d in getattr(self, 'datasets', []):
+            d.chunk_cache = cache
+
     @property
     def timestamps(self):
         """Visibility timestamps in UTC seconds since Unix epoch.
@@ -513,7 +855,7 @@ class ConcatenatedDataSet(DataSet):
         selection on it.
 
         """
-        return ConcatenatedLazyIndexer([d.vis for d in self.datasets])
+        return self._cached_indexer(('vis',), lambda: ConcatenatedLazyIndexer([d.vis for d in self.datasets]))
 
     def weights(self, names=None):
         """Visibility weights as a function of time, frequency and baseline.
@@ -534,7 +876,8 @@ class ConcatenatedDataSet(DataSet):
             Only then will data be loaded into memory.
 
         """
-        return ConcatenatedLazyIndexer([d.weights(names) for d in self.datasets])
+        key = ('weights', names if isinstance(names, basestring) or names is None else tuple(names))
+        return self._cached_indexer(key, lambda: ConcatenatedLazyIndexer([d.weights(names) for d in self.datasets]))
 
     def flags(self, names=None):
         """Visibility flags as a function of time, frequency and baseline.
@@ -555,4 +898,5 @@ class ConcatenatedDataSet(DataSet):
             Only then will data be loaded into memory.
 
         """
-        return ConcatenatedLazyIndexer([d.flags(names) for d in self.datasets])
+        key = ('flags', names if isinstance(names, basestring) or names is None else tuple(names))
+        return self._cached_indexer(key, lambda: ConcatenatedLazyIndexer([d.flags(names) for d in self.datasets]))
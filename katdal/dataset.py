@@ -2,14 +2,20 @@
 
 import time
 import logging
+from collections import OrderedDict
 
 import numpy as np
 
 import katpoint
 from katpoint import is_iterable
 
+from .lazy_indexer import LazyIndexer, LazyTransform, IOStats, iter_blocks
+
 logger = logging.getLogger(__name__)
 
+# Maximum number of indexers of the current selection that a data set hands out again on repeated access
+MAX_CACHED_INDEXERS = 8
+
 #--------------------------------------------------------------------------------------------------
 #--- CLASS :  Helper classes
 #--------------------------------------------------------------------------------------------------
@@ -158,6 +164,17 @@ def _robust_target(description):
         return katpoint.Target('Nothing, special')
 
 
+def _force_3dim(data, keep):
+    """Keep singleton dimensions in stage 2 (i.e. final) indexing of vis-like data."""
+    # Ensure that keep tuple has length of 3 (truncate or pad with blanket slices as necessary)
+    keep = keep[:3] + (slice(None),) * (3 - len(keep))
+    # Final indexing ensures that returned data are always 3-dimensional (i.e. keep singleton dimensions)
+    keep_singles = [(np.newaxis if np.isscalar(dim_keep) else slice(None)) for dim_keep in keep]
+    return data[tuple(keep_singles)]
+
+# Transform shared by all vis-like indexers that keeps their output 3-dimensional
+force_3dim = LazyTransform('force_3dim', _force_3dim, view=True)
+
 DEFAULT_SENSOR_PROPS = {
     '*nd_coupler': {'categorical': True, 'greedy_values': (True,), 'initial_value': '0',
                     'transform': lambda x: x not in ('0', 'False', 0)},
@@ -337,6 +354,12 @@ class DataSet(object):
         Shape of selected visibility data array, as (*T*, *F*, *B*)
     size : int
         Size of selected visibility data array, in bytes
+    chunk_cache : :class:`ChunkCache` object or None
+        Cache of decoded HDF5 chunks shared by the visibility, weight and flag
+        indexers of the data set (None disables caching)
+    io_stats : :class:`IOStats` object
+        I/O statistics aggregated over the visibility, weight and flag indexers
+        of the data set (see :meth:`IOStats.as_dict` for a summary)
 
     """
     def __init__(self, name, ref_ant='', time_offset=0.0):
@@ -375,8 +398,11 @@ class DataSet(object):
         self.target_coordsys = 'azel'
         self.shape = (0, 0, 0)
         self.size = 0
+        self.chunk_cache = None
+        self.io_stats = IOStats()
 
         self._selection = {}
+        self._indexers = OrderedDict()
         self._time_keep = []
         self._freq_keep = []
         self._corrprod_keep = []
@@ -507,6 +533,8 @@ class DataSet(object):
             Boolean selection mask with one entry per correlation product
 
         """
+        # Indexers of the old selection are stale
+        self._indexers.clear()
         if time_keep is not None:
             self._time_keep = time_keep
             # Ensure that sensor cache gets updated time selection
@@ -851,6 +879,122 @@ class DataSet(object):
         # Restore original selection more thoroughly
         self.select(**preselection)
 
+    def _cached_indexer(self, key, make_indexer):
+        """Indexer of current selection handed out before, or a new one.
+
+        Repeated accesses of the same data (e.g. `d.vis[i:j]` in a loop) get
+        the same indexer object for as long as the selection stays the same,
+        so that the indexer sees the access pattern and can read ahead. The
+        indexers are forgotten whenever the selection or chunk cache changes.
+
+        Parameters
+        ----------
+        key : tuple
+            Key that identifies the data and its transforms (e.g. flag names)
+        make_indexer : function, signature ``indexer = f()``
+            Function that creates the indexer if it is not cached
+
+        Returns
+        -------
+        indexer : :class:`LazyIndexer` object
+            Cached or new indexer
+
+        """
+        chunk_cache, indexer = self._indexers.pop(key, (None, None))
+        if indexer is None or chunk_cache is not self.chunk_cache:
+            chunk_cache, indexer = self.chunk_cache, make_indexer()
+        # Mark indexer as the most recently used one and forget the least recently used ones
+        self._indexers[key] = (chunk_cache, indexer)
+        while len(self._indexers) > MAX_CACHED_INDEXERS:
+            self._indexers.popitem(last=False)
+        return indexer
+
+    def _vislike_indexer(self, dataset, extractor, squeeze=False, key=None):
+        """Lazy indexer for vis-like datasets (vis / weights / flags).
+
+        This operates on datasets with shape (*T*, *F*, *B*, ...) and
+        potentially different dtypes. The data type conversions are all left to
+        the provided extractor transform, while this method takes care of the
+        common selection issues, such as preserving singleton dimensions and
+        dealing with duplicate final dumps.
+
+        Parameters
+        ----------
+        dataset : :class:`h5py.Dataset` object or equivalent
+            Underlying vis-like dataset on which lazy indexing will be done
+        extractor : :class:`LazyTransform` object
+            Transform to apply to data (`keep` is user-provided 2nd-stage index)
+        squeeze : {False, True}, optional
+            True if singleton dimensions may be dropped instead of preserved
+        key : tuple or None, optional
+            Key that identifies extractor, e.g. including the names of weights
+            (default is the extractor name)
+
+        Returns
+        -------
+        indexer : :class:`LazyIndexer` object
+            Lazy indexer with appropriate selectors and transforms included
+            (the same object on repeated access, see :meth:`_cached_indexer`)
+
+        """
+        def make_indexer():
+            # Create first-stage index from dataset selectors
+            time_keep = self._time_keep
+            # If there is a duplicate final dump, these lengths don't match -> ignore last dump in file
+            if len(time_keep) == len(dataset) - 1:
+                time_keep = np.zeros(len(dataset), dtype=np.bool)
+                time_keep[:len(self._time_keep)] = self._time_keep
+            stage1 = (time_keep, self._freq_keep, self._corrprod_keep)
+            transforms = [extractor] if squeeze else [extractor, force_3dim]
+            return LazyIndexer(dataset, stage1, transforms, cache=self.chunk_cache, stats=self.io_stats)
+        key = (extractor.name,) if key is None else key
+        return self._cached_indexer((dataset.name, squeeze) + key, make_indexer)
+
+    def iter_blocks(self, axis=0, block_size=None, max_bytes=None, weight_names=None, flag_names=None,
+                    prefetch=1):
+        """Generator that iterates through visibilities, weights and flags in blocks.
+
+        This streams through the selected visibility data along the given axis
+        (time by default), extracting matching blocks of visibilities, weights
+        and flags together. Only one block of each is in memory at a time,
+        which makes it possible to process data sets that are too large to load
+        in one go. The block boundaries are aligned with the chunks of the
+        underlying HDF5 datasets where possible.
+
+        Parameters
+        ----------
+        axis : int, optional
+            Axis along which to step through data (0 = time, 1 = frequency,
+            2 = correlation product)
+        block_size : int or None, optional
+            Maximum number of dumps / channels / corrprods in each block
+        max_bytes : int or None, optional
+            Maximum combined size of the vis, weights and flags blocks in bytes
+            (if neither this nor `block_size` is given, each block is one chunk)
+        weight_names : None or string or sequence of strings, optional
+            Names of weights to be multiplied together (see :meth:`weights`)
+        flag_names : None or string or sequence of strings, optional
+            Names of flags to be OR'ed together (see :meth:`flags`)
+        prefetch : int, optional
+            Number of blocks read ahead on a background thread while the
+            caller processes the current block (0 disables this)
+
+        Yields
+        ------
+        index_range : slice object
+            Range of selected indices along `axis` spanned by block
+        vis : array of complex64, shape (*T'*, *F'*, *B'*)
+            Block of visibility data
+        weights : array of float32, shape (*T'*, *F'*, *B'*)
+            Corresponding block of weights
+        flags : array of bool, shape (*T'*, *F'*, *B'*)
+            Corresponding block of flags
+
+        """
+        indexers = [self.vis, self.weights(weight_names), self.flags(flag_names)]
+        for index_range, (vis, weights, flags) in iter_blocks(indexers, axis, block_size, max_bytes, prefetch):
+            yield index_range, vis, weights, flags
+
     #- - - - - - - - - - - - - - - Format-specific properties - - - - - - - - - - - - - - - - - -
 
     @property
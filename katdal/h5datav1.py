@@ -13,6 +13,7 @@ from .sensordata import SensorData, SensorCache
 from .categorical import CategoricalData
 from .lazy_indexer import LazyIndexer, LazyTransform
 from .concatdata import ConcatenatedLazyIndexer
+from .h5files import open_file
 
 logger = logging.getLogger(__name__)
 
@@ -51,8 +52,8 @@ class H5DataV1(DataSet):
 
     Parameters
     ----------
-    filename : string
-        Name of HDF5 file
+    filename : string or :class:`h5py.File` object
+        Name of HDF5 file (or file already opened in appropriate mode)
     ref_ant : string, optional
         Name of reference antenna, used to partition data set into scans
         (default is first antenna in use)
@@ -60,6 +61,9 @@ class H5DataV1(DataSet):
         Offset to add to all correlator timestamps, in seconds
     mode : string, optional
         HDF5 file opening mode (e.g. 'r+' to open file in write mode)
+    h5_options : dict or None, optional
+        HDF5 tuning options such as chunk cache settings, file driver and page
+        buffer size (see :func:`h5files.open_file`)
     kwargs : dict, optional
         Extra keyword arguments, typically meant for other formats and ignored
 
@@ -69,11 +73,13 @@ class H5DataV1(DataSet):
         Underlying HDF5 file, exposed via :mod:`h5py` interface
 
     """
-    def __init__(self, filename, ref_ant='', time_offset=0.0, mode='r', **kwargs):
+    def __init__(self, filename, ref_ant='', time_offset=0.0, mode='r', h5_options=None, **kwargs):
+        # Accept an open HDF5 file (as handed over by format detection) in place of a filename
+        filename, h5file = getattr(filename, 'filename', filename), filename
         DataSet.__init__(self, filename, ref_ant, time_offset)
 
         # Load file
-        self.file, self.version = H5DataV1._open(filename, mode)
+        self.file, self.version = H5DataV1._open(h5file, mode, h5_options)
         f = self.file
 
         # Load main HDF5 groups
@@ -216,9 +222,9 @@ class H5DataV1(DataSet):
         self.select(spw=0, subarray=0)
 
     @staticmethod
-    def _open(filename, mode='r'):
-        """Open file and do basic version and augmentation sanity check."""
-        f = h5py.File(filename, mode)
+    def _open(filename, mode='r', h5_options=None):
+        """Open file (unless already open) and do basic version and augmentation sanity check."""
+        f = filename if isinstance(filename, h5py.File) else open_file(filename, mode, h5_options)
         version = f.attrs.get('version', '1.x')
         if not version.startswith('1.'):
             raise WrongVersion("Attempting to load version '%s' file with version 1 loader" % (version,))
@@ -235,8 +241,8 @@ class H5DataV1(DataSet):
 
         Parameters
         ----------
-        filename : string
-            Data file name
+        filename : string or :class:`h5py.File` object
+            Data file name (or open file)
 
         Returns
         -------
@@ -244,10 +250,12 @@ class H5DataV1(DataSet):
 
         """
         f, version = H5DataV1._open(filename)
-        ants_group = f['Antennas']
-        antennas = [katpoint.Antenna(ants_group[group].attrs['description']) 
-                    for group in ants_group]
-        return antennas
+        # Close the file when done, as nobody else holds on to it
+        with f:
+            ants_group = f['Antennas']
+            antennas = [katpoint.Antenna(ants_group[group].attrs['description']) 
+                        for group in ants_group]
+            return antennas
 
     @staticmethod
     def _get_targets(filename):
@@ -257,8 +265,8 @@ class H5DataV1(DataSet):
 
         Parameters
         ----------
-        filename : string
-            Data file name
+        filename : string or :class:`h5py.File` object
+            Data file name (or open file)
 
         Returns
         -------
@@ -267,10 +275,12 @@ class H5DataV1(DataSet):
 
         """
         f, version = H5DataV1._open(filename)
-        compound_scans = f['Scans']
-        all_target_strings = [compound_scans[group].attrs['target']
-                              for group in compound_scans]
-        return katpoint.Catalogue(np.unique(all_target_strings))
+        # Close the file when done, as nobody else holds on to it
+        with f:
+            compound_scans = f['Scans']
+            all_target_strings = [compound_scans[group].attrs['target']
+                                  for group in compound_scans]
+            return katpoint.Catalogue(np.unique(all_target_strings))
 
     @property
     def timestamps(self):
@@ -320,7 +330,8 @@ class H5DataV1(DataSet):
         for n, s in enumerate(self._scan_groups):
             indexers.append(LazyIndexer(s['data'], keep=(self._time_keep[self._segments[n]:self._segments[n + 1]],
                                                          self._freq_keep),
-                                        transforms=[extract_vis]))
+                                        transforms=[extract_vis], cache=self.chunk_cache,
+                                        stats=self.io_stats))
         return indexers
 
     @property
@@ -339,7 +350,7 @@ class H5DataV1(DataSet):
         form of indexing on it. Only then will data be loaded into memory.
 
         """
-        return ConcatenatedLazyIndexer(self._vis_indexers())
+        return self._cached_indexer(('vis',), lambda: ConcatenatedLazyIndexer(self._vis_indexers()))
 
     def weights(self, names=None):
         """Visibility weights as a function of time, frequency and baseline.
@@ -363,7 +374,8 @@ class H5DataV1(DataSet):
         # tell the user that there are no weights in the h5 file
         logger.warning("No weights in v1 h5 data files, returning array of unity weights")
         ones = LazyTransform('ones', lambda data, keep: np.ones_like(data, dtype=np.float32), dtype=np.float32)
-        return ConcatenatedLazyIndexer(self._vis_indexers(), transforms=[ones])
+        return self._cached_indexer(('weights',),
+                                    lambda: ConcatenatedLazyIndexer(self._vis_indexers(), transforms=[ones]))
 
     def flags(self, names=None):
         """Visibility flags as a function of time, frequency and baseline.
@@ -386,4 +398,5 @@ class H5DataV1(DataSet):
         # tell the user that there are no flags in the h5 file
         logger.warning("No flags in v1 h5 data files, returning array of zero flags")
         falses = LazyTransform('falses', lambda data, keep: np.zeros_like(data, dtype=np.bool), dtype=np.bool)
-        return ConcatenatedLazyIndexer(self._vis_indexers(), transforms=[falses])
+        return self._cached_indexer(('flags',),
+                                    lambda: ConcatenatedLazyIndexer(self._vis_indexers(), transforms=[falses]))
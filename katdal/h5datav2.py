@@ -8,9 +8,11 @@ import katpoint
 
 from .dataset import DataSet, WrongVersion, BrokenFile, Subarray, SpectralWindow, \
                      DEFAULT_SENSOR_PROPS, DEFAULT_VIRTUAL_SENSORS, _robust_target
-from .sensordata import SensorData, SensorCache
+from .sensordata import SensorData, SensorCache, H5SensorIndex
 from .categorical import CategoricalData, sensor_to_categorical
 from .lazy_indexer import LazyIndexer, LazyTransform
+from .sidecar import load_sidecar, save_sidecar, timestamps_digest
+from .h5files import open_file, open_tuned_dataset
 
 logger = logging.getLogger(__name__)
 
@@ -121,8 +123,8 @@ class H5DataV2(DataSet):
 
     Parameters
     ----------
-    filename : string
-        Name of HDF5 file
+    filename : string or :class:`h5py.File` object
+        Name of HDF5 file (or file already opened in appropriate mode)
     ref_ant : string, optional
         Name of reference antenna, used to partition data set into scans
         (default is first antenna in use)
@@ -134,20 +136,39 @@ class H5DataV2(DataSet):
         True if synthesised timestamps should be used to partition data set even
         if real timestamps are irregular, thereby avoiding the slow loading of
         real timestamps at the cost of slightly inaccurate label borders
+    file_pool : :class:`FilePool` object or None, optional
+        Pool that may close the file when too many files are open and reopen
+        it when its data is accessed again (only used in read-only mode)
+    sidecar : {False, True}, optional
+        Store the scans, compound scans and targets derived from sensors in a
+        sidecar index file next to the data file, and reuse them on subsequent
+        opens for as long as the data file is unchanged (see :mod:`sidecar`)
+    h5_options : dict or None, optional
+        HDF5 tuning options such as chunk cache settings, file driver and page
+        buffer size (see :func:`h5files.open_file`). By default the chunk cache
+        of vis, flags and weights is sized to suit their chunks (see
+        :func:`h5files.chunk_cache_settings`)
+    sensor_store : :class:`SensorStore` object or None, optional
+        Persistent store of extracted sensor data shared by many data files,
+        which avoids extracting the same sensors again on subsequent opens
+        for as long as the data file is unchanged (see :mod:`sidecar`)
     kwargs : dict, optional
         Extra keyword arguments, typically meant for other formats and ignored
 
     Attributes
     ----------
-    file : :class:`h5py.File` object
+    file : :class:`h5py.File` or :class:`PooledFile` object
         Underlying HDF5 file, exposed via :mod:`h5py` interface
 
     """
-    def __init__(self, filename, ref_ant='', time_offset=0.0, mode='r', quicklook=False, **kwargs):
+    def __init__(self, filename, ref_ant='', time_offset=0.0, mode='r', quicklook=False, file_pool=None,
+                 sidecar=False, h5_options=None, sensor_store=None, **kwargs):
+        # Accept an open HDF5 file (as handed over by format detection) in place of a filename
+        filename, h5file = getattr(filename, 'filename', filename), filename
         DataSet.__init__(self, filename, ref_ant, time_offset)
 
         # Load file
-        self.file, self.version = H5DataV2._open(filename, mode)
+        self.file, self.version = H5DataV2._open(h5file, mode, h5_options)
         f = self.file
 
         # Load main HDF5 groups
@@ -166,7 +187,7 @@ class H5DataV2(DataSet):
 
         self.dump_period = get_single_value(config_group['Correlator'], 'int_time')
         # Obtain visibility data and timestamps
-        self._vis = data_group['correlator_data']
+        self._vis = open_tuned_dataset(data_group, 'correlator_data', h5_options)
         self._timestamps = data_group['timestamps']
         num_dumps = len(self._timestamps)
         if num_dumps != self._vis.shape[0]:
@@ -205,7 +226,7 @@ class H5DataV2(DataSet):
         # ------ Extract flags ------
 
         # Check if flag group is present, else use dummy flag data
-        self._flags = markup_group['flags'] if 'flags' in markup_group else \
+        self._flags = open_tuned_dataset(markup_group, 'flags', h5_options) if 'flags' in markup_group else \
                       dummy_dataset('dummy_flags', shape=self._vis.shape[:-1], dtype=np.uint8, value=0)
         # Obtain flag descriptions from file or recreate default flag description table
         self._flags_description = markup_group['flags_description'] if 'flags_description' in markup_group else \
@@ -214,24 +235,27 @@ class H5DataV2(DataSet):
         # ------ Extract weights ------
 
         # check if weight group present, else use dummy weight data
-        self._weights = markup_group['weights'] if 'weights' in markup_group else \
+        self._weights = open_tuned_dataset(markup_group, 'weights', h5_options) if 'weights' in markup_group else \
                         dummy_dataset('dummy_weights', shape=self._vis.shape[:-1] + (1,), dtype=np.float32, value=1.0)
         self._weights_description = np.array(zip(WEIGHT_NAMES, WEIGHT_DESCRIPTIONS))
 
         # ------ Extract sensors ------
 
-        # Populate sensor cache with all HDF5 datasets below sensor group that fit the description of a sensor
-        cache = {}
-        def register_sensor(name, obj):
-            """A sensor is defined as a non-empty dataset with expected dtype."""
-            if isinstance(obj, h5py.Dataset) and obj.shape != () and obj.dtype.names == ('timestamp', 'value', 'status'):
-                # Rename pedestal sensors from the old regime to become sensors of the corresponding antenna
-                name = ('Antennas/ant' + name[13:]) if name.startswith('Pedestals/ped') else name
-                cache[name] = SensorData(obj, name)
-        sensors_group.visititems(register_sensor)
+        # Index all HDF5 datasets below sensor group that fit the description of a sensor by sensor name,
+        # which only looks up the datasets of sensors that are actually used
+        def sensor_paths(name):
+            """Candidate paths of sensor dataset within sensor group."""
+            # Pedestal sensors from the old regime are renamed to become sensors of the corresponding antenna
+            return [name] + (['Pedestals/ped' + name[12:]] if name.startswith('Antennas/ant') else [])
+        def sensor_name(path):
+            """Sensor name corresponding to path of sensor dataset within sensor group."""
+            return ('Antennas/ant' + path[13:]) if path.startswith('Pedestals/ped') else path
+        sensor_index = H5SensorIndex(f, sensors_group.name, sensor_paths, sensor_name)
         # Use estimated data timestamps for now, to speed up data segmentation
-        self.sensor = SensorCache(cache, data_timestamps, self.dump_period, keep=self._time_keep,
-                                  props=SENSOR_PROPS, virtual=VIRTUAL_SENSORS, aliases=SENSOR_ALIASES)
+        self.sensor = SensorCache({}, data_timestamps, self.dump_period, keep=self._time_keep,
+                                  props=SENSOR_PROPS, virtual=VIRTUAL_SENSORS, aliases=SENSOR_ALIASES,
+                                  index=sensor_index,
+                                  store=sensor_store.bind(filename) if sensor_store is not None else None)
 
         # ------ Extract subarrays ------
 
@@ -289,39 +313,50 @@ class H5DataV2(DataSet):
 
         # ------ Extract scans / compound scans / targets ------
 
-        # Use the activity sensor of reference antenna to partition the data set into scans (and to set their states)
-        scan = self.sensor.get('Antennas/%s/activity' % (self.ref_ant,))
-        # If the antenna starts slewing on the second dump, incorporate the first dump into the slew too.
-        # This scenario typically occurs when the first target is only set after the first dump is received.
-        # The workaround avoids putting the first dump in a scan by itself, typically with an irrelevant target.
-        if len(scan) > 1 and scan.events[1] == 1 and scan[1] == 'slew':
-            scan.events, scan.indices = scan.events[1:], scan.indices[1:]
-            scan.events[0] = 0
-        # Use labels to partition the data set into compound scans
-        label = sensor_to_categorical(markup_group['labels']['timestamp'], markup_group['labels']['label'],
-                                      data_timestamps, self.dump_period, **SENSOR_PROPS['Observation/label'])
-        # Discard empty labels (typically found in raster scans, where first scan has proper label and rest are empty)
-        # However, if all labels are empty, keep them, otherwise whole data set will be one pathological compscan...
-        if len(label.unique_values) > 1:
-            label.remove('')
-        # Create duplicate scan events where labels are set during a scan (i.e. not at start of scan)
-        # ASSUMPTION: Number of scans >= number of labels (i.e. each label should introduce a new scan)
-        scan.add_unmatched(label.events)
+        # Reuse scans, compound scans and targets of an earlier open if a fresh sidecar index is available
+        # The structure is aligned to the data timestamps, so these (and whatever went into them) are part of the key
+        sidecar_params = {'ref_ant': self.ref_ant, 'time_offset': self.time_offset, 'quicklook': quicklook,
+                          'dump_period': float(self.dump_period), 'timestamps': timestamps_digest(data_timestamps)}
+        observation = load_sidecar(filename, sidecar_params) if sidecar else None
+        if observation is not None:
+            scan, label, target = observation['scan'], observation['label'], observation['target']
+        else:
+            # Use the activity sensor of reference antenna to partition the data set into scans (and set their states)
+            scan = self.sensor.get('Antennas/%s/activity' % (self.ref_ant,))
+            # If the antenna starts slewing on the second dump, incorporate the first dump into the slew too.
+            # This scenario typically occurs when the first target is only set after the first dump is received.
+            # The workaround avoids putting the first dump in a scan by itself, typically with an irrelevant target.
+            if len(scan) > 1 and scan.events[1] == 1 and scan[1] == 'slew':
+                scan.events, scan.indices = scan.events[1:], scan.indices[1:]
+                scan.events[0] = 0
+            # Use labels to partition the data set into compound scans
+            label = sensor_to_categorical(markup_group['labels']['timestamp'], markup_group['labels']['label'],
+                                          data_timestamps, self.dump_period, **SENSOR_PROPS['Observation/label'])
+            # Discard empty labels (typically found in raster scans, where first scan has proper label and rest are
+            # empty). However, if all labels are empty, keep them, otherwise whole data set will be one pathological
+            # compscan...
+            if len(label.unique_values) > 1:
+                label.remove('')
+            # Create duplicate scan events where labels are set during a scan (i.e. not at start of scan)
+            # ASSUMPTION: Number of scans >= number of labels (i.e. each label should introduce a new scan)
+            scan.add_unmatched(label.events)
+            # Move proper label events onto the nearest scan start
+            # ASSUMPTION: Number of labels <= number of scans (i.e. only a single label allowed per scan)
+            label.align(scan.events)
+            # If one or more scans at start of data set have no corresponding label, add a default label for them
+            if label.events[0] > 0:
+                label.add(0, '')
+            # Use the target sensor of reference antenna to set the target for each scan
+            target = self.sensor.get('Antennas/%s/target' % (self.ref_ant,))
+            # Move target events onto the nearest scan start
+            # ASSUMPTION: Number of targets <= number of scans (i.e. only a single target allowed per scan)
+            target.align(scan.events)
+            if sidecar:
+                save_sidecar(filename, sidecar_params, scan=scan, label=label, target=target)
         self.sensor['Observation/scan_state'] = scan
         self.sensor['Observation/scan_index'] = CategoricalData(range(len(scan)), scan.events)
-        # Move proper label events onto the nearest scan start
-        # ASSUMPTION: Number of labels <= number of scans (i.e. only a single label allowed per scan)
-        label.align(scan.events)
-        # If one or more scans at start of data set have no corresponding label, add a default label for them
-        if label.events[0] > 0:
-            label.add(0, '')
         self.sensor['Observation/label'] = label
         self.sensor['Observation/compscan_index'] = CategoricalData(range(len(label)), label.events)
-        # Use the target sensor of reference antenna to set the target for each scan
-        target = self.sensor.get('Antennas/%s/target' % (self.ref_ant,))
-        # Move target events onto the nearest scan start
-        # ASSUMPTION: Number of targets <= number of scans (i.e. only a single target allowed per scan)
-        target.align(scan.events)
         self.sensor['Observation/target'] = target
         self.sensor['Observation/target_index'] = CategoricalData(target.indices, target.events)
         # Set up catalogue containing all targets in file, with reference antenna as default antenna
@@ -330,6 +365,17 @@ class H5DataV2(DataSet):
         # Ensure that each target flux model spans all frequencies in data set if possible
         self._fix_flux_freq_range()
 
+        # Hand file over to file pool (if any), which may close it and reopen it when its data is accessed again
+        if file_pool is not None and mode == 'r':
+            self.file = file_pool.adopt(f)
+            self._vis, self._timestamps, self._flags, self._weights = \
+                [self.file.pooled(d) for d in (self._vis, self._timestamps, self._flags, self._weights)]
+            self._flags_description = self._flags_description[:]
+            for sensor_data in dict.itervalues(self.sensor):
+                if isinstance(sensor_data, SensorData):
+                    sensor_data.data = self.file.pooled(sensor_data.data)
+            # Sensors that have not been looked up yet will be found via pooled file
+            sensor_index.file = self.file
         # Avoid storing reference to self in transform closure below, as this hinders garbage collection
         dump_period, time_offset = self.dump_period, self.time_offset
         # Restore original (slow) timestamps so that subsequent sensors (e.g. pointing) will have accurate values
@@ -339,9 +385,9 @@ class H5DataV2(DataSet):
         self.select(spw=0, subarray=0, ants=script_ants)
 
     @staticmethod
-    def _open(filename, mode='r'):
-        """Open file and do basic version and augmentation sanity check."""
-        f = h5py.File(filename, mode)
+    def _open(filename, mode='r', h5_options=None):
+        """Open file (unless already open) and do basic version and augmentation sanity check."""
+        f = filename if isinstance(filename, h5py.File) else open_file(filename, mode, h5_options)
         version = f.attrs.get('version', '1.x')
         if not version.startswith('2.'):
             raise WrongVersion("Attempting to load version '%s' file with version 2 loader" % (version,))
@@ -358,8 +404,8 @@ class H5DataV2(DataSet):
 
         Parameters
         ----------
-        filename : string
-            Data file name
+        filename : string or :class:`h5py.File` object
+            Data file name (or open file)
 
         Returns
         -------
@@ -367,11 +413,13 @@ class H5DataV2(DataSet):
 
         """
         f, version = H5DataV2._open(filename)
-        config_group = f['MetaData/Configuration']
-        all_ants = [ant for ant in config_group['Antennas']]
-        script_ants = config_group['Observation'].attrs.get('script_ants')
-        script_ants = script_ants.split(',') if script_ants else all_ants
-        return [katpoint.Antenna(config_group['Antennas'][ant].attrs['description']) for ant in script_ants if ant in all_ants]
+        # Close the file when done, as nobody else holds on to it
+        with f:
+            config_group = f['MetaData/Configuration']
+            all_ants = [ant for ant in config_group['Antennas']]
+            script_ants = config_group['Observation'].attrs.get('script_ants')
+            script_ants = script_ants.split(',') if script_ants else all_ants
+            return [katpoint.Antenna(config_group['Antennas'][ant].attrs['description']) for ant in script_ants if ant in all_ants]
 
     @staticmethod
     def _get_targets(filename):
@@ -381,8 +429,8 @@ class H5DataV2(DataSet):
 
         Parameters
         ----------
-        filename : string
-            Data file name
+        filename : string or :class:`h5py.File` object
+            Data file name (or open file)
 
         Returns
         -------
@@ -391,15 +439,17 @@ class H5DataV2(DataSet):
 
         """
         f, version = H5DataV2._open(filename)
-        # Use the delay-tracking centre as the one and only target
-        # Try two different sensors for the DBE target
-        try:
-            target_list = f['MetaData/Sensors/DBE/target']
-        except Exception:
-            # Since h5py errors have varied over the years, we need Exception
-            target_list = f['MetaData/Sensors/Beams/Beam0/target']
-        all_target_strings = [target_data[1] for target_data in target_list]
-        return katpoint.Catalogue(np.unique(all_target_strings))
+        # Close the file when done, as nobody else holds on to it
+        with f:
+            # Use the delay-tracking centre as the one and only target
+            # Try two different sensors for the DBE target
+            try:
+                target_list = f['MetaData/Sensors/DBE/target']
+            except Exception:
+                # Since h5py errors have varied over the years, we need Exception
+                target_list = f['MetaData/Sensors/Beams/Beam0/target']
+            all_target_strings = [target_data[1] for target_data in target_list]
+            return katpoint.Catalogue(np.unique(all_target_strings))
 
     def __str__(self):
         """Verbose human-friendly string representation of data set."""
@@ -446,16 +496,11 @@ class H5DataV2(DataSet):
         form of indexing on it. Only then will data be loaded into memory.
 
         """
-        def _extract_vis(vis, keep):
-            # Ensure that keep tuple has length of 3 (truncate or pad with blanket slices as necessary)
-            keep = keep[:3] + (slice(None),) * (3 - len(keep))
-            # Final indexing ensures that returned data are always 3-dimensional (i.e. keep singleton dimensions)
-            # Discard the 4th / last dimension, however, as this is subsumed in the complex view of the data
-            force_3dim = tuple([(np.newaxis if np.isscalar(dim_keep) else slice(None)) for dim_keep in keep] + [0])
-            return vis.view(np.complex64)[force_3dim]
-        extract_vis = LazyTransform('extract_vis', _extract_vis, lambda shape: shape[:-1], np.complex64)
-        return LazyIndexer(self._vis, (self._time_keep, self._freq_keep, self._corrprod_keep),
-                           transforms=[extract_vis])
+        extract = LazyTransform('extract_vis',
+                                # Discard the 4th / last dimension as this is subsumed in complex view
+                                lambda vis, keep: vis.view(np.complex64)[..., 0],
+                                lambda shape: shape[:-1], np.complex64, chunkwise=True, view=True)
+        return self._vislike_indexer(self._vis, extract)
 
     def weights(self, names=None):
         """Visibility weights as a function of time, frequency and baseline.
@@ -489,18 +534,13 @@ class H5DataV2(DataSet):
         if not selection:
             logger.warning('No valid weights were selected - setting all weights to 1.0 by default')
 
-        def _extract_weights(weights, keep):
-            # Ensure that keep tuple has length of 3 (truncate or pad with blanket slices as necessary)
-            keep = keep[:3] + (slice(None),) * (3 - len(keep))
-            # Final indexing ensures that returned data are always 3-dimensional (i.e. keep singleton dimensions)
-            force_3dim = tuple([(np.newaxis if np.isscalar(dim_keep) else slice(None)) for dim_keep in keep])
-            # Multiply selected weights together (or select lone weight)
-            # Strangely enough, if selection is [], prod produces the expected weights of 1.0 instead of an empty array
-            return weights[force_3dim][:, :, :, selection[0]] if len(selection) == 1 else \
-                   weights[force_3dim][:, :, :, selection].prod(axis=-1)
-        extract_weights = LazyTransform('extract_weights', _extract_weights, lambda shape: shape[:-1], np.float32)
-        return LazyIndexer(self._weights, (self._time_keep, self._freq_keep, self._corrprod_keep),
-                           transforms=[extract_weights])
+        # Multiply selected weights together (or select lone weight)
+        # Strangely enough, if selection is [], prod produces the expected weights of 1.0 instead of an empty array
+        extract = LazyTransform('extract_weights',
+                                lambda weights, keep: weights[..., selection[0]] if len(selection) == 1 else
+                                                      weights[..., selection].prod(axis=-1),
+                                lambda shape: shape[:-1], np.float32, chunkwise=True)
+        return self._vislike_indexer(self._weights, extract, key=('extract_weights', tuple(names)))
 
     def flags(self, names=None):
         """Flags as a function of time, frequency and baseline.
@@ -536,16 +576,9 @@ class H5DataV2(DataSet):
         if not flagmask:
             logger.warning('No valid flags were selected - setting all flags to False by default')
 
-        def _extract_flags(flags, keep):
-            # Ensure that keep tuple has length of 3 (truncate or pad with blanket slices as necessary)
-            keep = keep[:3] + (slice(None),) * (3 - len(keep))
-            # Final indexing ensures that returned data are always 3-dimensional (i.e. keep singleton dimensions)
-            force_3dim = tuple([(np.newaxis if np.isscalar(dim_keep) else slice(None)) for dim_keep in keep])
-            flags_3dim = flags[force_3dim]
-            # Use flagmask to blank out the flags we don't want
-            total_flags = np.bitwise_and(flagmask, flags_3dim)
-            # Convert uint8 to bool: if any flag bits set, flag is set
-            return np.bool_(total_flags)
-        extract_flags = LazyTransform('extract_flags', _extract_flags, dtype=np.bool)
-        return LazyIndexer(self._flags, (self._time_keep, self._freq_keep, self._corrprod_keep),
-                           transforms=[extract_flags])
+        extract = LazyTransform('extract_flags',
+                                # Use flagmask to blank out the flags we don't want
+                                # Then convert uint8 to bool -> if any flag bits set, flag is set
+                                lambda flags, keep: np.bool_(np.bitwise_and(flagmask, flags)),
+                                dtype=np.bool, chunkwise=True)
+        return self._vislike_indexer(self._flags, extract, key=('extract_flags', tuple(names)))
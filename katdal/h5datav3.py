@@ -1,6 +1,7 @@
 """Data accessor class for HDF5 files produced by RTS correlator."""
 
 import logging
+import itertools
 
 import numpy as np
 import h5py
@@ -8,9 +9,11 @@ import katpoint
 
 from .dataset import DataSet, WrongVersion, BrokenFile, Subarray, SpectralWindow, \
                      DEFAULT_SENSOR_PROPS, DEFAULT_VIRTUAL_SENSORS, _robust_target
-from .sensordata import SensorData, SensorCache
+from .sensordata import SensorData, SensorCache, H5SensorIndex
 from .categorical import CategoricalData, sensor_to_categorical
-from .lazy_indexer import LazyIndexer, LazyTransform
+from .lazy_indexer import LazyTransform
+from .sidecar import load_sidecar, save_sidecar, timestamps_digest
+from .h5files import open_file, open_tuned_dataset
 
 logger = logging.getLogger(__name__)
 
@@ -83,6 +86,138 @@ def dummy_dataset(name, shape, dtype, value):
     dummy_file = h5py.File('%s_%s.h5' % (name, random_string), driver='core', backing_store=False)
     return dummy_file.create_dataset(name, shape=shape, maxshape=shape, dtype=dtype, fillvalue=value, compression='gzip')
 
+
+def _load_timestamps(filename, raw_timestamps, dump_period, time_offset, old_scale, old_origin,
+                     time_scale, time_origin, sensor_index, group_names):
+    """Resynthesise correlator timestamps, fixing sample counter wraps and checking their regularity.
+
+    Parameters
+    ----------
+    filename : string
+        Name of data file (used in warnings)
+    raw_timestamps : array of float, shape (*T*,)
+        Timestamps as stored in file, at the start of each dump
+    dump_period : float
+        Correlator dump period, in seconds
+    time_offset : float
+        Offset to add to all correlator timestamps, in seconds
+    old_scale, old_origin : float
+        Scale factor and sync time used to produce `raw_timestamps`
+    time_scale, time_origin : float
+        Scale factor and sync time used to resynthesise the timestamps
+    sensor_index : :class:`H5SensorIndex` object
+        Index of sensors, used to get a second opinion of the start time
+    group_names : sequence of strings
+        Sensor groups to search for periodic sensors
+
+    Returns
+    -------
+    timestamps : array of float, shape (*T'*,)
+        Timestamps at the middle of each dump, with duplicate final timestamp
+        discarded (so *T'* is either *T* or *T* - 1)
+    time_origin : float
+        Final sync time, moved forward to avoid sample counter wrapping
+
+    """
+    # Work around wraps in ADC sample counter
+    adc_wrap_period = 2 ** ADC_COUNTER_BITS / time_scale
+    # Get second opinion of the observation start time from periodic sensors
+    periodic_sensors = ('air_temperature', 'air_relative_humidity', 'air_pressure',
+                        'pos_actual_scan_azim', 'pos_actual_scan_elev')
+    data_duration = raw_timestamps[-1] + dump_period - raw_timestamps[0]
+    sensor_start_time = 0.0
+    # Pick first periodic sensor with data record of similar duration as data
+    for group_name, periodic_sensor in itertools.product(group_names, periodic_sensors):
+        sensor_data = sensor_index.get(group_name + '/' + periodic_sensor)
+        if sensor_data is not None:
+            proposed_sensor_start_time = sensor_data[0]['timestamp']
+            sensor_duration = sensor_data[-1]['timestamp'] - proposed_sensor_start_time
+            if abs(data_duration - sensor_duration) < 10.:
+                sensor_start_time = proposed_sensor_start_time
+                break
+    # If CBF sync time was too long ago, move it forward in steps of wrap period
+    while sensor_start_time - time_origin > adc_wrap_period:
+        time_origin += adc_wrap_period
+    if time_origin != old_origin:
+        logger.warning("CBF sync time overridden or moved forward to avoid sample counter wrapping")
+        logger.warning("Sync time changed from %s to %s (UTC)" %
+                       (katpoint.Timestamp(old_origin), katpoint.Timestamp(time_origin)))
+        logger.warning("THE DATA MAY BE CORRUPTED with e.g. delay tracking errors - proceed at own risk!")
+    # Resynthesise the timestamps using the final scale and origin
+    samples = old_scale * (raw_timestamps - old_origin)
+    timestamps = samples / time_scale + time_origin
+    # Now remove any time wraps within the observation
+    time_deltas = np.diff(timestamps)
+    # Assume that any decrease in timestamp is due to wrapping of ADC sample counter
+    time_wraps = np.nonzero(time_deltas < 0.0)[0]
+    if time_wraps:
+        time_deltas[time_wraps] += adc_wrap_period
+        timestamps = np.cumsum(np.r_[timestamps[0], time_deltas])
+        for wrap in time_wraps:
+            logger.warning('Time wrap found and corrected at: %s UTC' % (katpoint.Timestamp(timestamps[wrap])))
+        logger.warning("THE DATA MAY BE CORRUPTED with e.g. delay tracking errors - proceed at own risk!")
+
+    num_dumps = len(timestamps)
+    # Discard the last sample if the timestamp is a duplicate (caused by stop packet in k7_capture)
+    num_dumps = (num_dumps - 1) if num_dumps > 1 and (timestamps[-1] == timestamps[-2]) else num_dumps
+    timestamps = timestamps[:num_dumps]
+    # The expected_dumps should always be an integer (like num_dumps), unless the timestamps and/or dump period
+    # are messed up in the file, so the threshold of this test is a bit arbitrary (e.g. could use > 0.5)
+    expected_dumps = (timestamps[-1] - timestamps[0]) / dump_period + 1
+    if abs(expected_dumps - num_dumps) >= 0.01:
+        # Warn the user, as this is anomalous
+        logger.warning(("Irregular timestamps detected in file '%s': "
+                       "expected %.3f dumps based on dump period and start/end times, got %d instead") %
+                       (filename, expected_dumps, num_dumps))
+    # Move timestamps from start of each dump to the middle of the dump
+    return timestamps + 0.5 * dump_period + time_offset, time_origin
+
+#--------------------------------------------------------------------------------------------------
+#--- CLASS :  DeferredTimestamps
+#--------------------------------------------------------------------------------------------------
+
+class DeferredTimestamps(object):
+    """Timestamps that are only loaded from file when first indexed.
+
+    Parameters
+    ----------
+    file : :class:`h5py.File` or :class:`PooledFile` object
+        File containing raw timestamps (may be replaced until first indexed)
+    name : string
+        Name of raw timestamp dataset in file
+    load : function
+        Turns raw timestamps into final timestamps, with signature
+        ``timestamps = load(raw_timestamps)``
+    num_dumps : int
+        Number of final timestamps
+
+    """
+    def __init__(self, file, name, load, num_dumps):
+        self.file = file
+        self.name = name
+        self._load = load
+        self._timestamps = None
+        self.shape = (num_dumps,)
+        self.dtype = np.dtype(np.float64)
+
+    def __len__(self):
+        """Number of timestamps."""
+        return self.shape[0]
+
+    def _loaded(self):
+        """Final timestamps as an array, loading them from file on first access."""
+        if self._timestamps is None:
+            self._timestamps = np.asarray(self._load(self.file[self.name][:])[:len(self)], dtype=self.dtype)
+        return self._timestamps
+
+    def __getitem__(self, key):
+        """Index timestamps, loading them from file on first access."""
+        return self._loaded()[key]
+
+    def __array__(self, dtype=None):
+        """Final timestamps as an array (e.g. for :func:`numpy.asarray`), loading them on first access."""
+        return self._loaded() if dtype is None else self._loaded().astype(dtype)
+
 #--------------------------------------------------------------------------------------------------
 #--- CLASS :  H5DataV3
 #--------------------------------------------------------------------------------------------------
@@ -94,8 +229,8 @@ class H5DataV3(DataSet):
 
     Parameters
     ----------
-    filename : string
-        Name of HDF5 file
+    filename : string or :class:`h5py.File` object
+        Name of HDF5 file (or file already opened in appropriate mode)
     ref_ant : string, optional
         Name of reference antenna, used to partition data set into scans
         (default is first antenna in use)
@@ -113,12 +248,37 @@ class H5DataV3(DataSet):
         Override centre frequency if provided, in Hz
     squeeze : {False, True}, optional
         Don't force vis / weights / flags to be 3-dimensional
+    quicklook : {False, True}
+        True if timestamps synthesised from the first timestamp and dump period
+        should be used to partition data set, thereby avoiding the slow loading
+        of real timestamps and search for a start time in periodic sensors.
+        The real timestamps are only loaded, resynthesised and checked for
+        wraps and irregularities once they are accessed, at the cost of
+        slightly inaccurate label borders (or completely wrong ones if the
+        sample counter wrapped since the CBF sync time). Sensors are also
+        interpolated onto the synthesised timestamps.
+    file_pool : :class:`FilePool` object or None, optional
+        Pool that may close the file when too many files are open and reopen
+        it when its data is accessed again (only used in read-only mode)
+    sidecar : {False, True}, optional
+        Store the scans, compound scans and targets derived from sensors in a
+        sidecar index file next to the data file, and reuse them on subsequent
+        opens for as long as the data file is unchanged (see :mod:`sidecar`)
+    h5_options : dict or None, optional
+        HDF5 tuning options such as chunk cache settings, file driver and page
+        buffer size (see :func:`h5files.open_file`). By default the chunk cache
+        of vis, flags and weights is sized to suit their chunks (see
+        :func:`h5files.chunk_cache_settings`)
+    sensor_store : :class:`SensorStore` object or None, optional
+        Persistent store of extracted sensor data shared by many data files,
+        which avoids extracting the same sensors again on subsequent opens
+        for as long as the data file is unchanged (see :mod:`sidecar`)
     kwargs : dict, optional
         Extra keyword arguments, typically meant for other formats and ignored
 
     Attributes
     ----------
-    file : :class:`h5py.File` object
+    file : :class:`h5py.File` or :class:`PooledFile` object
         Underlying HDF5 file, exposed via :mod:`h5py` interface
 
     Notes
@@ -132,11 +292,14 @@ class H5DataV3(DataSet):
     """
     def __init__(self, filename, ref_ant='', time_offset=0.0, mode='r',
                  time_scale=None, time_origin=None, rotate_bls=False,
-                 centre_freq=None, squeeze=False, **kwargs):
+                 centre_freq=None, squeeze=False, quicklook=False, file_pool=None, sidecar=False,
+                 h5_options=None, sensor_store=None, **kwargs):
+        # Accept an open HDF5 file (as handed over by format detection) in place of a filename
+        filename, h5file = getattr(filename, 'filename', filename), filename
         DataSet.__init__(self, filename, ref_ant, time_offset)
 
         # Load file
-        self.file, self.version = H5DataV3._open(filename, mode)
+        self.file, self.version = H5DataV3._open(h5file, mode, h5_options)
         f = self.file
 
         # Load main HDF5 groups
@@ -148,33 +311,45 @@ class H5DataV3(DataSet):
 
         # ------ Extract sensors ------
 
-        # Populate sensor cache with all HDF5 datasets below TelescopeModel group that fit the description of a sensor
-        cache = {}
-        def register_sensor(name, obj):
-            """A sensor is defined as a non-empty dataset with expected dtype."""
-            if isinstance(obj, h5py.Dataset) and obj.shape != () and obj.dtype.names == ('timestamp', 'value', 'status'):
-                comp_name, sensor_name = name.split('/', 1)
-                comp_type = tm_group[comp_name].attrs.get('class')
-                # Mapping from specific components to generic sensor groups
-                # Put antenna sensors in virtual Antenna group, the rest according to component type
-                group_lookup = {'AntennaPositioner' : 'Antennas/' + comp_name}
-                group_name = group_lookup.get(comp_type, comp_type) if comp_type else comp_name
-                name = '/'.join((group_name, sensor_name))
-                cache[name] = SensorData(obj, name)
-        tm_group.visititems(register_sensor)
+        # Index all HDF5 datasets below TelescopeModel group that fit the description of a sensor by sensor name,
+        # which only looks up the datasets of sensors that are actually used
+        comp_groups, group_comps = {}, {}
+        for comp_name in tm_group:
+            comp_type = tm_group[comp_name].attrs.get('class')
+            # Mapping from specific components to generic sensor groups
+            # Put antenna sensors in virtual Antenna group, the rest according to component type
+            group_lookup = {'AntennaPositioner' : 'Antennas/' + comp_name}
+            group_name = group_lookup.get(comp_type, comp_type) if comp_type else comp_name
+            comp_groups[comp_name] = group_name
+            group_comps.setdefault(group_name, []).append(comp_name)
+        def sensor_paths(name):
+            """Candidate paths of sensor dataset within TelescopeModel group."""
+            return [comp_name + name[len(group_name):] for group_name, comps in group_comps.iteritems()
+                    if name.startswith(group_name + '/') for comp_name in comps]
+        def sensor_name(path):
+            """Sensor name corresponding to path of sensor dataset within TelescopeModel group."""
+            comp_name, sensor_path = path.split('/', 1)
+            return '/'.join((comp_groups[comp_name], sensor_path))
+        sensor_index = H5SensorIndex(f, tm_group.name, sensor_paths, sensor_name)
 
         # ------ Extract vis and timestamps ------
 
         if cbf_group.attrs.keys() == ['class']:
             raise BrokenFile('File contains no correlator metadata')
         self.dump_period = cbf_group.attrs['int_time']
-        # Obtain visibilities and timestamps (load the latter explicitly, but obviously not the former...)
+        # Obtain visibilities and timestamps (load the latter explicitly unless in quicklook mode, but obviously
+        # not the former...)
         if 'correlator_data' in data_group:
-            self._vis = data_group['correlator_data']
+            self._vis = open_tuned_dataset(data_group, 'correlator_data', h5_options)
         else:
             raise BrokenFile('File contains no visibility data')
-        self._timestamps = data_group['timestamps'][:]
         self._squeeze = squeeze
+        raw_timestamps = data_group['timestamps']
+        # Check dimensions of timestamps vs those of visibility data
+        num_dumps = len(raw_timestamps)
+        if num_dumps != self._vis.shape[0]:
+            raise BrokenFile('Number of timestamps received from ingest '
+                             '(%d) differs from number of dumps in data (%d)' % (num_dumps, self._vis.shape[0]))
 
         # Resynthesise timestamps from sample counter based on a different scale factor or origin
         old_scale = cbf_group.attrs['scale_factor_timestamp']
@@ -182,74 +357,44 @@ class H5DataV3(DataSet):
         # If no new scale factor or origin is given, just use old ones - timestamps should be identical
         time_scale = old_scale if time_scale is None else time_scale
         time_origin = old_origin if time_origin is None else time_origin
-        # Work around wraps in ADC sample counter
-        adc_wrap_period = 2 ** ADC_COUNTER_BITS / time_scale
-        # Get second opinion of the observation start time from periodic sensors
-        periodic_sensors = ('air_temperature', 'air_relative_humidity', 'air_pressure',
-                            'pos_actual_scan_azim', 'pos_actual_scan_elev')
-        data_duration = self._timestamps[-1] + self.dump_period - self._timestamps[0]
-        sensor_start_time = 0.0
-        # Pick first periodic sensor with data record of similar duration as data
-        for sensor_name, sensor_data in cache.iteritems():
-            if sensor_name.endswith(periodic_sensors):
-                proposed_sensor_start_time = sensor_data[0]['timestamp']
-                sensor_duration = sensor_data[-1]['timestamp'] - proposed_sensor_start_time
-                if abs(data_duration - sensor_duration) < 10.:
-                    sensor_start_time = proposed_sensor_start_time
-                    break
-        # If CBF sync time was too long ago, move it forward in steps of wrap period
-        while sensor_start_time - time_origin > adc_wrap_period:
-            time_origin += adc_wrap_period
-        if time_origin != old_origin:
-            logger.warning("CBF sync time overridden or moved forward to avoid sample counter wrapping")
-            logger.warning("Sync time changed from %s to %s (UTC)" %
-                           (katpoint.Timestamp(old_origin), katpoint.Timestamp(time_origin)))
-            logger.warning("THE DATA MAY BE CORRUPTED with e.g. delay tracking errors - proceed at own risk!")
-        # Resynthesise the timestamps using the final scale and origin
-        samples = old_scale * (self._timestamps - old_origin)
-        self._timestamps = samples / time_scale + time_origin
-        # Now remove any time wraps within the observation
-        time_deltas = np.diff(self._timestamps)
-        # Assume that any decrease in timestamp is due to wrapping of ADC sample counter
-        time_wraps = np.nonzero(time_deltas < 0.0)[0]
-        if time_wraps:
-            time_deltas[time_wraps] += adc_wrap_period
-            self._timestamps = np.cumsum(np.r_[self._timestamps[0], time_deltas])
-            for wrap in time_wraps:
-                logger.warning('Time wrap found and corrected at: %s UTC' % (katpoint.Timestamp(self._timestamps[wrap])))
-            logger.warning("THE DATA MAY BE CORRUPTED with e.g. delay tracking errors - proceed at own risk!")
-
-        # Check dimensions of timestamps vs those of visibility data
-        num_dumps = len(self._timestamps)
-        if num_dumps != self._vis.shape[0]:
-            raise BrokenFile('Number of timestamps received from ingest '
-                             '(%d) differs from number of dumps in data (%d)' % (num_dumps, self._vis.shape[0]))
-        # Discard the last sample if the timestamp is a duplicate (caused by stop packet in k7_capture)
-        num_dumps = (num_dumps - 1) if num_dumps > 1 and (self._timestamps[-1] == self._timestamps[-2]) else num_dumps
-        self._timestamps = self._timestamps[:num_dumps]
-        # The expected_dumps should always be an integer (like num_dumps), unless the timestamps and/or dump period
-        # are messed up in the file, so the threshold of this test is a bit arbitrary (e.g. could use > 0.5)
-        expected_dumps = (self._timestamps[-1] - self._timestamps[0]) / self.dump_period + 1
-        if abs(expected_dumps - num_dumps) >= 0.01:
-            # Warn the user, as this is anomalous
-            logger.warning(("Irregular timestamps detected in file '%s': "
-                           "expected %.3f dumps based on dump period and start/end times, got %d instead") %
-                           (filename, expected_dumps, num_dumps))
-        # Move timestamps from start of each dump to the middle of the dump
-        self._timestamps += 0.5 * self.dump_period + self.time_offset
-        if self._timestamps[0] < 1e9:
-            logger.warning("File '%s' has invalid first correlator timestamp (%f)" % (filename, self._timestamps[0],))
+        if quicklook:
+            # Synthesise timestamps from the first timestamp and dump period (much quicker than loading them all).
+            # This is useful for the purpose of segmenting data set, where accurate timestamps are not that crucial.
+            # Discard the last sample if the timestamp is a duplicate (caused by stop packet in k7_capture)
+            last_two = raw_timestamps[-2:]
+            num_dumps = (num_dumps - 1) if num_dumps > 1 and (last_two[-1] == last_two[-2]) else num_dumps
+            first_timestamp = old_scale * (raw_timestamps[0] - old_origin) / time_scale + time_origin
+            data_timestamps = first_timestamp + self.dump_period * np.arange(num_dumps)
+            data_timestamps += 0.5 * self.dump_period + self.time_offset
+            # The real timestamps are loaded, resynthesised and checked when the user explicitly asks for them
+            # (avoid storing reference to self in the closure below, as this hinders garbage collection)
+            dump_period, time_offset, group_names = self.dump_period, self.time_offset, sorted(group_comps)
+            def load(raw):
+                """Resynthesise and check raw timestamps once they are needed."""
+                return _load_timestamps(filename, raw, dump_period, time_offset, old_scale, old_origin,
+                                        time_scale, time_origin, sensor_index, group_names)[0]
+            self._timestamps = DeferredTimestamps(f, 'Data/timestamps', load, num_dumps)
+        else:
+            data_timestamps, time_origin = _load_timestamps(filename, raw_timestamps[:], self.dump_period,
+                                                            self.time_offset, old_scale, old_origin,
+                                                            time_scale, time_origin, sensor_index, sorted(group_comps))
+            num_dumps = len(data_timestamps)
+            self._timestamps = data_timestamps
+        if data_timestamps[0] < 1e9:
+            logger.warning("File '%s' has invalid first correlator timestamp (%f)" % (filename, data_timestamps[0],))
         self._time_keep = np.ones(num_dumps, dtype=np.bool)
-        self.start_time = katpoint.Timestamp(self._timestamps[0] - 0.5 * self.dump_period)
-        self.end_time = katpoint.Timestamp(self._timestamps[-1] + 0.5 * self.dump_period)
-        # Populate sensor cache with all HDF5 datasets below TelescopeModel group that fit the description of a sensor
-        self.sensor = SensorCache(cache, self._timestamps, self.dump_period, keep=self._time_keep,
-                                  props=SENSOR_PROPS, virtual=VIRTUAL_SENSORS, aliases=SENSOR_ALIASES)
+        self.start_time = katpoint.Timestamp(data_timestamps[0] - 0.5 * self.dump_period)
+        self.end_time = katpoint.Timestamp(data_timestamps[-1] + 0.5 * self.dump_period)
+        # Create sensor cache that looks up the sensors below TelescopeModel group as they are needed
+        self.sensor = SensorCache({}, data_timestamps, self.dump_period, keep=self._time_keep,
+                                  props=SENSOR_PROPS, virtual=VIRTUAL_SENSORS, aliases=SENSOR_ALIASES,
+                                  index=sensor_index,
+                                  store=sensor_store.bind(filename) if sensor_store is not None else None)
 
         # ------ Extract flags ------
 
         # Check if flag group is present, else use dummy flag data
-        self._flags = data_group['flags'] if 'flags' in data_group else \
+        self._flags = open_tuned_dataset(data_group, 'flags', h5_options) if 'flags' in data_group else \
                       dummy_dataset('dummy_flags', shape=self._vis.shape[:-1], dtype=np.uint8, value=0)
         # Obtain flag descriptions from file or recreate default flag description table
         self._flags_description = data_group['flags_description'] if 'flags_description' in data_group else \
@@ -258,7 +403,7 @@ class H5DataV3(DataSet):
         # ------ Extract weights ------
 
         # check if weight group present, else use dummy weight data
-        self._weights = data_group['weights'] if 'weights' in data_group else \
+        self._weights = open_tuned_dataset(data_group, 'weights', h5_options) if 'weights' in data_group else \
                         dummy_dataset('dummy_weights', shape=self._vis.shape[:-1] + (1,), dtype=np.float32, value=1.0)
         self._weights_description = np.array(zip(WEIGHT_NAMES, WEIGHT_DESCRIPTIONS))
 
@@ -338,42 +483,54 @@ class H5DataV3(DataSet):
 
         # ------ Extract scans / compound scans / targets ------
 
-        # Use the activity sensor of reference antenna to partition the data set into scans (and to set their states)
-        scan = self.sensor.get('Antennas/%s/activity' % (self.ref_ant,))
-        # If the antenna starts slewing on the second dump, incorporate the first dump into the slew too.
-        # This scenario typically occurs when the first target is only set after the first dump is received.
-        # The workaround avoids putting the first dump in a scan by itself, typically with an irrelevant target.
-        if len(scan) > 1 and scan.events[1] == 1 and scan[1] == 'slew':
-            scan.events, scan.indices = scan.events[1:], scan.indices[1:]
-            scan.events[0] = 0
-        # Use labels to partition the data set into compound scans
-        label = self.sensor.get('Observation/label')
-        # Discard empty labels (typically found in raster scans, where first scan has proper label and rest are empty)
-        # However, if all labels are empty, keep them, otherwise whole data set will be one pathological compscan...
-        if len(label.unique_values) > 1:
-            label.remove('')
-        # Create duplicate scan events where labels are set during a scan (i.e. not at start of scan)
-        # ASSUMPTION: Number of scans >= number of labels (i.e. each label should introduce a new scan)
-        scan.add_unmatched(label.events)
+        # Reuse scans, compound scans and targets of an earlier open if a fresh sidecar index is available
+        # The structure is aligned to the data timestamps, so these (and whatever went into them) are part of the key
+        sidecar_params = {'ref_ant': self.ref_ant, 'time_offset': self.time_offset, 'time_scale': float(time_scale),
+                          'time_origin': float(time_origin), 'rotate_bls': rotate_bls, 'quicklook': quicklook,
+                          'dump_period': float(self.dump_period), 'timestamps': timestamps_digest(data_timestamps)}
+        observation = load_sidecar(filename, sidecar_params) if sidecar else None
+        if observation is not None:
+            scan, label, target = observation['scan'], observation['label'], observation['target']
+        else:
+            # Use the activity sensor of reference antenna to partition the data set into scans (and set their states)
+            scan = self.sensor.get('Antennas/%s/activity' % (self.ref_ant,))
+            # If the antenna starts slewing on the second dump, incorporate the first dump into the slew too.
+            # This scenario typically occurs when the first target is only set after the first dump is received.
+            # The workaround avoids putting the first dump in a scan by itself, typically with an irrelevant target.
+            if len(scan) > 1 and scan.events[1] == 1 and scan[1] == 'slew':
+                scan.events, scan.indices = scan.events[1:], scan.indices[1:]
+                scan.events[0] = 0
+            # Use labels to partition the data set into compound scans
+            label = self.sensor.get('Observation/label')
+            # Discard empty labels (typically found in raster scans, where first scan has proper label and rest are
+            # empty). However, if all labels are empty, keep them, otherwise whole data set will be one pathological
+            # compscan...
+            if len(label.unique_values) > 1:
+                label.remove('')
+            # Create duplicate scan events where labels are set during a scan (i.e. not at start of scan)
+            # ASSUMPTION: Number of scans >= number of labels (i.e. each label should introduce a new scan)
+            scan.add_unmatched(label.events)
+            # Move proper label events onto the nearest scan start
+            # ASSUMPTION: Number of labels <= number of scans (i.e. only a single label allowed per scan)
+            label.align(scan.events)
+            # If one or more scans at start of data set have no corresponding label, add a default label for them
+            if label.events[0] > 0:
+                label.add(0, '')
+            # Use the target sensor of reference antenna to set the target for each scan
+            target = self.sensor.get('Antennas/%s/target' % (self.ref_ant,))
+            # RTS workaround: Remove an initial blank target (typically because the antenna is stopped at the start)
+            if len(target) > 1 and target[0] == 'Nothing, special':
+                target.events, target.indices = target.events[1:], target.indices[1:]
+                target.events[0] = 0
+            # Move target events onto the nearest scan start
+            # ASSUMPTION: Number of targets <= number of scans (i.e. only a single target allowed per scan)
+            target.align(scan.events)
+            if sidecar:
+                save_sidecar(filename, sidecar_params, scan=scan, label=label, target=target)
         self.sensor['Observation/scan_state'] = scan
         self.sensor['Observation/scan_index'] = CategoricalData(range(len(scan)), scan.events)
-        # Move proper label events onto the nearest scan start
-        # ASSUMPTION: Number of labels <= number of scans (i.e. only a single label allowed per scan)
-        label.align(scan.events)
-        # If one or more scans at start of data set have no corresponding label, add a default label for them
-        if label.events[0] > 0:
-            label.add(0, '')
         self.sensor['Observation/label'] = label
         self.sensor['Observation/compscan_index'] = CategoricalData(range(len(label)), label.events)
-        # Use the target sensor of reference antenna to set the target for each scan
-        target = self.sensor.get('Antennas/%s/target' % (self.ref_ant,))
-        # RTS workaround: Remove an initial blank target (typically because the antenna is stopped at the start)
-        if len(target) > 1 and target[0] == 'Nothing, special':
-            target.events, target.indices = target.events[1:], target.indices[1:]
-            target.events[0] = 0
-        # Move target events onto the nearest scan start
-        # ASSUMPTION: Number of targets <= number of scans (i.e. only a single target allowed per scan)
-        target.align(scan.events)
         self.sensor['Observation/target'] = target
         self.sensor['Observation/target_index'] = CategoricalData(target.indices, target.events)
         # Set up catalogue containing all targets in file, with reference antenna as default antenna
@@ -382,15 +539,28 @@ class H5DataV3(DataSet):
         # Ensure that each target flux model spans all frequencies in data set if possible
         self._fix_flux_freq_range()
 
+        # Hand file over to file pool (if any), which may close it and reopen it when its data is accessed again
+        if file_pool is not None and mode == 'r':
+            self.file = file_pool.adopt(f)
+            self._vis, self._flags, self._weights = [self.file.pooled(d) for d in
+                                                     (self._vis, self._flags, self._weights)]
+            self._flags_description = self._flags_description[:]
+            for sensor_data in dict.itervalues(self.sensor):
+                if isinstance(sensor_data, SensorData):
+                    sensor_data.data = self.file.pooled(sensor_data.data)
+            # Sensors that have not been looked up yet will be found via pooled file
+            sensor_index.file = self.file
+            if isinstance(self._timestamps, DeferredTimestamps):
+                self._timestamps.file = self.file
         # Avoid storing reference to self in transform closure below, as this hinders garbage collection
         dump_period, time_offset = self.dump_period, self.time_offset
         # Apply default selection and initialise all members that depend on selection in the process
         self.select(spw=0, subarray=0, ants=obs_ants)
 
     @staticmethod
-    def _open(filename, mode='r'):
-        """Open file and do basic version sanity check."""
-        f = h5py.File(filename, mode)
+    def _open(filename, mode='r', h5_options=None):
+        """Open file (unless already open) and do basic version sanity check."""
+        f = filename if isinstance(filename, h5py.File) else open_file(filename, mode, h5_options)
         version = f.attrs.get('version', '1.x')
         if not version.startswith('3.'):
             raise WrongVersion("Attempting to load version '%s' file with version 3 loader" % (version,))
@@ -404,8 +574,8 @@ class H5DataV3(DataSet):
 
         Parameters
         ----------
-        filename : string
-            Data file name
+        filename : string or :class:`h5py.File` object
+            Data file name (or open file)
 
         Returns
         -------
@@ -413,17 +583,19 @@ class H5DataV3(DataSet):
 
         """
         f, version = H5DataV3._open(filename)
-        obs_params = {}
-        tm_group = f['TelescopeModel']
-        all_ants = [ant for ant in tm_group if tm_group[ant].attrs.get('class') == 'AntennaPositioner']
-        tm_params = tm_group['obs/params']
-        for obs_param in tm_params['value']:
-            key, val = obs_param.split(' ', 1)
-            obs_params[key] = np.lib.utils.safe_eval(val)
-        obs_ants = obs_params.get('ants')
-        # By default, only pick antennas that were in use by the script
-        obs_ants = obs_ants.split(',') if obs_ants else all_ants
-        return [katpoint.Antenna(tm_group[ant].attrs['description']) for ant in obs_ants if ant in all_ants]
+        # Close the file when done, as nobody else holds on to it
+        with f:
+            obs_params = {}
+            tm_group = f['TelescopeModel']
+            all_ants = [ant for ant in tm_group if tm_group[ant].attrs.get('class') == 'AntennaPositioner']
+            tm_params = tm_group['obs/params']
+            for obs_param in tm_params['value']:
+                key, val = obs_param.split(' ', 1)
+                obs_params[key] = np.lib.utils.safe_eval(val)
+            obs_ants = obs_params.get('ants')
+            # By default, only pick antennas that were in use by the script
+            obs_ants = obs_ants.split(',') if obs_ants else all_ants
+            return [katpoint.Antenna(tm_group[ant].attrs['description']) for ant in obs_ants if ant in all_ants]
 
     @staticmethod
     def _get_targets(filename):
@@ -433,8 +605,8 @@ class H5DataV3(DataSet):
 
         Parameters
         ----------
-        filename : string
-            Data file name
+        filename : string or :class:`h5py.File` object
+            Data file name (or open file)
 
         Returns
         -------
@@ -443,9 +615,11 @@ class H5DataV3(DataSet):
 
         """
         f, version = H5DataV3._open(filename)
-        target_list = f['TelescopeModel/cbf/target']
-        all_target_strings = [target_data[1] for target_data in target_list]
-        return katpoint.Catalogue(np.unique(all_target_strings))
+        # Close the file when done, as nobody else holds on to it
+        with f:
+            target_list = f['TelescopeModel/cbf/target']
+            all_target_strings = [target_data[1] for target_data in target_list]
+            return katpoint.Catalogue(np.unique(all_target_strings))
 
     def __str__(self):
         """Verbose human-friendly string representation of data set."""
@@ -472,47 +646,6 @@ class H5DataV3(DataSet):
         """
         return self._timestamps[self._time_keep]
 
-    def _vislike_indexer(self, dataset, extractor):
-        """Lazy indexer for vis-like datasets (vis / weights / flags).
-
-        This operates on datasets with shape (*T*, *F*, *B*) and potentially
-        different dtypes. The data type conversions are all left to the provided
-        extractor transform, while this method takes care of the common
-        selection issues, such as preserving singleton dimensions and dealing
-        with duplicate final dumps.
-
-        Parameters
-        ----------
-        dataset : :class:`h5py.Dataset` object or equivalent
-            Underlying vis-like dataset on which lazy indexing will be done
-        extractor : function, signature ``data = f(data, keep)``
-            Transform to apply to data (`keep` is user-provided 2nd-stage index)
-
-        Returns
-        -------
-        indexer : :class:`LazyIndexer` object
-            Lazy indexer with appropriate selectors and transforms included
-
-        """
-        # Create first-stage index from dataset selectors
-        time_keep = self._time_keep
-        # If there is a duplicate final dump, these lengths don't match -> ignore last dump in file
-        if len(time_keep) == len(dataset) - 1:
-            time_keep = np.zeros(len(dataset), dtype=np.bool)
-            time_keep[:len(self._time_keep)] = self._time_keep
-        stage1 = (time_keep, self._freq_keep, self._corrprod_keep)
-        def _force_3dim(data, keep):
-            """Keep singleton dimensions in stage 2 (i.e. final) indexing."""
-            # Ensure that keep tuple has length of 3 (truncate or pad with blanket slices as necessary)
-            keep = keep[:3] + (slice(None),) * (3 - len(keep))
-            # Final indexing ensures that returned data are always 3-dimensional (i.e. keep singleton dimensions)
-            keep_singles = [(np.newaxis if np.isscalar(dim_keep) else slice(None))
-                            for dim_keep in keep]
-            return data[tuple(keep_singles)]
-        force_3dim = LazyTransform('force_3dim', _force_3dim)
-        transforms = [extractor] if self._squeeze else [extractor, force_3dim]
-        return LazyIndexer(dataset, stage1, transforms)
-
     @property
     def vis(self):
         """Complex visibility data as a function of time, frequency and baseline.
@@ -532,8 +665,8 @@ class H5DataV3(DataSet):
         extract = LazyTransform('extract_vis',
                                 # Discard the 4th / last dimension as this is subsumed in complex view
                                 lambda vis, keep: vis.view(np.complex64)[..., 0],
-                                lambda shape: shape[:-1], np.complex64)
-        return self._vislike_indexer(self._vis, extract)
+                                lambda shape: shape[:-1], np.complex64, chunkwise=True, view=True)
+        return self._vislike_indexer(self._vis, extract, self._squeeze)
 
     def weights(self, names=None):
         """Visibility weights as a function of time, frequency and baseline.
@@ -572,8 +705,8 @@ class H5DataV3(DataSet):
         extract = LazyTransform('extract_weights',
                                 lambda weights, keep: weights[..., selection[0]] if len(selection) == 1 else
                                                       weights[..., selection].prod(axis=-1),
-                                lambda shape: shape[:-1], np.float32)
-        return self._vislike_indexer(self._weights, extract)
+                                lambda shape: shape[:-1], np.float32, chunkwise=True)
+        return self._vislike_indexer(self._weights, extract, self._squeeze, key=('extract_weights', tuple(names)))
 
     def flags(self, names=None):
         """Flags as a function of time, frequency and baseline.
@@ -613,5 +746,5 @@ class H5DataV3(DataSet):
                                 # Use flagmask to blank out the flags we don't want
                                 # Then convert uint8 to bool -> if any flag bits set, flag is set
                                 lambda flags, keep: np.bool_(np.bitwise_and(flagmask, flags)),
-                                dtype=np.bool)
-        return self._vislike_indexer(self._flags, extract)
+                                dtype=np.bool, chunkwise=True)
+        return self._vislike_indexer(self._flags, extract, self._squeeze, key=('extract_flags', tuple(names)))
@@ -0,0 +1,511 @@
+"""Opening and tuning of HDF5 files, and a pool of file handles that limits the number of files open at once."""
+
+import threading
+from collections import OrderedDict, MappingView
+from contextlib import contextmanager
+
+import numpy as np
+import h5py
+
+# Default size of raw data chunk cache of each HDF5 dataset, as set by the HDF5 library
+DEFAULT_CHUNK_CACHE_BYTES = 1024 ** 2
+# Upper limit on automatically sized chunk cache of each dataset, in bytes
+MAX_AUTO_CHUNK_CACHE_BYTES = 256 * 1024 ** 2
+# Settings of chunk cache (nslots, nbytes, w0) in a default dataset access property list
+_DEFAULT_CHUNK_CACHE = h5py.h5p.create(h5py.h5p.DATASET_ACCESS).get_chunk_cache()
+
+#--------------------------------------------------------------------------------------------------
+#--- Utility functions :  Opening and tuning files
+#--------------------------------------------------------------------------------------------------
+
+
+def open_file(filename, mode='r', h5_options=None):
+    """Open HDF5 file with optional tuning of HDF5 library settings.
+
+    Parameters
+    ----------
+    filename : string
+        Name of HDF5 file
+    mode : string, optional
+        HDF5 file opening mode
+    h5_options : dict or None, optional
+        Extra keyword arguments for :class:`h5py.File` that tune the file
+        access, such as the chunk cache settings ('rdcc_nbytes', 'rdcc_nslots',
+        'rdcc_w0'), the file driver ('driver') or the page buffer size
+        ('page_buf_size', if supported by h5py). The extra 'auto_chunk_cache'
+        option is used by :func:`open_tuned_dataset` and ignored here.
+
+    Returns
+    -------
+    h5file : :class:`h5py.File` object
+        Open HDF5 file
+
+    """
+    options = dict(h5_options) if h5_options else {}
+    options.pop('auto_chunk_cache', None)
+    return h5py.File(filename, mode, **options)
+
+
+def _next_prime(n):
+    """Smallest prime number that is not less than `n`."""
+    n = max(int(n), 2)
+    while any(n % d == 0 for d in xrange(2, int(np.sqrt(n)) + 1)):
+        n += 1
+    return n
+
+
+def chunk_cache_settings(dataset, h5_options=None):
+    """Settings of raw data chunk cache suited to dataset and expected access.
+
+    Explicit chunk cache settings in `h5_options` take precedence. Otherwise,
+    unless the 'auto_chunk_cache' option is False, the cache is sized to hold
+    all chunks along the non-time dimensions of a row of chunks, as data is
+    typically accessed in time order (e.g. dump by dump or in blocks of
+    dumps) across all channels and correlation products. Each chunk is then
+    only read and decompressed once. Chunks are evicted in favour of fully
+    read chunks (w0 = 1), as these will not be revisited in time order.
+
+    Parameters
+    ----------
+    dataset : :class:`h5py.Dataset` object
+        Dataset with time as its first dimension
+    h5_options : dict or None, optional
+        HDF5 tuning options (see :func:`open_file`)
+
+    Returns
+    -------
+    settings : tuple of (int, int, float), or None
+        Chunk cache settings (nslots, nbytes, w0), or None if the default
+        cache is good enough
+
+    """
+    options = h5_options if h5_options else {}
+    if any(key in options for key in ('rdcc_nslots', 'rdcc_nbytes', 'rdcc_w0')):
+        nslots, nbytes, w0 = _DEFAULT_CHUNK_CACHE
+        return (options.get('rdcc_nslots', nslots), options.get('rdcc_nbytes', nbytes), options.get('rdcc_w0', w0))
+    chunks = getattr(dataset, 'chunks', None)
+    if not options.get('auto_chunk_cache', True) or not chunks:
+        return None
+    chunk_bytes = np.prod(chunks) * dataset.dtype.itemsize
+    row_chunks = np.prod([-(-dim // chunk) for dim, chunk in zip(dataset.shape[1:], chunks[1:])])
+    nbytes = min(row_chunks * chunk_bytes, MAX_AUTO_CHUNK_CACHE_BYTES)
+    if nbytes <= DEFAULT_CHUNK_CACHE_BYTES:
+        return None
+    # The HDF5 documentation recommends a prime number of hash table slots, about 100 times the number of chunks
+    return (_next_prime(100 * max(nbytes // chunk_bytes, 1)), int(nbytes), 1.0)
+
+
+def open_dataset(h5file, name, chunk_cache=None):
+    """Open dataset in HDF5 file with specific raw data chunk cache.
+
+    Parameters
+    ----------
+    h5file : :class:`h5py.File` object
+        Open HDF5 file
+    name : string
+        Name of dataset in file
+    chunk_cache : tuple of (int, int, float), or None, optional
+        Chunk cache settings (nslots, nbytes, w0), or None for default cache
+
+    Returns
+    -------
+    dataset : :class:`h5py.Dataset` object
+        Opened dataset
+
+    """
+    if chunk_cache is None:
+        return h5file[name]
+    dapl = h5py.h5p.create(h5py.h5p.DATASET_ACCESS)
+    dapl.set_chunk_cache(*chunk_cache)
+    return h5py.Dataset(h5py.h5d.open(h5file.id, name.encode('utf-8'), dapl))
+
+
+def dataset_chunk_cache(dataset):
+    """Chunk cache settings (nslots, nbytes, w0) of open dataset, or None if default."""
+    if not isinstance(dataset, h5py.Dataset):
+        return getattr(dataset, 'chunk_cache', None)
+    chunk_cache = dataset.id.get_access_plist().get_chunk_cache()
+    return None if chunk_cache == _DEFAULT_CHUNK_CACHE else chunk_cache
+
+
+def open_tuned_dataset(group, name, h5_options=None):
+    """Open dataset with a raw data chunk cache suited to its chunks.
+
+    The chunk cache of an HDF5 dataset can only be set when the dataset is
+    opened, and only if it is not open already. The dataset is therefore
+    opened with default settings to inspect its chunks, closed again and
+    reopened with the appropriate chunk cache.
+
+    Parameters
+    ----------
+    group : :class:`h5py.Group` object
+        Group containing dataset
+    name : string
+        Name of dataset in group, which has time as its first dimension
+    h5_options : dict or None, optional
+        HDF5 tuning options (see :func:`open_file`)
+
+    Returns
+    -------
+    dataset : :class:`h5py.Dataset` object
+        Dataset with tuned chunk cache (or default cache if not tuned)
+
+    """
+    dataset = group[name]
+    if dataset.file.driver == 'core':
+        return dataset
+    chunk_cache = chunk_cache_settings(dataset, h5_options)
+    if chunk_cache is None:
+        return dataset
+    h5file, path = dataset.file, dataset.name
+    # Close dataset, otherwise the new chunk cache settings are ignored
+    del dataset
+    return open_dataset(h5file, path, chunk_cache)
+
+#--------------------------------------------------------------------------------------------------
+#--- CLASS :  FilePool
+#--------------------------------------------------------------------------------------------------
+
+class FilePool(object):
+    """Pool of read-only HDF5 files with a cap on the number of open files.
+
+    Each open HDF5 file uses a file descriptor as well as its own metadata
+    and chunk caches, which becomes a problem when a data set is concatenated
+    from hundreds of files. The pool keeps at most `max_files` files open,
+    closing the least recently used files when the cap is exceeded and
+    transparently reopening them when their data is accessed again via the
+    :class:`PooledFile`, :class:`PooledGroup` and :class:`PooledDataset`
+    proxies. Files that are busy being read are never closed, so the cap may
+    be exceeded temporarily while more than `max_files` files are read
+    concurrently.
+
+    Parameters
+    ----------
+    max_files : int, optional
+        Maximum number of files kept open at once
+    h5_options : dict or None, optional
+        HDF5 tuning options used when reopening files (see :func:`open_file`)
+
+    Attributes
+    ----------
+    opens : int
+        Number of times a file was opened by the pool
+    closes : int
+        Number of times a file was closed by the pool
+
+    """
+    def __init__(self, max_files=64, h5_options=None):
+        self.max_files = max(int(max_files), 1)
+        self.h5_options = h5_options
+        self._files = OrderedDict()
+        # Datasets opened with tuned chunk caches, kept open (with their caches) for as long as their file is open
+        self._datasets = {}
+        self._busy = {}
+        # Replaced handles that were still busy, to be closed once their file is not busy anymore
+        self._retired = {}
+        self._lock = threading.Lock()
+        self.opens = self.closes = 0
+
+    def __repr__(self):
+        """Short human-friendly string representation of file pool object."""
+        return "<katdal.%s open=%d/%d opens=%d closes=%d at 0x%x>" % \
+               (self.__class__.__name__, len(self), self.max_files, self.opens, self.closes, id(self))
+
+    def __len__(self):
+        """Number of files currently open."""
+        return len(self._files)
+
+    def _evict(self):
+        """Close least recently used files that are not busy until cap is met (call with lock held)."""
+        for filename in list(self._files):
+            if len(self._files) <= self.max_files:
+                break
+            if not self._busy.get(filename):
+                self._close(filename)
+
+    def _close(self, filename):
+        """Close file and forget its open datasets (call with lock held)."""
+        self._datasets.pop(filename, None)
+        self._files.pop(filename).close()
+        self.closes += 1
+
+    def adopt(self, h5file):
+        """Add an already open read-only file to pool.
+
+        Parameters
+        ----------
+        h5file : :class:`h5py.File` object
+            Open file, which the pool may close from now on
+
+        Returns
+        -------
+        pooled_file : :class:`PooledFile` object
+            Proxy to file that reopens it as needed
+
+        """
+        filename = h5file.filename
+        with self._lock:
+            old_file = self._files.pop(filename, None)
+            if old_file is not None and old_file is not h5file:
+                # Replace an existing handle to the same file, which is closed as soon as it is not busy anymore
+                self._datasets.pop(filename, None)
+                if self._busy.get(filename):
+                    self._retired.setdefault(filename, []).append(old_file)
+                else:
+                    old_file.close()
+                    self.closes += 1
+            self._files[filename] = h5file
+            self._evict()
+        return PooledFile(self, h5file.filename)
+
+    @contextmanager
+    def lease(self, filename):
+        """Context manager that provides open file, which stays open while in use.
+
+        Parameters
+        ----------
+        filename : string
+            Name of HDF5 file (which is opened in read-only mode if necessary)
+
+        """
+        with self._lock:
+            h5file = self._files.pop(filename, None)
+            if h5file is None:
+                h5file = open_file(filename, 'r', self.h5_options)
+                self.opens += 1
+            # Mark file as most recently used
+            self._files[filename] = h5file
+            self._busy[filename] = self._busy.get(filename, 0) + 1
+            self._evict()
+        try:
+            yield h5file
+        finally:
+            with self._lock:
+                self._busy[filename] -= 1
+                if not self._busy[filename]:
+                    del self._busy[filename]
+                    for old_file in self._retired.pop(filename, []):
+                        old_file.close()
+                        self.closes += 1
+                self._evict()
+
+    def close(self):
+        """Close all files in pool that are not busy (they will be reopened as needed)."""
+        with self._lock:
+            for filename in list(self._files):
+                if not self._busy.get(filename):
+                    self._close(filename)
+
+    def dataset(self, h5file, name, chunk_cache=None):
+        """Dataset in leased file, which stays open with its chunk cache until the file is closed.
+
+        Parameters
+        ----------
+        h5file : :class:`h5py.File` object
+            File provided by :meth:`lease` (only use dataset during lease)
+        name : string
+            Name of dataset in file
+        chunk_cache : tuple of (int, int, float), or None, optional
+            Chunk cache settings (nslots, nbytes, w0), or None for default cache
+
+        Returns
+        -------
+        dataset : :class:`h5py.Dataset` object
+            Open dataset
+
+        """
+        key = (name, chunk_cache)
+        with self._lock:
+            datasets = self._datasets.setdefault(h5file.filename, {})
+            dataset = datasets.get(key)
+            if dataset is None:
+                dataset = datasets[key] = open_dataset(h5file, name, chunk_cache)
+        return dataset
+
+#--------------------------------------------------------------------------------------------------
+#--- CLASS :  PooledGroup
+#--------------------------------------------------------------------------------------------------
+
+class PooledGroup(object):
+    """Proxy to HDF5 group in file pool that reopens its file as needed.
+
+    Members of the group are returned as :class:`PooledGroup` and
+    :class:`PooledDataset` proxies, and its attributes as a dict, so that no
+    h5py object outlives the lease of its file (which the pool may close
+    afterwards). Any other attribute is looked up on the open group, and its
+    methods hold the lease for the duration of each call (e.g. `visititems`).
+
+    Parameters
+    ----------
+    file : :class:`PooledFile` object
+        Proxy to file containing group
+    name : string
+        Full path of group in file
+
+    """
+    def __init__(self, file, name):
+        self.file = file
+        self.name = name
+
+    def __repr__(self):
+        """Short human-friendly string representation of pooled group object."""
+        return "<katdal.%s '%s' in '%s' at 0x%x>" % (self.__class__.__name__, self.name, self.file.filename, id(self))
+
+    @contextmanager
+    def _open(self):
+        """Context manager that provides the open group, which stays open while in use."""
+        with self.file.pool.lease(self.file.filename) as h5file:
+            yield h5file[self.name]
+
+    def _proxy(self, obj):
+        """Replace h5py object that refers to file by proxy (call while file is leased)."""
+        if isinstance(obj, h5py.Dataset):
+            return PooledDataset(self.file, obj)
+        elif isinstance(obj, h5py.File):
+            return self.file
+        elif isinstance(obj, h5py.Group):
+            return PooledGroup(self.file, obj.name)
+        elif isinstance(obj, h5py.AttributeManager):
+            return dict(obj.items())
+        elif isinstance(obj, tuple):
+            return tuple([self._proxy(item) for item in obj])
+        elif isinstance(obj, (MappingView, list)):
+            return [self._proxy(item) for item in obj]
+        return obj
+
+    def __getitem__(self, name):
+        """Group or dataset in group as a proxy."""
+        with self._open() as group:
+            return self._proxy(group[name])
+
+    def __contains__(self, name):
+        """True if group contains object with the given name."""
+        with self._open() as group:
+            return name in group
+
+    def __len__(self):
+        """Number of members of group."""
+        with self._open() as group:
+            return len(group)
+
+    def __iter__(self):
+        """Iterate over names of group members."""
+        with self._open() as group:
+            return iter(list(group))
+
+    @property
+    def attrs(self):
+        """Attributes of group as a dict."""
+        with self._open() as group:
+            return self._proxy(group.attrs)
+
+    def __getattr__(self, name):
+        """Look up any other attribute on open group (methods hold the lease for the duration of each call)."""
+        # Avoid recursion on private or special attributes (e.g. while copying or before initialisation)
+        if name.startswith('_'):
+            raise AttributeError(name)
+        with self._open() as group:
+            value = getattr(group, name)
+            if not callable(value):
+                return self._proxy(value)
+        def method(*args, **kwargs):
+            with self._open() as group:
+                return self._proxy(getattr(group, name)(*args, **kwargs))
+        method.__name__, method.__doc__ = name, value.__doc__
+        return method
+
+#--------------------------------------------------------------------------------------------------
+#--- CLASS :  PooledFile
+#--------------------------------------------------------------------------------------------------
+
+class PooledFile(PooledGroup):
+    """Proxy to HDF5 file in file pool that reopens the file as needed.
+
+    Groups and datasets in the file are returned as :class:`PooledGroup` and
+    :class:`PooledDataset` proxies that stay valid after the file is closed
+    (see :class:`PooledGroup` for the rest of the interface).
+
+    Parameters
+    ----------
+    pool : :class:`FilePool` object
+        File pool that manages the underlying file
+    filename : string
+        Name of HDF5 file
+
+    """
+    def __init__(self, pool, filename):
+        PooledGroup.__init__(self, self, '/')
+        self.pool = pool
+        self.filename = filename
+        self.mode = 'r'
+
+    def __repr__(self):
+        """Short human-friendly string representation of pooled file object."""
+        return "<katdal.%s '%s' at 0x%x>" % (self.__class__.__name__, self.filename, id(self))
+
+    def pooled(self, dataset):
+        """Replace dataset in this file by a :class:`PooledDataset` proxy.
+
+        Parameters
+        ----------
+        dataset : :class:`h5py.Dataset` object or equivalent
+            Dataset, which is returned as is if it does not belong to this file
+
+        Returns
+        -------
+        dataset : :class:`PooledDataset` object or equivalent
+            Proxy to dataset if it belongs to this file, otherwise `dataset`
+
+        """
+        if not isinstance(dataset, h5py.Dataset) or dataset.file.filename != self.filename:
+            return dataset
+        return PooledDataset(self, dataset)
+
+#--------------------------------------------------------------------------------------------------
+#--- CLASS :  PooledDataset
+#--------------------------------------------------------------------------------------------------
+
+class PooledDataset(object):
+    """Proxy to HDF5 dataset in file pool that reopens its file as needed.
+
+    This supports the parts of the :class:`h5py.Dataset` interface used by
+    katdal (shape, dtype, chunks, len and indexing). The static properties are
+    kept on the proxy, so that only actual data access touches the file.
+    The dataset is reopened with the same chunk cache settings as the
+    original dataset (see :func:`open_tuned_dataset`) and then kept open by
+    the pool along with its file, so that the chunk cache persists between
+    reads until the file is closed.
+
+    Parameters
+    ----------
+    file : :class:`PooledFile` object
+        Proxy to file containing dataset
+    dataset : :class:`h5py.Dataset` object
+        Dataset in open file
+
+    """
+    def __init__(self, file, dataset):
+        self.file = file
+        self.name = dataset.name
+        self.shape = dataset.shape
+        self.dtype = dataset.dtype
+        self.chunks = dataset.chunks
+        self.chunk_cache = dataset_chunk_cache(dataset)
+
+    def __repr__(self):
+        """Short human-friendly string representation of pooled dataset object."""
+        return "<katdal.%s '%s' in '%s' shape %s type '%s' at 0x%x>" % \
+               (self.__class__.__name__, self.name, self.file.filename, self.shape, self.dtype, id(self))
+
+    def __len__(self):
+        """Length of first dimension of dataset."""
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        """Read data from dataset, reopening its file if necessary."""
+        with self.file.pool.lease(self.file.filename) as h5file:
+            return self.file.pool.dataset(h5file, self.name, self.chunk_cache)[key]
+
+    def __iter__(self):
+        """Iterate over first dimension of dataset (reads the whole dataset)."""
+        return iter(self[()] if self.shape == () else self[:])
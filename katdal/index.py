@@ -0,0 +1,293 @@
+"""Catalogue database that summarises a large collection of data files.
+
+Listing an archive of thousands of data files by opening each one in turn is
+slow. This module extracts the summary of each file (the fields displayed by
+the h5list script) in parallel and stores it in a local SQLite database, which
+is updated incrementally as files are added or modified. The database can then
+be queried by target, time range or antenna without touching the data files.
+
+Typical use::
+
+  import katdal.index
+  katdal.index.build(['/data/archive'], 'archive.db')
+  for row in katdal.index.query('archive.db', target='PKS 1934-63'):
+      print row['path'], row['scans']
+
+"""
+
+import os
+import glob
+import time
+import sqlite3
+import logging
+import multiprocessing
+
+import katpoint
+
+import katdal
+
+logger = logging.getLogger(__name__)
+
+# Version of database layout (bump this to rebuild all existing databases from scratch)
+INDEX_VERSION = 1
+
+# Summary fields stored per file (in addition to lists of antennas and targets)
+SUMMARY_FIELDS = ('version', 'observer', 'start_time', 'end_time', 'dumps', 'channels', 'corrprods',
+                  'data_size', 'dump_rate', 'spws', 'centre_freq', 'scans', 'description')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, file_size INTEGER, mtime REAL, error TEXT,
+                                  version TEXT, observer TEXT, start_time REAL, end_time REAL,
+                                  dumps INTEGER, channels INTEGER, corrprods INTEGER, data_size INTEGER,
+                                  dump_rate REAL, spws INTEGER, centre_freq REAL, scans INTEGER,
+                                  description TEXT);
+CREATE TABLE IF NOT EXISTS antennas (path TEXT, name TEXT);
+CREATE TABLE IF NOT EXISTS targets (path TEXT, name TEXT);
+CREATE INDEX IF NOT EXISTS antennas_name ON antennas (name);
+CREATE INDEX IF NOT EXISTS antennas_path ON antennas (path);
+CREATE INDEX IF NOT EXISTS targets_name ON targets (name);
+CREATE INDEX IF NOT EXISTS targets_path ON targets (path);
+CREATE INDEX IF NOT EXISTS files_time ON files (start_time, end_time);
+"""
+
+#--------------------------------------------------------------------------------------------------
+#--- Utility functions :  Extracting summaries
+#--------------------------------------------------------------------------------------------------
+
+
+def find_files(args, extension='.h5'):
+    """Turn list of files, globs and directories into list of data files.
+
+    Parameters
+    ----------
+    args : sequence of strings
+        Individual file names, glob patterns and/or directories (which are
+        searched recursively)
+    extension : string, optional
+        Extension of data files to look for in globs and directories
+
+    Returns
+    -------
+    files : list of strings
+        List of data file names
+
+    """
+    files = []
+    for arg in args:
+        if '*' in arg:
+            files.extend([name for name in sorted(glob.glob(arg)) if name.endswith(extension)])
+        elif arg.endswith(extension):
+            files.append(arg)
+        else:
+            for rootdir, subdirs, dirfiles in os.walk(arg):
+                files.extend([os.path.join(rootdir, name) for name in sorted(dirfiles) if name.endswith(extension)])
+    return files
+
+
+def summarise(filename):
+    """Open data file and extract its summary.
+
+    Parameters
+    ----------
+    filename : string
+        Name of data file
+
+    Returns
+    -------
+    summary : dict
+        Summary fields (see :const:`SUMMARY_FIELDS`), plus the names of
+        antennas in 'antennas' and of targets in 'targets'
+
+    """
+    d = katdal.open(filename, quicklook=True)
+    try:
+        spw = d.spectral_windows[d.spw]
+        return {'version': d.version, 'observer': d.observer, 'description': d.description,
+                'start_time': d.start_time.secs, 'end_time': d.end_time.secs,
+                'dumps': d.shape[0], 'channels': d.shape[1], 'corrprods': d.shape[2],
+                'data_size': int(d.size), 'dump_rate': 1.0 / d.dump_period,
+                'spws': len(d.spectral_windows), 'centre_freq': spw.centre_freq,
+                'scans': len(d.scan_indices), 'antennas': [ant.name for ant in d.ants],
+                'targets': [target.name for target in d.catalogue.targets]}
+    finally:
+        del d
+
+
+def _summarise_file(args):
+    """Summarise a single file in worker process, catching any errors."""
+    path, file_size, mtime = args
+    try:
+        return path, file_size, mtime, summarise(path), None
+    except Exception, e:
+        return path, file_size, mtime, None, '%s - %s' % (e.__class__.__name__, e)
+
+#--------------------------------------------------------------------------------------------------
+#--- Utility functions :  Building and querying the database
+#--------------------------------------------------------------------------------------------------
+
+
+def connect(database):
+    """Connect to catalogue database, creating it if necessary.
+
+    Parameters
+    ----------
+    database : string
+        Name of SQLite database file
+
+    Returns
+    -------
+    connection : :class:`sqlite3.Connection` object
+        Connection to database, with rows that can be indexed by column name
+
+    """
+    connection = sqlite3.connect(database)
+    connection.row_factory = sqlite3.Row
+    version = connection.execute('PRAGMA user_version').fetchone()[0]
+    if version != INDEX_VERSION:
+        # Outdated layout: start from scratch, as the database is only a cache of the data files
+        connection.executescript('DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS antennas; '
+                                 'DROP TABLE IF EXISTS targets;')
+        connection.execute('PRAGMA user_version = %d' % (INDEX_VERSION,))
+    connection.executescript(_SCHEMA)
+    return connection
+
+
+def build(paths, database='katdal_index.db', workers=None, prune=False):
+    """Add data files to catalogue database, only summarising new or modified files.
+
+    Each file is summarised by opening it in a separate worker process, which
+    is the expensive part. Files whose size and modification time match their
+    database entries are skipped, so that rebuilding the database after adding
+    a few files to an archive is quick. Files that cannot be opened are also
+    recorded (with the error in the 'error' column) to avoid retrying them
+    until they change.
+
+    Parameters
+    ----------
+    paths : string or sequence of strings
+        Data files, glob patterns and/or directories (searched recursively)
+    database : string, optional
+        Name of SQLite database file
+    workers : int or None, optional
+        Number of worker processes that open files in parallel (defaults to
+        the number of CPUs; 1 opens files serially in this process)
+    prune : {False, True}, optional
+        True to remove database entries of files that no longer exist
+
+    Returns
+    -------
+    updated : int
+        Number of files that were (re)summarised
+
+    """
+    paths = [paths] if isinstance(paths, basestring) else paths
+    files = [os.path.abspath(f) for f in find_files(paths)]
+    connection = connect(database)
+    known = dict((row['path'], (row['file_size'], row['mtime']))
+                 for row in connection.execute('SELECT path, file_size, mtime FROM files'))
+    jobs = []
+    for path in files:
+        stat = os.stat(path)
+        if known.get(path) != (stat.st_size, stat.st_mtime):
+            jobs.append((path, stat.st_size, stat.st_mtime))
+    workers = multiprocessing.cpu_count() if workers is None else max(int(workers), 1)
+    start = time.time()
+    if workers > 1 and len(jobs) > 1:
+        pool = multiprocessing.Pool(min(workers, len(jobs)))
+        results = pool.imap_unordered(_summarise_file, jobs)
+    else:
+        pool, results = None, (_summarise_file(job) for job in jobs)
+    try:
+        for path, file_size, mtime, summary, error in results:
+            if error:
+                logger.warning("Could not index '%s': %s" % (path, error))
+            summary = {} if summary is None else summary
+            with connection:
+                connection.execute('DELETE FROM files WHERE path = ?', (path,))
+                connection.execute('DELETE FROM antennas WHERE path = ?', (path,))
+                connection.execute('DELETE FROM targets WHERE path = ?', (path,))
+                connection.execute('INSERT INTO files (path, file_size, mtime, error, %s) VALUES (?, ?, ?, ?, %s)' %
+                                   (', '.join(SUMMARY_FIELDS), ', '.join(['?'] * len(SUMMARY_FIELDS))),
+                                   [path, file_size, mtime, error] + [summary.get(f) for f in SUMMARY_FIELDS])
+                connection.executemany('INSERT INTO antennas VALUES (?, ?)',
+                                       [(path, ant) for ant in summary.get('antennas', [])])
+                connection.executemany('INSERT INTO targets VALUES (?, ?)',
+                                       [(path, target) for target in summary.get('targets', [])])
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    if prune:
+        with connection:
+            for path in known:
+                if not os.path.exists(path):
+                    for table in ('files', 'antennas', 'targets'):
+                        connection.execute('DELETE FROM %s WHERE path = ?' % (table,), (path,))
+    connection.close()
+    logger.debug("Indexed %d of %d files in '%s' in %.2f seconds" %
+                 (len(jobs), len(files), database, time.time() - start))
+    return len(jobs)
+
+
+def query(database, target=None, start=None, end=None, antenna=None, paths=None, errors=False):
+    """Look up data files in catalogue database.
+
+    All criteria are optional and combined, so that calling this without
+    criteria returns all successfully indexed files.
+
+    Parameters
+    ----------
+    database : string
+        Name of SQLite database file
+    target : string, optional
+        Only return files containing a target with this name
+    start, end : :class:`katpoint.Timestamp` object or equivalent, optional
+        Only return files that overlap with this time range (either end may be
+        open-ended)
+    antenna : string, optional
+        Only return files containing an antenna with this name
+    paths : sequence of strings, optional
+        Only return these files (e.g. the result of :func:`find_files`)
+    errors : {False, True}, optional
+        True to also return files that could not be opened
+
+    Returns
+    -------
+    rows : list of dicts
+        Summary of each matching file (see :const:`SUMMARY_FIELDS`), ordered by
+        start time, with extra 'path', 'file_size', 'mtime' and 'error' entries
+        as well as lists of names in 'antennas' and 'targets'
+
+    """
+    clauses, args = [], []
+    if not errors:
+        clauses.append('error IS NULL')
+    if target is not None:
+        clauses.append('path IN (SELECT path FROM targets WHERE name = ?)')
+        args.append(target)
+    if antenna is not None:
+        clauses.append('path IN (SELECT path FROM antennas WHERE name = ?)')
+        args.append(antenna)
+    if start is not None:
+        clauses.append('end_time >= ?')
+        args.append(katpoint.Timestamp(start).secs)
+    if end is not None:
+        clauses.append('start_time <= ?')
+        args.append(katpoint.Timestamp(end).secs)
+    connection = connect(database)
+    try:
+        rows = connection.execute('SELECT * FROM files%s ORDER BY start_time, path' %
+                                  ((' WHERE ' + ' AND '.join(clauses)) if clauses else ''), args).fetchall()
+        wanted = None if paths is None else set(os.path.abspath(f) for f in paths)
+        summaries = []
+        for row in rows:
+            if wanted is not None and row['path'] not in wanted:
+                continue
+            summary = dict(zip(row.keys(), row))
+            for table in ('antennas', 'targets'):
+                summary[table] = [name for (name,) in connection.execute('SELECT name FROM %s WHERE path = ?'
+                                                                         % (table,), (row['path'],))]
+            summaries.append(summary)
+        return summaries
+    finally:
+        connection.close()
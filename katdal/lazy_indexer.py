@@ -1,8 +1,17 @@
 """Two-stage deferred indexer for objects with expensive __getitem__ calls."""
 
-import numpy as np
+import os
+import time
+import json
+import atexit
+import weakref
+import threading
+import itertools
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
 
-#TODO support advanced integer indexing with non-strictly increasing indices (i.e. out-of-order and duplicates)
+import numpy as np
 
 #--------------------------------------------------------------------------------------------------
 #--- CLASS :  LazyTransform
@@ -29,6 +38,15 @@ class LazyTransform(object):
     indexing on these dimensions. The data type (aka `dtype`) is allowed to
     change.
 
+    A transform that operates on each element of the preserved dimensions
+    independently (and ignores `keep`) may declare itself *chunkwise*. The
+    indexer then fuses a leading run of chunkwise transforms with the dataset
+    reads, applying them to each segment as it is read and writing the result
+    straight into the output array. This avoids full-size temporary arrays.
+    A transform that merely returns a view of its input (i.e. copies no data)
+    may declare itself *view-only*, in which case it is cheaper to apply it
+    once to the whole array than to fuse it.
+
     Parameters
     ----------
     name : string or None, optional
@@ -41,13 +59,20 @@ class LazyTransform(object):
         Restrictions apply as described above.
     dtype : :class:`numpy.dtype` object or equivalent or None, optional
         Type of output array after transformation (None if same as input array)
+    chunkwise : {False, True}, optional
+        True if transform may be applied to separate segments of the data
+    view : {False, True}, optional
+        True if transform returns a view of its input without copying data
 
     """
-    def __init__(self, name=None, transform=lambda d, k: d, new_shape=lambda s: tuple(s), dtype=None):
+    def __init__(self, name=None, transform=lambda d, k: d, new_shape=lambda s: tuple(s), dtype=None,
+                 chunkwise=False, view=False):
         self.name = 'unnamed' if name is None else name
         self.transform = transform
         self.new_shape = new_shape
         self.dtype = np.dtype(dtype) if dtype is not None else None
+        self.chunkwise = chunkwise
+        self.view = view
 
     def __repr__(self):
         """Short human-friendly string representation of lazy transform object."""
@@ -58,6 +83,1091 @@ class LazyTransform(object):
         """Transform data (`keep` is user-specified second-stage index)."""
         return self.transform(data, keep)
 
+#--------------------------------------------------------------------------------------------------
+#--- CLASS :  CostModel
+#--------------------------------------------------------------------------------------------------
+
+class CostModel(object):
+    """Simple model of the time it takes to read data from a dataset.
+
+    Each read (hyperslab selection) is assumed to take a fixed time (the
+    per-read latency, covering the HDF5 library overhead and disk seeks) plus
+    the time to transfer its bytes at a fixed bandwidth. When two segments of
+    a selection are separated by a gap, it is therefore faster to read them
+    with a single spanning read (and discard the gap afterwards) if
+    transferring the gap takes less time than the latency of a second read.
+    For chunked datasets the gap is measured in whole chunks, as chunks are
+    always read in full.
+
+    The default parameters are generic. Use :meth:`calibrate` to measure them
+    on a given file, :meth:`save` / :meth:`load` to store them and
+    :func:`set_cost_model` to make lazy indexers use them.
+
+    Parameters
+    ----------
+    latency : float, optional
+        Fixed time taken by each read, in seconds
+    bandwidth : float, optional
+        Rate at which data are transferred, in bytes per second
+
+    """
+    def __init__(self, latency=5e-4, bandwidth=2e8):
+        self.latency = float(latency)
+        self.bandwidth = float(bandwidth)
+
+    def __repr__(self):
+        """Short human-friendly string representation of cost model object."""
+        return "<katdal.%s latency=%.3g s bandwidth=%.3g MB/s at 0x%x>" % \
+               (self.__class__.__name__, self.latency, self.bandwidth / 1e6, id(self))
+
+    def read_time(self, num_reads, num_bytes):
+        """Predicted time taken by a number of reads transferring a number of bytes, in seconds."""
+        return num_reads * self.latency + num_bytes / self.bandwidth
+
+    def merge_gap(self, gap_bytes):
+        """True if it is faster to read across a gap of `gap_bytes` bytes than to start a new read."""
+        return gap_bytes < self.latency * self.bandwidth
+
+    @classmethod
+    def calibrate(cls, dataset, num_reads=20, max_bytes=64 * 1024 ** 2):
+        """Measure per-read latency and bandwidth on a dataset.
+
+        The latency is the median time taken by single-element reads at random
+        positions in the dataset (which read whole chunks for chunked
+        datasets). The bandwidth is based on a single large read along the
+        first dimension of the dataset.
+
+        Parameters
+        ----------
+        dataset : :class:`h5py.Dataset` object or equivalent
+            Dataset to measure (preferably a large dataset on the target storage)
+        num_reads : int, optional
+            Number of single-element reads used to measure latency
+        max_bytes : int, optional
+            Maximum number of bytes transferred by the bandwidth measurement
+
+        Returns
+        -------
+        model : :class:`CostModel` object
+            Cost model with measured parameters
+
+        """
+        shape, itemsize = dataset.shape, dataset.dtype.itemsize
+        rs = np.random.RandomState()
+        elapsed = []
+        for n in range(num_reads):
+            index = tuple([rs.randint(dim_len) for dim_len in shape])
+            start = time.time()
+            dataset[index]
+            elapsed.append(time.time() - start)
+        latency = np.median(elapsed)
+        row_bytes = itemsize * int(np.prod(shape[1:]))
+        num_rows = int(min(max(max_bytes // max(row_bytes, 1), 1), shape[0]))
+        row_start = rs.randint(shape[0] - num_rows + 1)
+        start = time.time()
+        dataset[row_start:row_start + num_rows]
+        transfer_time = max(time.time() - start - latency, 1e-6)
+        return cls(latency, num_rows * row_bytes / transfer_time)
+
+    def save(self, filename):
+        """Store model parameters in JSON file."""
+        with open(filename, 'w') as f:
+            json.dump({'latency': self.latency, 'bandwidth': self.bandwidth}, f)
+
+    @classmethod
+    def load(cls, filename):
+        """Create cost model from parameters stored in JSON file."""
+        with open(filename) as f:
+            return cls(**json.load(f))
+
+
+# Cost model used by lazy indexers by default, and cost models for specific files, keyed by file name
+_default_cost_model = CostModel()
+_file_cost_models = {}
+
+
+def set_cost_model(model, filename=None):
+    """Set the cost model used to plan reads on datasets.
+
+    Parameters
+    ----------
+    model : :class:`CostModel` object or None
+        Cost model (None removes the model of the given file, or restores the
+        generic default model if no file is given)
+    filename : string or None, optional
+        Name of HDF5 file to which model applies (default is all files)
+
+    """
+    global _default_cost_model
+    if filename is None:
+        _default_cost_model = model if model is not None else CostModel()
+    elif model is None:
+        _file_cost_models.pop(os.path.abspath(filename), None)
+    else:
+        _file_cost_models[os.path.abspath(filename)] = model
+
+
+def get_cost_model(dataset=None):
+    """Cost model used to plan reads on a dataset (or the default model if None)."""
+    filename = getattr(getattr(dataset, 'file', None), 'filename', None)
+    return _file_cost_models.get(os.path.abspath(filename), _default_cost_model) if filename else \
+           _default_cost_model
+
+#--------------------------------------------------------------------------------------------------
+#--- CLASS :  IOStats
+#--------------------------------------------------------------------------------------------------
+
+class IOStats(object):
+    """Counters of the I/O activity of lazy indexers.
+
+    Each lazy indexer keeps its counters in an :class:`IOStats` object, which
+    may forward them to a parent object (e.g. the stats of the data set that
+    owns the indexer) in order to aggregate activity. An optional hook
+    function is called with the counters of each indexer call as it is
+    recorded, which makes it possible to log them.
+
+    Parameters
+    ----------
+    parent : :class:`IOStats` object or None, optional
+        Object that aggregates these counters with those of other indexers
+    hook : function, signature ``hook(stats)``, or None, optional
+        Function called with :class:`IOStats` object of each recorded call
+
+    Attributes
+    ----------
+    calls : int
+        Number of indexer calls (i.e. extracted arrays)
+    reads : int
+        Number of dataset reads (hyperslab selections)
+    bytes_read : int
+        Number of bytes requested from dataset (before post-selection)
+    bytes_returned : int
+        Number of bytes in the extracted arrays returned to caller
+    bytes_allocated : int
+        Number of bytes in arrays allocated by indexers (outputs and temporaries)
+    read_time : float
+        Wall time spent reading datasets, in seconds (summed over threads)
+    transform_time : float
+        Wall time spent in transforms, in seconds (summed over threads)
+    total_time : float
+        Wall time spent in indexer calls, in seconds
+
+    """
+    counters = ('calls', 'reads', 'bytes_read', 'bytes_returned', 'bytes_allocated',
+                'read_time', 'transform_time', 'total_time')
+    # Counters describing work done on datasets (as opposed to the calls themselves)
+    io_counters = ('reads', 'bytes_read', 'bytes_allocated', 'read_time', 'transform_time')
+
+    def __init__(self, parent=None, hook=None):
+        self.parent = parent
+        self.hook = hook
+        self._lock = threading.Lock()
+        self.reset()
+
+    def __repr__(self):
+        """Short human-friendly string representation of I/O stats object."""
+        return "<katdal.%s calls=%d reads=%d read=%d bytes returned=%d bytes read_time=%.3f s " \
+               "transform_time=%.3f s at 0x%x>" % (self.__class__.__name__, self.calls, self.reads,
+                                                    self.bytes_read, self.bytes_returned, self.read_time,
+                                                    self.transform_time, id(self))
+
+    def reset(self):
+        """Set all counters to zero."""
+        with self._lock:
+            for name in self.counters:
+                setattr(self, name, 0.0 if name.endswith('_time') else 0)
+
+    def as_dict(self):
+        """Counters as a dict mapping counter name to value."""
+        return dict([(name, getattr(self, name)) for name in self.counters])
+
+    def add(self, **kwargs):
+        """Increment the given counters (thread-safe)."""
+        with self._lock:
+            for name, value in kwargs.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def update(self, stats, counters=None):
+        """Add the counters of another :class:`IOStats` object to these counters.
+
+        The counters are also forwarded to the parent object, and the hook
+        function is called with `stats` (unless only a subset of counters is
+        added).
+
+        Parameters
+        ----------
+        stats : :class:`IOStats` object
+            Counters to add (typically those of a single indexer call)
+        counters : sequence of string or None, optional
+            Names of counters to add (default is all of them)
+
+        """
+        self.add(**dict([(name, getattr(stats, name)) for name in (counters or self.counters)]))
+        if self.parent is not None:
+            self.parent.update(stats, counters)
+        if self.hook is not None and counters is None:
+            self.hook(stats)
+
+
+def _hyperslab_size(dataset_select, shape):
+    """Number of elements in hyperslab selected by tuple of scalars and slices."""
+    return int(np.prod([(len(range(*s.indices(dim_len))) if isinstance(s, slice) else 1)
+                        for s, dim_len in zip(dataset_select, shape)]))
+
+#--------------------------------------------------------------------------------------------------
+#--- CLASS :  ReadPlan
+#--------------------------------------------------------------------------------------------------
+
+def _chunks_spanned(select, chunk_len):
+    """Number of chunks of length `chunk_len` touched by scalar or slice `select`."""
+    if not isinstance(select, slice):
+        return 1
+    start, stop, stride = select.start, select.stop, select.step
+    if stop <= start:
+        return 0
+    if stride == 1:
+        return (stop - 1) // chunk_len - start // chunk_len + 1
+    return len(np.unique(np.arange(start, stop, stride) // chunk_len))
+
+
+def _plan_dimension(dim_keep, dim_len, chunk_len=None, row_bytes=0, cost_model=None):
+    """Split the selection along a single dimension into dataset reads.
+
+    Segments separated by a gap are merged into a single spanning read
+    followed by post-selection if the cost model predicts this to be faster.
+
+    Parameters
+    ----------
+    dim_keep : int or slice or sequence of int or sequence of bool
+        Selection on this dimension, in terms of original dataset indices
+        (integer indices have to be strictly increasing)
+    dim_len : int
+        Length of dataset dimension
+    chunk_len : int or None, optional
+        Length of HDF5 chunk along this dimension (None if dataset is contiguous)
+    row_bytes : int, optional
+        Estimated number of bytes read per index along this dimension
+    cost_model : :class:`CostModel` object or None, optional
+        Model that decides on merging segments (default model if None)
+
+    Returns
+    -------
+    segments : list of tuples of 3 elements
+        List of segments, each represented by a tuple containing
+        (dataset selection, post-selection, output array selection)
+    segment_sizes : list of int
+        List of segment lengths (empty list for scalar-selected dimension)
+
+    """
+    if np.isscalar(dim_keep):
+        # If selection is a scalar, pass directly to dataset selector and remove dimension from output
+        return [(dim_keep, None, None)], []
+    elif isinstance(dim_keep, slice):
+        # If selection is a slice, pass directly to dataset selector without post-selection
+        start, stop, stride = dim_keep.indices(dim_len)
+        segm_size = len(range(start, stop, stride))
+        return [(slice(start, stop, stride), slice(None), slice(0, segm_size, 1))], [segm_size]
+    elif len(dim_keep) == 0:
+        # If selection is empty, pass to post-selector, as HDF5 datasets do not support zero-length selection
+        return [(slice(0, 1, 1), slice(0, 0, 1), slice(0, 0, 1))], [0]
+    # Anything else is advanced indexing via bool or integer sequences
+    dim_keep = np.atleast_1d(dim_keep)
+    # Turn boolean mask into integer indices (True means keep that index)
+    if dim_keep.dtype == np.bool and len(dim_keep) == dim_len:
+        dim_keep = np.nonzero(dim_keep)[0]
+    # Split indices into multiple contiguous segments (specified by first and one-past-last data indices)
+    jumps = np.nonzero(np.diff(dim_keep) > 1)[0]
+    first = [dim_keep[0]] + dim_keep[jumps + 1].tolist()
+    last = dim_keep[jumps].tolist() + [dim_keep[-1]]
+    segments = np.c_[first, np.array(last) + 1]
+    cost_model = cost_model if cost_model is not None else _default_cost_model
+    if chunk_len:
+        # On a chunked dataset, the gap between segments consists of the chunks that are not touched by either
+        # segment, as whole chunks have to be read and decompressed anyway (segments sharing chunks always merge)
+        first_chunk, last_chunk = segments[:, 0] // chunk_len, (segments[:, 1] - 1) // chunk_len
+        gap_bytes = (first_chunk[1:] - last_chunk[:-1] - 1) * chunk_len * row_bytes
+    else:
+        gap_bytes = (segments[1:, 0] - segments[:-1, 1]) * row_bytes
+    # Group segments if it is cheaper to read across the gap between them than to start a new read, so that
+    # each group becomes a single read spanning its segments followed by post-selection of the ndarray
+    new_group = np.r_[True, [not cost_model.merge_gap(gap) for gap in gap_bytes]]
+    group_starts = np.nonzero(new_group)[0]
+    group_ends = np.r_[group_starts[1:], len(segments)]
+    # Construct contiguous output slices of the appropriate group sizes
+    index_starts = np.r_[0, np.cumsum(segments[:, 1] - segments[:, 0])]
+    dim_select, segm_sizes = [], []
+    for group_start, group_end in zip(group_starts, group_ends):
+        start, end = segments[group_start, 0], segments[group_end - 1, 1]
+        out_start, out_end = index_starts[group_start], index_starts[group_end]
+        # Only do post-selection if the group consists of more than one segment
+        post_select = slice(None) if group_end - group_start == 1 else dim_keep[out_start:out_end] - start
+        dim_select.append((slice(start, end, 1), post_select, slice(out_start, out_end, 1)))
+        segm_sizes.append(out_end - out_start)
+    return dim_select, segm_sizes
+
+
+class ReadPlan(object):
+    """Plan of dataset reads needed to extract a selection from a dataset.
+
+    The selection on each dimension is split into segments, and each dataset
+    read is the combination of one segment per dimension (i.e. the reads form
+    a dense N-dimensional grid). For chunked HDF5 datasets, segments that share
+    chunks (or occupy adjacent chunks) are merged into a single spanning read
+    followed by post-selection, so that each chunk is only touched once per
+    dimension. Segments separated by larger gaps are merged if a
+    :class:`CostModel` predicts that reading across the gap is faster than
+    starting a new read (this applies to contiguous datasets as well).
+
+    Integer indices that are unsorted or contain duplicates are sorted and
+    deduplicated first, so that each selected element is only read once. The
+    extracted array is then reordered to match the original indices via
+    :meth:`reorder`.
+
+    Parameters
+    ----------
+    dataset : :class:`h5py.Dataset` object or equivalent
+        Underlying dataset (with `shape`, `dtype` and optional `chunks` members)
+    keep : list of int or slice or sequence of int or sequence of bool
+        Selection in terms of original dataset indices, one item per dimension
+    cost_model : :class:`CostModel` object or None, optional
+        Model that decides on merging segments (default is the model
+        registered for the dataset's file via :func:`set_cost_model`)
+
+    Attributes
+    ----------
+    selection : list of lists of tuples
+        Segments per dimension, each a tuple of 3 elements:
+        (dataset selection, post-selection, output array selection)
+    segment_sizes : list of lists of int
+        Segment lengths per dimension (empty lists for scalar-selected dimensions)
+    read_shape : tuple of int
+        Shape of array assembled from reads, before reordering
+    output_shape : tuple of int
+        Shape of extracted array before any transformation
+    reordering : list of (int, array of int) pairs
+        Axis of assembled array and indices of unique elements along it that
+        restore the original order of unsorted or duplicate integer indices
+    chunk_shape : tuple of int or None
+        Shape of HDF5 chunks of dataset (None if dataset is contiguous)
+    num_reads : int
+        Number of separate reads (hyperslab selections) done on dataset
+    chunks_touched : int or None
+        Number of distinct chunks touched by reads (None if dataset contiguous)
+    chunk_reads : int or None
+        Number of chunk accesses, counting repeated accesses of the same chunk
+        by different reads (None if dataset is contiguous)
+    bytes_read : int
+        Number of bytes read from dataset (full chunks for chunked datasets,
+        otherwise the hyperslabs that are read)
+    bytes_returned : int
+        Number of bytes in extracted array (before any transformation)
+
+    """
+    def __init__(self, dataset, keep, cost_model=None):
+        shape = dataset.shape
+        self.chunk_shape = chunks = getattr(dataset, 'chunks', None)
+        itemsize = dataset.dtype.itemsize
+        dim_chunks = chunks if chunks else [None] * len(shape)
+        cost_model = cost_model if cost_model is not None else get_cost_model(dataset)
+        self.selection, self.segment_sizes, self.reordering = [], [], []
+        keep = list(keep)
+        for dim, (dim_keep, dim_len) in enumerate(zip(keep, shape)):
+            if not np.isscalar(dim_keep) and not isinstance(dim_keep, slice):
+                keep[dim] = np.atleast_1d(dim_keep)
+                # Turn boolean mask into integer indices (True means keep that index)
+                if keep[dim].dtype == np.bool and len(keep[dim]) == dim_len:
+                    keep[dim] = np.nonzero(keep[dim])[0]
+        # Estimate the number of indices read along each dimension (whole chunks for chunked datasets)
+        dim_reads = []
+        for dim_keep, dim_len, chunk_len in zip(keep, shape, dim_chunks):
+            indices = np.atleast_1d(np.arange(dim_len)[dim_keep]) if isinstance(dim_keep, slice) else \
+                      np.atleast_1d(dim_keep)
+            dim_reads.append(min(len(np.unique(indices // chunk_len)) * chunk_len, dim_len) if chunk_len
+                             else len(indices))
+        output_shape = []
+        for dim, (dim_keep, dim_len, chunk_len) in enumerate(zip(keep, shape, dim_chunks)):
+            if not np.isscalar(dim_keep) and not isinstance(dim_keep, slice):
+                # Sort and deduplicate integer indices, and remember how to undo this afterwards
+                if dim_keep.dtype != np.bool and np.any(np.diff(dim_keep) <= 0):
+                    dim_keep, inverse = np.unique(dim_keep, return_inverse=True)
+                    self.reordering.append((len(output_shape), inverse))
+            row_bytes = itemsize * int(np.prod(dim_reads[:dim] + dim_reads[dim + 1:]))
+            dim_select, segm_sizes = _plan_dimension(dim_keep, dim_len, chunk_len, row_bytes, cost_model)
+            self.selection.append(dim_select)
+            self.segment_sizes.append(segm_sizes)
+            if segm_sizes:
+                output_shape.append(int(np.sum(segm_sizes)))
+        self.read_shape = tuple(output_shape)
+        for axis, inverse in self.reordering:
+            output_shape[axis] = len(inverse)
+        self.output_shape = tuple(output_shape)
+        self.num_reads = int(np.prod([len(select) for select in self.selection]))
+        self.bytes_returned = int(np.prod(self.output_shape)) * itemsize
+        # Length of each read along each dimension (scalars count as 1)
+        read_lens = [[(len(range(s.start, s.stop, s.step)) if isinstance(s, slice) else 1) for s, p, o in select]
+                     for select in self.selection]
+        if chunks:
+            # Chunks spanned by each read along each dimension
+            read_chunks = [[_chunks_spanned(s, chunk_len) for s, p, o in select]
+                           for select, chunk_len in zip(self.selection, chunks)]
+            self.chunk_reads = int(np.prod([np.sum(dim_chunks) for dim_chunks in read_chunks]))
+            # Segments along a dimension only share chunks if they are not grouped (e.g. strided slices)
+            distinct = []
+            for select, chunk_len in zip(self.selection, chunks):
+                chunk_ids = [np.arange(s.start, s.stop, s.step) // chunk_len if isinstance(s, slice)
+                             else [s // chunk_len] for s, p, o in select]
+                distinct.append(len(np.unique(np.concatenate(chunk_ids))))
+            self.chunks_touched = int(np.prod(distinct))
+            self.bytes_read = self.chunk_reads * int(np.prod(chunks)) * itemsize
+        else:
+            self.chunk_reads = self.chunks_touched = None
+            self.bytes_read = int(np.prod([np.sum(dim_lens) for dim_lens in read_lens])) * itemsize
+
+    def __repr__(self):
+        """Short human-friendly string representation of read plan object."""
+        return "<katdal.%s reads=%d chunks=%s read=%d bytes returned=%d bytes at 0x%x>" % \
+               (self.__class__.__name__, self.num_reads, self.chunks_touched,
+                self.bytes_read, self.bytes_returned, id(self))
+
+    @property
+    def amplification(self):
+        """Ratio of bytes read from dataset to bytes returned (inf if nothing returned)."""
+        return float(self.bytes_read) / self.bytes_returned if self.bytes_returned else np.inf
+
+    def reorder(self, data):
+        """Restore the original order of unsorted or duplicate integer indices.
+
+        Parameters
+        ----------
+        data : array
+            Array assembled from reads (with shape `read_shape` on its leading
+            dimensions, which may be followed by extra dimensions)
+
+        Returns
+        -------
+        data : array
+            Reordered array (with shape `output_shape` on leading dimensions)
+
+        """
+        for axis, inverse in self.reordering:
+            data = data.take(inverse, axis=axis)
+        return data
+
+    def reads(self):
+        """Generator that iterates through the planned dataset reads.
+
+        Yields
+        ------
+        dataset_select : tuple of int or slice
+            Selection on dataset (only scalars and slices, no advanced indexing)
+        post_select : tuple of slice or array of int
+            Post-selection on extracted array, one per non-scalar dimension
+        out_select : tuple of slice
+            Selection on output array where post-selected data will be inserted
+
+        """
+        # Use dense N-dimensional meshgrid to slice data set into chunks, based on segments along each dimension
+        chunk_indices = np.mgrid[[slice(0, len(select), 1) for select in self.selection]]
+        for chunk_index in chunk_indices.reshape(len(self.selection), -1).T:
+            segments = [select[segment] for select, segment in zip(self.selection, chunk_index)]
+            dataset_select = tuple([segment[0] for segment in segments])
+            # If any dimensions were dropped due to scalar indexing, drop them from post_select/out_select tuples
+            post_select = tuple([segment[1] for segment in segments if segment[1] is not None])
+            out_select = tuple([segment[2] for segment in segments if segment[2] is not None])
+            yield dataset_select, post_select, out_select
+
+#--------------------------------------------------------------------------------------------------
+#--- CLASS :  ChunkCache
+#--------------------------------------------------------------------------------------------------
+
+def _dataset_key(dataset):
+    """Key that identifies dataset across handles (file name and dataset name, or object id)."""
+    filename = getattr(getattr(dataset, 'file', None), 'filename', None)
+    name = getattr(dataset, 'name', None)
+    return (filename, name) if filename and name else (id(dataset),)
+
+
+class ChunkCache(object):
+    """Cache of decoded HDF5 chunks with a byte budget and LRU eviction.
+
+    This keeps the most recently used chunks of chunked datasets in memory, so
+    that repeated reads of overlapping selections (e.g. when zooming and
+    panning through data interactively, or when accessing visibilities,
+    weights and flags of the same selection several times) do not have to go
+    back to the HDF5 library to read and decompress the same chunks again.
+    A single cache is typically shared by all the lazy indexers of a data set,
+    and may be used by several threads at once.
+
+    Parameters
+    ----------
+    max_bytes : int, optional
+        Maximum number of bytes of chunk data kept in cache
+
+    Attributes
+    ----------
+    nbytes : int
+        Number of bytes of chunk data currently in cache
+    hits : int
+        Number of chunk requests served from cache
+    misses : int
+        Number of chunk requests that had to read chunk from dataset
+    evictions : int
+        Number of chunks evicted from cache to stay within byte budget
+
+    """
+    def __init__(self, max_bytes=256 * 1024 ** 2):
+        self.max_bytes = int(max_bytes)
+        self._chunks = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = self.hits = self.misses = self.evictions = 0
+
+    def __repr__(self):
+        """Short human-friendly string representation of chunk cache object."""
+        return "<katdal.%s chunks=%d size=%d/%d bytes hits=%d misses=%d evictions=%d at 0x%x>" % \
+               (self.__class__.__name__, len(self), self.nbytes, self.max_bytes,
+                self.hits, self.misses, self.evictions, id(self))
+
+    def __len__(self):
+        """Number of chunks in cache."""
+        return len(self._chunks)
+
+    def clear(self):
+        """Remove all chunks from cache and reset the counters."""
+        with self._lock:
+            self._chunks.clear()
+            self.nbytes = self.hits = self.misses = self.evictions = 0
+
+    def _get_chunk(self, dataset, key, chunk_coords):
+        """Obtain chunk from cache, or read it from dataset and add it to cache.
+
+        Parameters
+        ----------
+        dataset : :class:`h5py.Dataset` object or equivalent
+            Underlying chunked dataset
+        key : tuple
+            Key identifying dataset (see :func:`_dataset_key`)
+        chunk_coords : tuple of int
+            Chunk index along each dimension
+
+        Returns
+        -------
+        chunk : array
+            Decoded chunk (truncated at the edges of the dataset)
+
+        """
+        key = key + chunk_coords
+        with self._lock:
+            chunk = self._chunks.pop(key, None)
+            if chunk is not None:
+                # Reinsert chunk to mark it as the most recently used one
+                self._chunks[key] = chunk
+                self.hits += 1
+                return chunk
+            self.misses += 1
+        # Read chunk outside of lock so that other threads can use the cache in the meantime
+        chunk = dataset[tuple([slice(n * chunk_len, min((n + 1) * chunk_len, dim_len))
+                               for n, chunk_len, dim_len in zip(chunk_coords, dataset.chunks, dataset.shape)])]
+        # Don't bother caching chunks that will blow the whole budget
+        if chunk.nbytes > self.max_bytes:
+            return chunk
+        with self._lock:
+            if key not in self._chunks:
+                self._chunks[key] = chunk
+                self.nbytes += chunk.nbytes
+            # Evict least recently used chunks until the cache fits into its budget again
+            while self.nbytes > self.max_bytes:
+                old_key, old_chunk = self._chunks.popitem(last=False)
+                self.nbytes -= old_chunk.nbytes
+                self.evictions += 1
+        return chunk
+
+    def read(self, dataset, dataset_select):
+        """Extract hyperslab from chunked dataset via cached chunks.
+
+        This is equivalent to `dataset[dataset_select]`, but assembles the
+        hyperslab from the chunks it touches, which are read via the cache.
+
+        Parameters
+        ----------
+        dataset : :class:`h5py.Dataset` object or equivalent
+            Underlying chunked dataset (with a `chunks` member that is not None)
+        dataset_select : tuple of int or slice
+            Selection on dataset (only scalars and slices, no advanced indexing)
+
+        Returns
+        -------
+        segment : array
+            Extracted hyperslab
+
+        """
+        select = [(dim_select.indices(dim_len) if isinstance(dim_select, slice) else dim_select)
+                  for dim_select, dim_len in zip(dataset_select, dataset.shape)]
+        # Fall back to a direct read for empty or reversed selections (these don't occur in read plans)
+        if any(isinstance(s, tuple) and (s[2] < 1 or s[1] <= s[0]) for s in select):
+            return dataset[dataset_select]
+        key = _dataset_key(dataset)
+        # Split the selection on each dimension into parts that fall in the same chunk, as
+        # (chunk index, selection within chunk, selection in output) per part
+        parts, dim_lens, out_shape = [], [], []
+        for dim_select, chunk_len, dim_len in zip(select, dataset.chunks, dataset.shape):
+            if isinstance(dim_select, tuple):
+                indices, step = np.arange(*dim_select), dim_select[2]
+                out_shape.append(len(indices))
+            else:
+                indices, step = np.array([dim_select + dim_len if dim_select < 0 else dim_select]), 1
+            chunk_ids = indices // chunk_len
+            starts = np.r_[0, np.nonzero(np.diff(chunk_ids))[0] + 1]
+            ends = np.r_[starts[1:], len(indices)]
+            dim_parts = []
+            for start, end in zip(starts, ends):
+                offset = chunk_ids[start] * chunk_len
+                dim_parts.append((int(chunk_ids[start]),
+                                  slice(indices[start] - offset, indices[end - 1] - offset + 1, step),
+                                  slice(start, end)))
+            parts.append(dim_parts)
+            dim_lens.append(len(indices))
+        segment = np.empty(dim_lens, dtype=dataset.dtype)
+        for part in itertools.product(*parts):
+            chunk = self._get_chunk(dataset, key, tuple([p[0] for p in part]))
+            segment[tuple([p[2] for p in part])] = chunk[tuple([p[1] for p in part])]
+        # Drop the dimensions that were selected by scalars
+        return segment.reshape(out_shape)
+
+#--------------------------------------------------------------------------------------------------
+#--- Utility functions :  Parallel I/O
+#--------------------------------------------------------------------------------------------------
+
+class _ThreadPools(object):
+    """Bounded set of thread pools shared by lazy indexers, keyed by number of workers.
+
+    A pool is leased for the duration of each use. Once there are more than
+    `max_pools` pools, the least recently used ones are closed as soon as
+    they are not leased anymore. All pools are closed at interpreter exit.
+
+    Parameters
+    ----------
+    max_pools : int, optional
+        Maximum number of pools kept around for reuse
+
+    """
+    def __init__(self, max_pools=4):
+        self.max_pools = max(int(max_pools), 1)
+        self._pools = OrderedDict()
+        self._leases = {}
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def __len__(self):
+        """Number of pools kept around for reuse."""
+        return len(self._pools)
+
+    def _retire(self, pool):
+        """Close pool unless it is still leased or kept for reuse (call with lock held)."""
+        if not self._leases.get(pool) and pool not in self._pools.values():
+            pool.close()
+
+    @contextmanager
+    def lease(self, num_workers):
+        """Context manager that provides thread pool with given number of workers."""
+        with self._lock:
+            pool = self._pools.pop(num_workers, None)
+            if pool is None:
+                pool = ThreadPool(num_workers)
+            # Mark pool as most recently used
+            self._pools[num_workers] = pool
+            self._leases[pool] = self._leases.get(pool, 0) + 1
+            while len(self._pools) > self.max_pools:
+                self._retire(self._pools.popitem(last=False)[1])
+        try:
+            yield pool
+        finally:
+            with self._lock:
+                self._leases[pool] -= 1
+                if not self._leases[pool]:
+                    del self._leases[pool]
+                    self._retire(pool)
+
+    def close(self):
+        """Close all pools that are not leased and wait for their workers to finish."""
+        with self._lock:
+            pools = [pool for pool in self._pools.values() if not self._leases.get(pool)]
+            self._pools = OrderedDict([(num_workers, pool) for num_workers, pool in self._pools.items()
+                                       if pool not in pools])
+        for pool in pools:
+            pool.close()
+            pool.join()
+
+
+# Default number of worker threads used to read segments of a dataset (1 => read serially in calling thread)
+_io_workers = 1
+# Thread pools shared by all indexers
+_io_pools = _ThreadPools()
+# Locks that serialise the reads of worker threads on each file, keyed by file name (kept while in use)
+_file_locks = weakref.WeakValueDictionary()
+# Guards the creation of file locks
+_file_locks_lock = threading.Lock()
+
+
+def set_io_workers(num_workers):
+    """Set the default number of threads used by lazy indexers to read data.
+
+    Parameters
+    ----------
+    num_workers : int
+        Number of worker threads (1 means read serially in calling thread)
+
+    """
+    global _io_workers
+    _io_workers = max(int(num_workers), 1)
+
+
+def get_io_workers():
+    """Default number of threads used by lazy indexers to read data."""
+    return _io_workers
+
+
+def _file_lock(dataset):
+    """Lock that serialises worker reads of the file containing dataset (or of dataset itself)."""
+    key = _dataset_key(dataset)[0]
+    with _file_locks_lock:
+        lock = _file_locks.get(key)
+        if lock is None:
+            lock = _file_locks[key] = threading.RLock()
+    return lock
+
+
+def _out_view(out, shape):
+    """View of output array with the given shape, without copying any data.
+
+    Parameters
+    ----------
+    out : array
+        Output array supplied by caller
+    shape : tuple of int
+        Desired shape, which may only differ from that of `out` in singleton
+        dimensions
+
+    Returns
+    -------
+    view : array
+        View of `out` with desired shape (or `out` itself if shape matches)
+
+    Raises
+    ------
+    ValueError
+        If shapes differ in more than singleton dimensions, or a view with
+        the desired shape is not possible without copying
+
+    """
+    shape = tuple(shape)
+    if out.shape == shape:
+        return out
+    if [n for n in out.shape if n != 1] != [n for n in shape if n != 1]:
+        raise ValueError('Output array has shape %s, expected %s (up to singleton dimensions)' % (out.shape, shape))
+    view = out.view()
+    try:
+        # Setting the shape attribute (instead of calling reshape) guarantees that data are not copied
+        view.shape = shape
+    except AttributeError:
+        raise ValueError('Output array with shape %s and strides %s cannot be viewed with shape %s' %
+                         (out.shape, out.strides, shape))
+    return view
+
+
+def _read_segment(dataset, dataset_select, post_select, cache=None):
+    """Read segment from dataset and apply post-selection to it.
+
+    Parameters
+    ----------
+    dataset : :class:`h5py.Dataset` object or equivalent
+        Underlying dataset
+    dataset_select : tuple of int or slice
+        Selection on dataset (only scalars and slices, no advanced indexing)
+    post_select : tuple of slice or array of int
+        Post-selection on extracted array, one per non-scalar dimension
+    cache : :class:`ChunkCache` object or None, optional
+        Cache of decoded chunks to consult first (only used on chunked datasets)
+
+    Returns
+    -------
+    segment : array
+        Extracted and post-selected segment
+
+    """
+    # Extract segment from dataset (don't use any advanced indexing here, only scalars and slices)
+    if cache is not None and getattr(dataset, 'chunks', None):
+        segment = cache.read(dataset, dataset_select)
+    else:
+        segment = dataset[dataset_select]
+    # Do post-selection one dimension at a time, as ndarray does not allow simultaneous advanced indexing
+    # on more than one dimension. This caters for the scenario where more than one dimension is read
+    # via a spanning slice (the only way to get advanced post-selection).
+    for dim in range(len(segment.shape)):
+        # Only do post-selection on this dimension if non-trivial (otherwise an unnecessary copy happens)
+        if not (isinstance(post_select[dim], slice) and post_select[dim] == slice(None)):
+            # Prepend the appropriate number of colons to the selection to place it at correct dimension
+            segment = segment[tuple([slice(None)] * dim + [post_select[dim]])]
+    return segment
+
+#--------------------------------------------------------------------------------------------------
+#--- Utility functions :  Read-ahead
+#--------------------------------------------------------------------------------------------------
+
+# Default number of blocks read ahead when sequential access is detected (0 => no read-ahead)
+_prefetch_depth = 0
+# Default maximum number of bytes held in blocks that have been read ahead
+_prefetch_bytes = 256 * 1024 ** 2
+# Single background thread that does all read-ahead (lazily created and closed at exit)
+_prefetch_pools = _ThreadPools(max_pools=1)
+
+
+def set_prefetch(depth, max_bytes=None):
+    """Set the default read-ahead done by lazy indexers on sequential access.
+
+    If a lazy indexer is accessed with consecutive slices along its first
+    axis (e.g. `x[0:10]`, `x[10:20]`, ...), it reads the next `depth` blocks
+    of the same size on a background thread while the caller processes the
+    current block. The default depth of 0 disables this.
+
+    Parameters
+    ----------
+    depth : int
+        Number of blocks to read ahead (0 disables read-ahead)
+    max_bytes : int or None, optional
+        Maximum number of bytes held in blocks read ahead (unchanged if None)
+
+    """
+    global _prefetch_depth, _prefetch_bytes
+    _prefetch_depth = max(int(depth), 0)
+    if max_bytes is not None:
+        _prefetch_bytes = int(max_bytes)
+
+
+def get_prefetch():
+    """Default read-ahead depth and memory cap of lazy indexers, as (depth, max_bytes)."""
+    return _prefetch_depth, _prefetch_bytes
+
+
+def _prefetch(func, *args):
+    """Call function with arguments on the background read-ahead thread, returning an async result."""
+    with _prefetch_pools.lease(1) as pool:
+        return pool.apply_async(func, args)
+
+
+def _read_ahead(jobs, depth, max_bytes=None):
+    """Generator that runs jobs in order on a background thread, staying ahead of consumer.
+
+    Parameters
+    ----------
+    jobs : sequence of (int, function) pairs
+        Estimated size of result in bytes and function without arguments
+        that produces the result, per job
+    depth : int
+        Maximum number of results that are produced ahead of the consumer
+    max_bytes : int or None, optional
+        Maximum number of bytes in results produced ahead of the consumer
+        (the next job always runs, even if its result exceeds the limit)
+
+    Yields
+    ------
+    result : object
+        Result of each job, in order
+
+    """
+    max_bytes = _prefetch_bytes if max_bytes is None else max_bytes
+    pending, pending_bytes = deque(), 0
+    jobs = iter(jobs)
+    next_job = next(jobs, None)
+    while pending or next_job is not None:
+        # Submit jobs while staying within the depth and memory limits
+        while next_job is not None and (not pending or (len(pending) <= depth and
+                                                        pending_bytes + next_job[0] <= max_bytes)):
+            pending.append((next_job[0], _prefetch(next_job[1])))
+            pending_bytes += next_job[0]
+            next_job = next(jobs, None)
+        job_bytes, result = pending.popleft()
+        pending_bytes -= job_bytes
+        yield result.get()
+
+
+class _SequentialReadAhead(object):
+    """Read ahead on behalf of an indexer accessed with consecutive slices.
+
+    This watches the second-stage indices passed to an indexer. If the index
+    on the first axis is a unit-stride slice that starts where the previous
+    one stopped (with the same index on the other axes), the blocks following
+    it are read on a background thread, so that the next requests can be
+    served immediately.
+
+    Parameters
+    ----------
+    indexer : :class:`LazyIndexer` object
+        Indexer that is read ahead
+    depth : int
+        Number of blocks to read ahead
+    max_bytes : int
+        Maximum number of bytes held in blocks read ahead
+
+    """
+    def __init__(self, indexer, depth, max_bytes):
+        self.indexer = indexer
+        self.depth = depth
+        self.max_bytes = max_bytes
+        self._last = None
+        self._pending = OrderedDict()
+
+    @staticmethod
+    def _split(keep):
+        """Split index into (start, stop) of first axis and hashable key of the rest (None if not a slice)."""
+        keep = keep if isinstance(keep, tuple) else (keep,)
+        head = keep[0] if keep else slice(None)
+        if not isinstance(head, slice) or head.step not in (None, 1):
+            return None, None
+        tail = []
+        for dim_keep in keep[1:]:
+            if isinstance(dim_keep, slice):
+                tail.append(('slice', dim_keep.start, dim_keep.stop, dim_keep.step))
+            elif np.isscalar(dim_keep):
+                tail.append(('scalar', dim_keep))
+            else:
+                dim_keep = np.asarray(dim_keep)
+                tail.append(('array', dim_keep.dtype.str, dim_keep.tostring()))
+        return head, tuple(tail)
+
+    def read(self, keep):
+        """Extract selected array, using and issuing read-ahead where possible."""
+        head, tail = self._split(keep)
+        length = len(self.indexer)
+        if head is None:
+            self._pending.clear()
+            self._last = None
+            return self.indexer.read(keep)
+        start, stop, stride = head.indices(length)
+        result = self._pending.pop((start, stop, tail), None)
+        sequential = self._last is not None and self._last[1] == start and self._last[2] == tail
+        if not sequential:
+            # Discard blocks read ahead for a different access pattern
+            self._pending.clear()
+        self._last = (start, stop, tail)
+        data = result.get() if result is not None else self.indexer.read(keep)
+        if sequential and stop > start:
+            # Issue reads of the following blocks of the same size, within limits on depth and memory
+            block_bytes = data.nbytes
+            block_start = max([key[1] for key in self._pending] + [stop])
+            while len(self._pending) < self.depth and block_start < length and \
+                  (len(self._pending) + 1) * block_bytes <= self.max_bytes:
+                block_stop = min(block_start + stop - start, length)
+                block_keep = (slice(block_start, block_stop),) + (keep[1:] if isinstance(keep, tuple) else ())
+                self._pending[(block_start, block_stop, tail)] = _prefetch(self.indexer.read, block_keep)
+                block_start = block_stop
+        return data
+
+#--------------------------------------------------------------------------------------------------
+#--- CLASS :  _Fusion
+#--------------------------------------------------------------------------------------------------
+
+# Maximum size of the temporary segments read from dataset when transforms are fused with reads
+_FUSED_SEGMENT_BYTES = 16 * 1024 ** 2
+
+
+class _Fusion(object):
+    """Leading chunkwise transforms of a chain that are fused with dataset reads.
+
+    The leading run of transforms marked as chunkwise is applied to each
+    segment right after it is read, instead of to the assembled output array.
+    Large segments are split into smaller pieces (aligned with the chunks of
+    the dataset) to keep the temporary arrays small. Fusion is skipped if all
+    these transforms are view-only (as there is nothing to gain) or if the
+    dimensions changed by the transforms are not read in a single segment.
+
+    Parameters
+    ----------
+    transforms : list of :class:`LazyTransform` objects
+        Chain of transforms of indexer
+    plan : :class:`ReadPlan` object
+        Plan of dataset reads (with non-scalar output)
+    dataset : :class:`h5py.Dataset` object or equivalent
+        Underlying dataset
+
+    Attributes
+    ----------
+    transforms : list of :class:`LazyTransform` objects
+        Transforms that are fused with reads (empty if there is no fusion)
+    shape : tuple of int
+        Shape of output array after fused transforms
+    dtype : :class:`numpy.dtype` object
+        Type of output array after fused transforms
+
+    """
+    def __init__(self, transforms, plan, dataset):
+        self.plan, self.dataset = plan, dataset
+        self.transforms, self.shape, self.dtype = [], plan.read_shape, dataset.dtype
+        # Indices of dimensions that survive the read (i.e. that are not selected by scalars)
+        self._nonscalar = [dim for dim, segm_sizes in enumerate(plan.segment_sizes) if segm_sizes]
+        fused = []
+        for transform in transforms:
+            if not transform.chunkwise:
+                break
+            fused.append(transform)
+        if all([transform.view for transform in fused]):
+            return
+        # Determine the number of leading dimensions preserved throughout the fused transforms
+        shapes = [tuple([(int(np.sum(segm_sizes)) if segm_sizes else 1) for segm_sizes in plan.segment_sizes])]
+        for transform in fused:
+            shapes.append(tuple(transform.new_shape(shapes[-1])))
+        self._preserved = min([len(shape) for shape in shapes])
+        # The transformed dimensions have to be read in one go (and in order), as transforms see them in full
+        if any([len(select) > 1 for select in plan.selection[self._preserved:]]) or \
+           any([self._nonscalar[axis] >= self._preserved for axis, inverse in plan.reordering]):
+            return
+        self.transforms = fused
+        self._extra_dims = len(shapes[-1]) - self._preserved
+        self.shape = tuple([shapes[0][dim] for dim in self._nonscalar if dim < self._preserved]) + \
+                     shapes[-1][self._preserved:]
+        self.dtype = reduce(lambda dtype, transform: transform.dtype if transform.dtype is not None else dtype,
+                            fused, dataset.dtype)
+
+    def reads(self):
+        """Generator of dataset reads, with segments split into smaller pieces if fused."""
+        if not self.transforms:
+            for read in self.plan.reads():
+                yield read
+            return
+        # Split along the first non-scalar dimension that is preserved by transforms (if any)
+        split_dims = [n for n, dim in enumerate(self._nonscalar) if dim < self._preserved]
+        chunks = getattr(self.dataset, 'chunks', None)
+        itemsize = self.dataset.dtype.itemsize
+        for dataset_select, post_select, out_select in self.plan.reads():
+            if not split_dims or not (isinstance(post_select[split_dims[0]], slice) and
+                                      post_select[split_dims[0]] == slice(None)):
+                yield dataset_select, post_select, out_select
+                continue
+            n, dim = split_dims[0], self._nonscalar[split_dims[0]]
+            indices = np.arange(*dataset_select[dim].indices(self.dataset.shape[dim]))
+            read_lens = [(len(range(*s.indices(dim_len))) if isinstance(s, slice) else 1)
+                         for s, dim_len in zip(dataset_select, self.dataset.shape)]
+            bytes_per_index = itemsize * np.prod(read_lens) // max(len(indices), 1)
+            labels = indices // chunks[dim] if chunks else indices
+            max_len = max(int(_FUSED_SEGMENT_BYTES // max(bytes_per_index, 1)), 1)
+            out_start = out_select[n].start
+            for start, end in _block_boundaries(labels, max_len):
+                piece_select = list(dataset_select)
+                piece_select[dim] = slice(indices[start], indices[end - 1] + 1, dataset_select[dim].step)
+                piece_out = list(out_select)
+                piece_out[n] = slice(out_start + start, out_start + end, 1)
+                yield tuple(piece_select), post_select, tuple(piece_out)
+
+    def out_select(self, out_select):
+        """Selection on output array corresponding to raw segment output selection."""
+        if not self.transforms:
+            return out_select
+        return tuple([select for select, dim in zip(out_select, self._nonscalar) if dim < self._preserved] +
+                     [slice(None)] * self._extra_dims)
+
+    def apply(self, segment, keep):
+        """Apply fused transforms to segment (`keep` is user-specified second-stage index)."""
+        return reduce(lambda data, transform: transform(data, keep), self.transforms, segment)
+
 #--------------------------------------------------------------------------------------------------
 #--- CLASS :  LazyIndexer
 #--------------------------------------------------------------------------------------------------
@@ -95,6 +1205,13 @@ class LazyIndexer(object):
     performing advanced indexing on the resulting :class:`numpy.ndarray` object
     instead, in response to issue 3.
 
+    If the dataset is chunked (i.e. it has a `chunks` attribute that is not
+    None, as for chunked HDF5 datasets), the segments are planned around the
+    chunk layout instead: segments that fall in the same (or adjacent) chunks
+    are merged into a single spanning read, so that scattered selections do not
+    touch the same chunks many times over. The :meth:`plan` method reports the
+    reads that will be done for a given selection as a :class:`ReadPlan`.
+
     The `keep` parameter of the :meth:`__init__` and :meth:`__getitem__` methods
     accepts a generic index or slice specification, i.e. anything that would be
     accepted by the :meth:`__getitem__` method of a :class:`numpy.ndarray` of
@@ -118,11 +1235,27 @@ class LazyIndexer(object):
         Chain of transforms to be applied to data after final indexing. The
         chain as a whole may only add or drop dimensions at the end of data
         shape without changing the preserved dimensions.
+    workers : int or None, optional
+        Number of threads that transform segments of the dataset in parallel,
+        taking turns to read them from its file (the default is the global
+        setting, see :func:`set_io_workers`)
+    cache : :class:`ChunkCache` object or None, optional
+        Cache of decoded chunks consulted before reading chunked datasets
+        (typically shared by all indexers of a data set)
+    prefetch : int or None, optional
+        Number of blocks to read ahead on a background thread when indexer is
+        accessed with consecutive slices along the first axis (the default is
+        the global setting, see :func:`set_prefetch`)
+    stats : :class:`IOStats` object or None, optional
+        Counters that aggregate the I/O statistics of this indexer with others
+        (e.g. those of the data set that owns the indexer)
 
     Attributes
     ----------
     name : string
         Name of HDF5 dataset (or empty string for unnamed ndarrays, etc.)
+    stats : :class:`IOStats` object
+        I/O statistics of this indexer
 
     Raises
     ------
@@ -130,9 +1263,15 @@ class LazyIndexer(object):
         If transform chain does not obey restrictions on changing the data shape
 
     """
-    def __init__(self, dataset, keep=slice(None), transforms=None):
+    def __init__(self, dataset, keep=slice(None), transforms=None, workers=None, cache=None, prefetch=None,
+                 stats=None):
         self.dataset = dataset
         self.transforms = [] if transforms is None else transforms
+        self.workers = workers
+        self.cache = cache
+        self.prefetch = prefetch
+        self._read_ahead = None
+        self.stats = IOStats(parent=stats)
         self.name = getattr(self.dataset, 'name', '')
         # Ensure that keep is a tuple (then turn it into a list to simplify further processing)
         keep = list(keep) if isinstance(keep, tuple) else [keep]
@@ -187,23 +1326,63 @@ class LazyIndexer(object):
         for index in range(len(self)):
             yield self[index]
 
-    def __getitem__(self, keep):
-        """Extract a selected array from the underlying dataset.
+    def _block_labels(self, axis):
+        """Label each first-stage index along `axis` with the chunk it falls in.
 
-        This applies the given second-stage index on top of the first-stage index
-        and retrieves the relevant data from the dataset as an array, optionally
-        transforming it afterwards.
+        Consecutive indices with the same label are kept together in blocks
+        by :meth:`iter_blocks` if possible, so that blocks line up with the
+        chunk layout of the dataset.
+
+        """
+        lookup, dim_len = self._lookup[axis], self.dataset.shape[axis]
+        indices = np.arange(dim_len) if lookup is None else lookup
+        chunks = getattr(self.dataset, 'chunks', None)
+        return indices // chunks[axis] if chunks else indices
+
+    def iter_blocks(self, axis=0, block_size=None, max_bytes=None, prefetch=1):
+        """Generator that extracts the selected data in consecutive blocks.
+
+        This steps through the data along the given axis, extracting one block
+        at a time in order to bound the memory used. The block boundaries are
+        aligned with the chunk layout of the dataset where possible. If neither
+        `block_size` nor `max_bytes` is given, each block spans one chunk.
+
+        Parameters
+        ----------
+        axis : int, optional
+            Axis along which to step through data (time axis by default)
+        block_size : int or None, optional
+            Maximum number of indices along `axis` in each block
+        max_bytes : int or None, optional
+            Maximum size of each (transformed) output block, in bytes
+        prefetch : int, optional
+            Number of blocks read ahead on a background thread (0 disables this)
+
+        Yields
+        ------
+        index_range : slice object
+            Range of indices along `axis` spanned by block
+        data : array
+            Extracted output array for block
+
+        """
+        for index_range, (data,) in iter_blocks([self], axis, block_size, max_bytes, prefetch):
+            yield index_range, data
+
+    def _select(self, keep):
+        """Map second-stage index to dataset indices and plan the reads.
 
         Parameters
         ----------
         keep : tuple of int or slice or sequence of int or sequence of bool
             Second-stage index as a valid index or slice specification
-            (supports arbitrary slicing or advanced indexing on any dimension)
 
         Returns
         -------
-        data : array
-            Extracted output array
+        plan : :class:`ReadPlan` object
+            Plan of dataset reads that will produce the selected data
+        original_keep : tuple
+            The original second-stage index, to be passed to the transform chain
 
         """
         ndim = len(self.dataset.shape)
@@ -215,85 +1394,179 @@ class LazyIndexer(object):
         keep = keep[:ndim] + [slice(None)] * (ndim - len(keep))
         # Map current selection to original data indices based on any existing initial selection, per data dimension
         keep = [(dkeep if dlookup is None else dlookup[dkeep]) for dkeep, dlookup in zip(keep, self._lookup)]
-        # Iterate over dimensions of dataset, storing information on selection on each dimension:
-        # `selection` is a list with one element per dimension; each element is a list of contiguous segments along
-        # the dimension, and each segment is represented by a tuple of 3 elements:
-        # (dataset selection, post-selection, output array selection)
-        # Similarly, `segment_sizes` is a list of lists of segment lengths (empty lists for scalar-selected dimensions)
-        selection, segment_sizes = [], []
-        for dim_keep, dim_len in zip(keep, self.dataset.shape):
-            if np.isscalar(dim_keep):
-                # If selection is a scalar, pass directly to dataset selector and remove dimension from output
-                selection.append([(dim_keep, None, None)])
-                segment_sizes.append([])
-            elif isinstance(dim_keep, slice):
-                # If selection is a slice, pass directly to dataset selector without post-selection
-                start, stop, stride = dim_keep.indices(dim_len)
-                segm_size = len(range(start, stop, stride))
-                selection.append([(slice(start, stop, stride), slice(None), slice(0, segm_size, 1))])
-                segment_sizes.append([segm_size])
-            elif len(dim_keep) == 0:
-                # If selection is empty, pass to post-selector, as HDF5 datasets do not support zero-length selection
-                selection.append([(slice(0, 1, 1), slice(0, 0, 1), slice(0, 0, 1))])
-                segment_sizes.append([0])
-            else:
-                # Anything else is advanced indexing via bool or integer sequences
-                dim_keep = np.atleast_1d(dim_keep)
-                # Turn boolean mask into integer indices (True means keep that index)
-                if dim_keep.dtype == np.bool and len(dim_keep) == dim_len:
-                    dim_keep = np.nonzero(dim_keep)[0]
-                elif not np.all(dim_keep == np.unique(dim_keep)):
-                    raise TypeError('LazyIndexer cannot handle duplicate or unsorted advanced integer indices')
-                # Split indices into multiple contiguous segments (specified by first and one-past-last data indices)
-                jumps = np.nonzero(np.diff(dim_keep) > 1)[0]
-                first = [dim_keep[0]] + dim_keep[jumps + 1].tolist()
-                last = dim_keep[jumps].tolist() + [dim_keep[-1]]
-                segments = np.c_[first, np.array(last) + 1]
-                if len(dim_keep) > 0.2 * dim_len and len(segments) > 1:
-                    # If more than 20% of data are selected in 2 or more separate segments (the Ratcliffian benchmark),
-                    # select data at dataset level with a single slice spanning segments and then postselect the ndarray
-                    selection.append([(slice(segments[0, 0], segments[-1, 1], 1),
-                                       dim_keep - dim_keep[0], slice(0, len(dim_keep), 1))])
-                    segment_sizes.append([len(dim_keep)])
-                else:
-                    # Turn each segment into a separate slice at dataset level without post-selection,
-                    # and construct contiguous output slices of the same segment sizes
-                    segm_sizes = [end - start for start, end in segments]
-                    segm_starts = np.cumsum([0] + segm_sizes)
-                    selection.append([(slice(start, end, 1), slice(None), slice(segm_starts[n], segm_starts[n + 1], 1))
-                                      for n, (start, end) in enumerate(segments)])
-                    segment_sizes.append(segm_sizes)
+        return ReadPlan(self.dataset, keep), original_keep
+
+    def plan(self, keep=slice(None)):
+        """Plan of dataset reads that would be done to extract a selection.
+
+        This allows inspection of the read amplification of a selection (i.e.
+        the number of bytes read from the dataset vs the number of bytes
+        returned) without actually reading any data.
+
+        Parameters
+        ----------
+        keep : tuple of int or slice or sequence of int or sequence of bool, optional
+            Second-stage index as a valid index or slice specification
+            (supports arbitrary slicing or advanced indexing on any dimension)
+
+        Returns
+        -------
+        plan : :class:`ReadPlan` object
+            Plan of dataset reads, with statistics on chunks and bytes touched
+
+        """
+        return self._select(keep)[0]
+
+    def __getitem__(self, keep):
+        """Extract a selected array from the underlying dataset.
+
+        This applies the given second-stage index on top of the first-stage index
+        and retrieves the relevant data from the dataset as an array, optionally
+        transforming it afterwards.
+
+        Parameters
+        ----------
+        keep : tuple of int or slice or sequence of int or sequence of bool
+            Second-stage index as a valid index or slice specification
+            (supports arbitrary slicing or advanced indexing on any dimension)
+
+        Returns
+        -------
+        data : array
+            Extracted output array
+
+        """
+        return self._read_sequential(keep)
+
+    def _read_sequential(self, keep):
+        """Extract selected array, reading ahead if access is sequential along the first axis."""
+        depth = self.prefetch if self.prefetch is not None else _prefetch_depth
+        if not depth:
+            return self.read(keep)
+        if self._read_ahead is None or self._read_ahead.depth != depth:
+            self._read_ahead = _SequentialReadAhead(self, depth, _prefetch_bytes)
+        return self._read_ahead.read(keep)
+
+    def read(self, keep=slice(None), out=None):
+        """Extract a selected array from the underlying dataset into `out`.
+
+        This does the same as :meth:`__getitem__` but optionally fills a
+        caller-supplied output array in place instead of allocating a new one.
+        If there are no transforms the segments are read directly into `out`
+        without any intermediate copies.
+
+        Parameters
+        ----------
+        keep : tuple of int or slice or sequence of int or sequence of bool, optional
+            Second-stage index as a valid index or slice specification
+            (supports arbitrary slicing or advanced indexing on any dimension)
+        out : array or None, optional
+            Output array with the same size as the extracted data (its shape
+            may only differ from the extracted data in singleton dimensions)
+
+        Returns
+        -------
+        data : array
+            Extracted output array (`out` itself if provided)
+
+        Raises
+        ------
+        ValueError
+            If `out` does not match the shape of the extracted data
+
+        """
+        return self._read(keep, out)
+
+    def _read(self, keep, out=None, outer_stats=None):
+        """Extract selected array into `out` and record the I/O statistics of the call.
+
+        Parameters
+        ----------
+        keep : tuple of int or slice or sequence of int or sequence of bool
+            Second-stage index as a valid index or slice specification
+        out : array or None, optional
+            Output array (see :meth:`read`)
+        outer_stats : :class:`IOStats` object or None, optional
+            Counters of enclosing call (e.g. of a concatenated indexer), which
+            also receive the counters of the work done on datasets
+
+        Returns
+        -------
+        data : array
+            Extracted output array (`out` itself if provided)
+
+        """
+        call = IOStats()
+        start = time.time()
+        data = self._extract(keep, out, call)
+        call.add(calls=1, bytes_returned=np.asarray(data).nbytes, total_time=time.time() - start)
+        self.stats.update(call)
+        if outer_stats is not None:
+            outer_stats.update(call, IOStats.io_counters)
+        return data
+
+    def _extract(self, keep, out, stats):
+        """Extract selected array into `out`, adding the work done to `stats`."""
+        plan, original_keep = self._select(keep)
+        selection = plan.selection
         # Short-circuit the selection if all dimensions are selected with scalars (resulting in a scalar output)
-        if segment_sizes == [[]] * ndim:
+        if plan.output_shape == ():
+            start = time.time()
             out_data = self.dataset[tuple([select[0][0] for select in selection])]
+            stats.add(reads=1, bytes_read=self.dataset.dtype.itemsize, read_time=time.time() - start)
+            transforms = self.transforms
         else:
-            # Use dense N-dimensional meshgrid to slice data set into chunks, based on segments along each dimension
-            chunk_indices = np.mgrid[[slice(0, len(select), 1) for select in selection]]
+            fusion = _Fusion(self.transforms, plan, self.dataset)
+            transforms = self.transforms[len(fusion.transforms):]
+            # Read straight into caller-supplied output array if no reordering or transforms will follow
+            dest = out if not transforms and not plan.reordering else None
             # Pre-allocate output ndarray to have the correct shape and dtype (will be at least 1-dimensional)
-            out_data = np.empty([np.sum(segments) for segments in segment_sizes if segments], dtype=self.dataset.dtype)
-            # Iterate over chunks, extracting them from dataset and inserting them into the right spot in output array
-            for chunk_index in chunk_indices.reshape(ndim, -1).T:
-                # Extract chunk from dataset (don't use any advanced indexing here, only scalars and slices)
-                dataset_select = tuple([select[segment][0] for select, segment in zip(selection, chunk_index)])
-                chunk = self.dataset[dataset_select]
-                # Perform post-selection on chunk (can be fancier / advanced indexing because chunk is now an ndarray)
-                post_select = [select[segment][1] for select, segment in zip(selection, chunk_index)]
-                # If any dimensions were dropped due to scalar indexing, drop them from post_select/out_select tuples
-                post_select = tuple([select for select in post_select if select is not None])
-                # Do post-selection one dimension at a time, as ndarray does not allow simultaneous advanced indexing
-                # on more than one dimension. This caters for the scenario where more than one dimension satisfies
-                # the Ratcliffian benchmark (the only way to get advanced post-selection).
-                for dim in range(len(chunk.shape)):
-                    # Only do post-selection on this dimension if non-trivial (otherwise an unnecessary copy happens)
-                    if not (isinstance(post_select[dim], slice) and post_select[dim] == slice(None)):
-                        # Prepend the appropriate number of colons to the selection to place it at correct dimension
-                        chunk = chunk[[slice(None)] * dim + [post_select[dim]]]
-                # Determine appropriate output selection and insert chunk into output array
-                out_select = [select[segment][2] for select, segment in zip(selection, chunk_index)]
-                out_select = tuple([select for select in out_select if select is not None])
-                out_data[out_select] = chunk
-        # Apply transform chain to output data, if any
-        return reduce(lambda data, transform: transform(data, original_keep), self.transforms, out_data)
+            if dest is None:
+                out_data = np.empty(fusion.shape, dtype=fusion.dtype)
+                stats.add(bytes_allocated=out_data.nbytes)
+            else:
+                out_data = _out_view(dest, fusion.shape)
+            workers = self.workers if self.workers is not None else _io_workers
+            cache = self.cache
+            reads = list(fusion.reads())
+            itemsize, shape = self.dataset.dtype.itemsize, self.dataset.shape
+            dataset = self.dataset
+            # Read segment, apply any fused transforms and insert it into output array
+            def fill_segment(read, lock=None):
+                dataset_select, post_select, out_select = read
+                start = time.time()
+                if lock is None:
+                    segment = _read_segment(dataset, dataset_select, post_select, cache)
+                else:
+                    with lock:
+                        segment = _read_segment(dataset, dataset_select, post_select, cache)
+                read_done = time.time()
+                out_data[fusion.out_select(out_select)] = fusion.apply(segment, original_keep)
+                stats.add(reads=1, bytes_read=itemsize * _hyperslab_size(dataset_select, shape),
+                          bytes_allocated=segment.nbytes, read_time=read_done - start,
+                          transform_time=time.time() - read_done if fusion.transforms else 0.0)
+            if workers > 1 and len(reads) > 1:
+                # Workers share the dataset handle, taking turns to read from its file while transforming
+                # segments in parallel (workers reading other files are not held up)
+                lock = _file_lock(dataset)
+                with _io_pools.lease(workers) as pool:
+                    pool.map(lambda read: fill_segment(read, lock), reads)
+            else:
+                # Iterate over segments, extracting them from dataset and inserting them into output array
+                for read in reads:
+                    fill_segment(read)
+            if dest is not None:
+                return dest
+            # Scatter unique elements back to the original order of any unsorted or duplicate indices
+            out_data = plan.reorder(out_data)
+        # Apply remaining transform chain to output data, if any
+        start = time.time()
+        out_data = reduce(lambda data, transform: transform(data, original_keep), transforms, out_data)
+        stats.add(transform_time=time.time() - start)
+        if out is None:
+            return out_data
+        _out_view(out, np.shape(out_data))[...] = out_data
+        return out
 
     @property
     def shape(self):
@@ -311,3 +1584,108 @@ class LazyIndexer(object):
         """Type of data array after transformation, i.e. `self[:].dtype`."""
         return reduce(lambda dtype, transform: transform.dtype if transform.dtype is not None else dtype,
                       self.transforms, self._initial_dtype)
+
+#--------------------------------------------------------------------------------------------------
+#--- FUNCTION :  iter_blocks
+#--------------------------------------------------------------------------------------------------
+
+def _block_boundaries(labels, max_len):
+    """Split sequence of labelled indices into blocks of limited length.
+
+    Parameters
+    ----------
+    labels : array of int, shape (N,)
+        Label per index (consecutive indices with the same label form a unit)
+    max_len : int or None
+        Maximum block length (None means one unit per block)
+
+    Returns
+    -------
+    blocks : list of (int, int) pairs
+        Start and one-past-the-end index of each block
+
+    """
+    labels = np.asarray(labels)
+    starts = np.r_[0, np.nonzero(np.diff(labels))[0] + 1]
+    ends = np.r_[starts[1:], len(labels)]
+    blocks = []
+    block_start = block_end = 0
+    for start, end in zip(starts, ends):
+        if max_len is not None and end - block_start > max_len:
+            # Close the current block before it exceeds the limit, and split units larger than the limit
+            if block_end > block_start:
+                blocks.append((block_start, block_end))
+            block_start = start
+            while end - block_start > max_len:
+                blocks.append((block_start, block_start + max_len))
+                block_start += max_len
+        block_end = end
+        if max_len is None:
+            blocks.append((block_start, block_end))
+            block_start = block_end
+    if block_end > block_start:
+        blocks.append((block_start, block_end))
+    return blocks
+
+
+def iter_blocks(indexers, axis=0, block_size=None, max_bytes=None, prefetch=1):
+    """Generator that extracts data from multiple indexers in lockstep blocks.
+
+    This steps through the data of a sequence of indexers with the same length
+    along the given axis (e.g. visibilities, weights and flags), extracting
+    the same block from each indexer at a time in order to bound the memory
+    used. The block boundaries are aligned with the chunk layout of the first
+    indexer where possible. If neither `block_size` nor `max_bytes` is given,
+    each block spans one chunk.
+
+    Parameters
+    ----------
+    indexers : sequence of :class:`LazyIndexer` objects
+        Indexers to step through in lockstep
+    axis : int, optional
+        Axis along which to step through data (time axis by default)
+    block_size : int or None, optional
+        Maximum number of indices along `axis` in each block
+    max_bytes : int or None, optional
+        Maximum combined size of the (transformed) output blocks of all
+        indexers, in bytes
+    prefetch : int, optional
+        Number of blocks read ahead on a background thread while the caller
+        processes the current block (0 disables this, and the total size of
+        blocks read ahead is limited by the setting of :func:`set_prefetch`)
+
+    Yields
+    ------
+    index_range : slice object
+        Range of indices along `axis` spanned by block
+    data : list of arrays
+        Extracted output array for block, one per indexer
+
+    Raises
+    ------
+    ValueError
+        If the indexers differ in length along `axis`
+
+    """
+    lengths = set([indexer.shape[axis] for indexer in indexers])
+    if len(lengths) != 1:
+        raise ValueError('Indexers have different lengths along axis %d: %s' % (axis, sorted(lengths)))
+    # Number of bytes in all output arrays per index along axis
+    bytes_per_index = np.sum([indexer.dtype.itemsize * np.prod(indexer.shape[:axis] + indexer.shape[axis + 1:])
+                              for indexer in indexers])
+    max_len = block_size
+    if max_bytes is not None:
+        max_len = max(int(max_bytes // bytes_per_index), 1) if max_len is None else \
+                  max(min(max_len, int(max_bytes // bytes_per_index)), 1)
+    blocks = _block_boundaries(indexers[0]._block_labels(axis), max_len)
+    def read_block(start, end):
+        keep = (slice(None),) * axis + (slice(start, end),)
+        return slice(start, end), [indexer.read(keep) for indexer in indexers]
+    if not prefetch:
+        for start, end in blocks:
+            yield read_block(start, end)
+        return
+    jobs = [((end - start) * bytes_per_index, lambda start=start, end=end: read_block(start, end))
+            for start, end in blocks]
+    for block in _read_ahead(jobs, prefetch):
+        yield block
@@ -1,12 +1,15 @@
 """Container that stores cached and uncached (raw) sensor data."""
 
 import logging
+import hashlib
 import re
+from collections import OrderedDict
 
 import numpy as np
 import katpoint
 
-from .categorical import sensor_to_categorical
+from .categorical import CategoricalData, sensor_to_categorical
+from .lazy_indexer import get_io_workers, _io_pools
 
 logger = logging.getLogger(__name__)
 
@@ -110,6 +113,24 @@ def _linear_interp(xi, yi, x):
     This is lifted from scikits.fitting.poly as it is the only part of the
     package that is typically required. This weens katdal off SciPy too.
 
+    """
+    start, end, end_weight = _interp_segments(xi, x)
+    return (1.0 - end_weight) * yi[start] + end_weight * yi[end]
+
+
+def _interp_segments(xi, x):
+    """Segments of (xi, yi) used to linearly interpolate to x positions.
+
+    This is the part of :func:`_linear_interp` that only depends on *xi* and
+    *x*, which may be shared by many sets of y-values with the same *xi*.
+
+    Returns
+    -------
+    start, end : int or array of int, shape (M,)
+        Indices into *xi* of start and end of segment containing each x
+    end_weight : float or array, shape (M,)
+        Weight of y-value at end of segment (0 at start and 1 at end)
+
     """
     # Find lowest xi value >= x (end of segment containing x)
     end = np.atleast_1d(xi.searchsorted(x))
@@ -122,7 +143,7 @@ def _linear_interp(xi, yi, x):
     start, end = np.reshape(start, np.shape(x)), np.reshape(end, np.shape(x))
     # Set up weight such that xi[start] => 0 and xi[end] => 1
     end_weight = (x - xi[start]) / (xi[end] - xi[start])
-    return (1.0 - end_weight) * yi[start] + end_weight * yi[end]
+    return start, end, end_weight
 
 
 def dummy_sensor_data(name, value=None, dtype=np.float64, timestamp=0.0):
@@ -214,6 +235,194 @@ def remove_duplicates(sensor):
                                         dtype=[('timestamp', x.dtype), ('value', y.dtype), ('status', z.dtype)]),
                       sensor.name)
 
+
+def _nbytes(data):
+    """Number of bytes of memory occupied by (extracted or raw) sensor data."""
+    if isinstance(data, np.ndarray):
+        return data.nbytes
+    elif isinstance(data, CategoricalData):
+        return np.asarray(data.unique_values).nbytes + np.asarray(data.indices).nbytes + \
+               np.asarray(data.events).nbytes
+    elif isinstance(data, SensorData):
+        # Raw sensor data only occupies memory once it has been read from its file
+        return data.data.nbytes if isinstance(data.data, np.ndarray) else 0
+    return 0
+
+
+def _keep_token(keep):
+    """Hashable token that identifies a time selection, also if a selection mask is modified in place."""
+    return keep.dtype.str + keep.tostring() if isinstance(keep, np.ndarray) else repr(keep)
+
+
+def _sensor_records(names, sensors):
+    """Turn dict of extracted sensor data into record array with one field per sensor (in order of `names`)."""
+    values = [data if isinstance(data, np.ndarray) else data[:] for data in [sensors[name] for name in names]]
+    return np.rec.fromarrays(values, names=[str(name) for name in names])
+
+#--------------------------------------------------------------------------------------------------
+#--- CLASS :  H5SensorIndex
+#--------------------------------------------------------------------------------------------------
+
+def _is_sensor_dataset(obj):
+    """A sensor is defined as a non-empty dataset with expected dtype."""
+    dtype = getattr(obj, 'dtype', None)
+    return dtype is not None and obj.shape != () and dtype.names == ('timestamp', 'value', 'status')
+
+
+class H5SensorIndex(object):
+    """Index of sensor datasets in HDF5 group that looks up sensors on demand.
+
+    Files may contain thousands of sensors of which only a few are typically
+    used. Instead of visiting all HDF5 datasets when the file is opened, this
+    maps a sensor name to the path of its dataset in the group and only looks
+    up that dataset. The full list of sensors is only compiled if requested.
+
+    Parameters
+    ----------
+    h5file : :class:`h5py.File` object or equivalent
+        HDF5 file containing sensors (anything that supports `in` and lookup
+        of groups and datasets by path, e.g. a :class:`PooledFile`)
+    group : string
+        Path of group in file containing sensor datasets
+    name_to_paths : function, signature ``paths = name_to_paths(name)``
+        Candidate paths of sensor dataset relative to group, given sensor name
+    path_to_name : function, signature ``name = path_to_name(path)``
+        Sensor name, given path of sensor dataset relative to group
+
+    """
+    def __init__(self, h5file, group, name_to_paths, path_to_name):
+        self.file = h5file
+        self.group = group
+        self.name_to_paths = name_to_paths
+        self.path_to_name = path_to_name
+        self._sensors = None
+
+    def _sensor_data(self, obj, name):
+        """Wrap sensor dataset in :class:`SensorData` object (via file pool if applicable)."""
+        pooled = getattr(self.file, 'pooled', None)
+        return SensorData(pooled(obj) if pooled else obj, name)
+
+    def get(self, name):
+        """Raw sensor data of sensor with given name, or None if sensor is not in index."""
+        for path in self.name_to_paths(name):
+            path = self.group + '/' + path
+            if path in self.file:
+                obj = self.file[path]
+                if _is_sensor_dataset(obj):
+                    return self._sensor_data(obj, name)
+        return None
+
+    def sensors(self):
+        """Raw sensor data of all sensors in index, as a dict keyed by sensor name."""
+        # Only visit the group once, as this is expensive
+        if self._sensors is None:
+            sensors = {}
+            def register_sensor(path, obj):
+                if _is_sensor_dataset(obj):
+                    name = self.path_to_name(path)
+                    sensors[name] = self._sensor_data(obj, name)
+            self.file[self.group].visititems(register_sensor)
+            self._sensors = sensors
+        return self._sensors
+
+    def __nonzero__(self):
+        """True if index has sensors (judged by group contents, without visiting the whole group)."""
+        if self._sensors is not None:
+            return bool(self._sensors)
+        return self.group in self.file and len(self.file[self.group]) > 0
+
+#--------------------------------------------------------------------------------------------------
+#--- CLASS :  VirtualSensorIndex
+#--------------------------------------------------------------------------------------------------
+
+# Variable names enclosed in braces in virtual sensor templates
+_template_variable = re.compile(r'({[a-zA-Z_]\w*})')
+# Path component of template that matches itself literally
+_literal_component = re.compile(r'^[\w\-]+$')
+# Indices of virtual sensor templates shared by all sensor caches, keyed by tuple of templates (in LRU order)
+_virtual_indices = OrderedDict()
+# Maximum number of distinct sets of virtual sensor templates with an index
+MAX_VIRTUAL_INDICES = 16
+# Maximum number of sensor names whose template match is memoised by each index
+MAX_VIRTUAL_MATCHES = 4096
+
+
+class VirtualSensorIndex(object):
+    """Index of virtual sensor templates for fast matching of sensor names.
+
+    The templates are compiled to regular expressions once and arranged in a
+    trie keyed by their leading literal path components (e.g. 'Antennas/'), so
+    that a sensor name is only matched against the templates that share its
+    path prefix. The resolution of the most recently used names is also
+    memoised (up to :const:`MAX_VIRTUAL_MATCHES` names), as the same names
+    tend to be looked up repeatedly (e.g. per-baseline uvw sensors in each of
+    the underlying caches of a concatenated data set). The index only depends
+    on the templates themselves and not on their functions.
+
+    Parameters
+    ----------
+    virtual : dict mapping string to function
+        Virtual sensors, specified as a pattern matching the virtual sensor name
+        and a corresponding function that will create the sensor
+
+    """
+    def __init__(self, virtual):
+        # Each trie node is a pair of (list of (order, pattern, regex), dict of child nodes keyed by component)
+        self._trie = ([], {})
+        for order, pattern in enumerate(virtual):
+            # Expand variable names enclosed in braces to the relevant regular expression
+            regex = re.compile(_template_variable.sub(lambda m: '(?P<' + m.group(0)[1:-1] + '>[^//]+)', pattern))
+            node = self._trie
+            # Only components followed by a slash are part of the prefix of every matching name
+            for component in pattern.split('/')[:-1]:
+                if not _literal_component.match(component):
+                    break
+                node = node[1].setdefault(component, ([], {}))
+            node[0].append((order, pattern, regex))
+        self._matches = OrderedDict()
+
+    def match(self, name):
+        """Find virtual sensor template matching sensor name.
+
+        If more than one template matches the name, the first one in the
+        original order of the templates is picked.
+
+        Parameters
+        ----------
+        name : string
+            Sensor name
+
+        Returns
+        -------
+        match : tuple of (string, dict) or None
+            Matching template and values of its variables extracted from name,
+            or None if no template matches the name
+
+        """
+        try:
+            # Mark name as recently used
+            result = self._matches[name] = self._matches.pop(name)
+            return result
+        except KeyError:
+            pass
+        node, candidates = self._trie, list(self._trie[0])
+        for component in name.split('/')[:-1]:
+            node = node[1].get(component)
+            if node is None:
+                break
+            candidates.extend(node[0])
+        for order, pattern, regex in sorted(candidates):
+            match = regex.match(name)
+            if match:
+                result = (pattern, match.groupdict())
+                break
+        else:
+            result = None
+        self._matches[name] = result
+        while len(self._matches) > MAX_VIRTUAL_MATCHES:
+            self._matches.popitem(last=False)
+        return result
+
 #--------------------------------------------------------------------------------------------------
 #--- CLASS :  SensorCache
 #--------------------------------------------------------------------------------------------------
@@ -277,9 +486,43 @@ class SensorCache(dict):
         Alternate names for sensors, as a dictionary mapping each alias to the
         original sensor name suffix. This will create additional sensors with
         the aliased names and the data of the original sensors.
+    index : :class:`H5SensorIndex` object or None, optional
+        Index of further actual sensors, which are only added to the cache
+        when first accessed (or when the full list of sensors is requested)
+    store : :class:`SensorStore` object or None, optional
+        Persistent store of extracted sensor data, bound to the data file
+        containing the sensors (see :meth:`SensorStore.bind`), which is checked
+        before extracting an actual sensor and updated afterwards
+    interp_selected : {False, True}, optional
+        True if numerical sensors requested with time selection enabled should
+        only be interpolated onto the selected timestamps (with the result
+        kept until the selection changes), instead of onto all timestamps.
+        This speeds up access to sensors of a narrow selection of a long data
+        set, while full interpolation still happens as soon as the full array
+        of sensor values is requested (this can also be set as an attribute).
+    max_bytes : int or None, optional
+        Memory budget of extracted actual sensors, virtual sensors and sensors
+        interpolated onto selected timestamps, in bytes (default is unlimited).
+        Once exceeded, the least recently used of these are evicted from the
+        cache until it fits again, even if that includes the sensor that was
+        just extracted: actual sensors revert to their raw sensor data and the
+        others are removed, so that all are recalculated on their next access.
+        Sensors assigned directly to the cache and raw sensor data fall outside
+        the budget, as they cannot be recalculated (this can also be set as an
+        attribute).
+
+    Attributes
+    ----------
+    nbytes : int
+        Number of bytes of memory occupied by sensor data in cache, including
+        directly assigned sensors and raw sensor data
+    evictable_nbytes : int
+        Number of bytes of memory occupied by sensor data that counts towards
+        the memory budget `max_bytes` (this part of `nbytes` never exceeds it)
 
     """
-    def __init__(self, cache, timestamps, dump_period, keep=slice(None), props=None, virtual={}, aliases={}):
+    def __init__(self, cache, timestamps, dump_period, keep=slice(None), props=None, virtual={}, aliases={},
+                 index=None, store=None, interp_selected=False, max_bytes=None):
         # Initialise cache via dict constructor
         super(SensorCache, self).__init__(cache)
         self.timestamps = timestamps
@@ -288,28 +531,142 @@ class SensorCache(dict):
         self.props = props if props is not None else {}
         # Add virtual sensor templates
         self.virtual = virtual
-        # Add sensor aliases
-        for alias, original in aliases.iteritems():
-            for name, data in self.iteritems():
+        self.aliases = aliases
+        self.index = index
+        self.store = store
+        self._timestamps_digest = (None, None)
+        self.interp_selected = interp_selected
+        # Numerical sensors interpolated onto selected timestamps only, with the selection they belong to
+        self._selected = {}
+        self.max_bytes = max_bytes
+        # Sizes of evictable sensors in order of last access, raw data of evictable actual sensors and total size
+        self._lru, self._raw, self._evictable_bytes = OrderedDict(), {}, 0
+        # Number of virtual sensor calculations in progress (sensors assigned during these are evictable)
+        self._virtual_depth = 0
+        self._virtual_templates = (None, None)
+        # Add sensor aliases (indexed sensors get aliased as they are looked up)
+        self._add_aliases(cache)
+
+    def _virtual_index(self):
+        """Index of virtual sensor templates, which is looked up again if templates are added or removed."""
+        templates, index = self._virtual_templates
+        if templates != tuple(self.virtual):
+            templates = tuple(self.virtual)
+            # Caches with the same templates (e.g. those of concatenated data sets) share an index
+            index = _virtual_indices.pop(templates, None)
+            if index is None:
+                index = VirtualSensorIndex(self.virtual)
+            # Mark index as recently used and forget the least recently used ones
+            _virtual_indices[templates] = index
+            while len(_virtual_indices) > MAX_VIRTUAL_INDICES:
+                _virtual_indices.popitem(last=False)
+            self._virtual_templates = (templates, index)
+        return index
+
+    def _add_aliases(self, sensors):
+        """Add aliases of the given actual sensors to the cache."""
+        for alias, original in self.aliases.iteritems():
+            for name, data in sensors.iteritems():
                 if name.endswith(original):
-                    self[name.replace(original, alias)] = data
+                    dict.__setitem__(self, name.replace(original, alias), data)
+
+    def _lookup(self, name):
+        """Ensure that actual sensor is in cache if it is in index, returning True if sensor is in cache."""
+        if dict.__contains__(self, name):
+            return True
+        if self.index is None:
+            return False
+        sensor_data = self.index.get(name)
+        # Alternatively, the name may be an alias of an indexed sensor
+        for alias, original in self.aliases.iteritems():
+            if sensor_data is None and name.endswith(alias):
+                sensor_data = self.index.get(name[:-len(alias)] + original)
+        if sensor_data is None:
+            return False
+        dict.__setitem__(self, name, sensor_data)
+        return True
+
+    def _index_all(self):
+        """Add all remaining sensors in index to cache, after which the index is no longer needed."""
+        if self.index is not None:
+            index, self.index = self.index, None
+            sensors = index.sensors()
+            # Sensors that have already been looked up (and perhaps extracted or replaced) take precedence
+            sensors = dict([(name, data) for name, data in sensors.iteritems() if not dict.__contains__(self, name)])
+            self.update(sensors)
+            self._add_aliases(sensors)
+
+    def __contains__(self, name):
+        """True if actual sensor is in cache (or in index of cache)."""
+        return self._lookup(name)
+
+    def __iter__(self):
+        """Iterate through names of actual sensors."""
+        return self.iterkeys()
+
+    def _known_keys(self):
+        """Names of actual sensors already in cache, without consulting the index."""
+        return dict.keys(self)
+
+    def _index_pending(self):
+        """True if index may still contain sensors that are not in cache yet."""
+        return self.index is not None
+
+    def __len__(self):
+        """Number of actual sensors in cache so far.
+
+        This only counts the sensors in the index that have been looked up,
+        as counting all of them involves visiting every sensor in the file.
+        Once the full list of sensors is compiled (e.g. by :meth:`keys`), the
+        count includes all sensors.
+
+        """
+        return len(self._known_keys())
+
+    def __nonzero__(self):
+        """True if cache has actual sensors, including those not looked up in index yet."""
+        return len(self._known_keys()) > 0 or (self.index is not None and bool(self.index))
+
+    def iterkeys(self):
+        """Iterate through names of actual sensors.
+
+        This compiles the full list of sensors in the index the first time
+        round, which visits every sensor in the file and can be slow for large
+        files. The same applies to iteration over the cache itself and to
+        :meth:`keys`, :meth:`itervalues` and :meth:`iteritems`.
+
+        """
+        self._index_all()
+        return dict.iterkeys(self)
+
+    def keys(self):
+        """Names of actual sensors (which compiles the full list of sensors in index, see :meth:`iterkeys`)."""
+        return list(self.iterkeys())
 
     def __str__(self):
-        """Verbose human-friendly string representation of sensor cache object."""
-        names = sorted([key for key in self.iterkeys()])
-        maxlen = max([len(name) for name in names])
+        """Verbose human-friendly string representation of sensor cache object.
+
+        This lists the actual sensors in the cache so far and notes whether
+        the index may hold more, instead of compiling the full list of sensors.
+
+        """
+        names = sorted(self._known_keys())
+        maxlen = max([len(name) for name in names] or [0])
         objects = [self.get(name, extract=False) for name in names]
         obj_reprs = [(("<numpy.ndarray shape=%s type='%s' at 0x%x>" % (obj.shape, obj.dtype, id(obj)))
                      if isinstance(obj, np.ndarray) else repr(obj)) for obj in objects]
         actual = ['%s : %s' % (str(name).ljust(maxlen), obj_repr) for name, obj_repr in zip(names, obj_reprs)]
         virtual = ['%s : <function %s.%s>' % (str(pat).ljust(maxlen), func.__module__, func.__name__)
                    for pat, func in self.virtual.iteritems()]
+        # Remaining sensors are only listed once the index has been fully compiled (e.g. via keys())
+        if self._index_pending():
+            actual.append('... (further sensors in file not looked up yet)')
         return '\n'.join(['Actual sensors', '--------------'] + actual +
                          ['\nVirtual sensors', '---------------'] + virtual)
 
     def __repr__(self):
-        """Short human-friendly string representation of sensor cache object."""
-        sensor_data = [self.get(name, extract=False) for name in self.iterkeys()]
+        """Short human-friendly string representation of sensor cache object (sensors looked up so far)."""
+        sensor_data = [self.get(name, extract=False) for name in self._known_keys()]
         return "<katdal.%s sensors=%d cached=%d at 0x%x>" % \
                (self.__class__.__name__, len(sensor_data),
                 np.sum([not isinstance(data, SensorData) for data in sensor_data]), id(self))
@@ -339,10 +696,78 @@ class SensorCache(dict):
         """
         return self.get(name, select=True)
 
+    def __setitem__(self, name, data):
+        """Assign data to sensor, which pins it in cache unless this happens during a virtual sensor calculation."""
+        # Directly assigned data (e.g. post-processed sensors) cannot be recreated from raw data
+        self._raw.pop(name, None)
+        self._discard_selected(name)
+        self._insert(name, data, evictable=self._virtual_depth > 0)
+
+    def _store_extracted(self, name, data):
+        """Store extracted actual sensor in cache, keeping its raw data to revert to if it is evicted."""
+        previous = dict.get(self, name)
+        if isinstance(previous, SensorData):
+            self._raw[name] = previous
+        self._insert(name, data, evictable=name in self._raw or self._virtual_depth > 0)
+
+    def _insert(self, name, data, evictable):
+        """Insert sensor data, evicting least recently used sensors if cache is over its memory budget."""
+        self._evictable_bytes -= self._lru.pop(name, 0)
+        if evictable:
+            self._lru[name] = nbytes = _nbytes(data)
+            self._evictable_bytes += nbytes
+        super(SensorCache, self).__setitem__(name, data)
+        self._fit_budget()
+
+    def _insert_selected(self, name, data):
+        """Keep numerical sensor interpolated onto current selection until selection changes (or it is evicted)."""
+        self._discard_selected(name)
+        self._selected[name] = (_keep_token(self.keep), data)
+        # Selected sensors share the LRU list with the other evictable sensors, under a key of their own
+        self._lru[(name, 'selected')] = nbytes = _nbytes(data)
+        self._evictable_bytes += nbytes
+
+    def _discard_selected(self, name):
+        """Forget numerical sensor interpolated onto selected timestamps."""
+        if self._selected.pop(name, None) is not None:
+            self._evictable_bytes -= self._lru.pop((name, 'selected'), 0)
+
+    def _fit_budget(self):
+        """Evict least recently used sensors if cache is over its memory budget."""
+        if self.max_bytes is not None and self._evictable_bytes > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        """Evict least recently used sensors (including the latest one, if need be) until cache fits into budget."""
+        for key in self._lru.keys():
+            if self._evictable_bytes <= self.max_bytes:
+                break
+            self._evictable_bytes -= self._lru.pop(key)
+            if isinstance(key, tuple):
+                del self._selected[key[0]]
+            elif key in self._raw:
+                super(SensorCache, self).__setitem__(key, self._raw.pop(key))
+            else:
+                super(SensorCache, self).__delitem__(key)
+        logger.debug('Sensor cache evicted sensors to fit into %d bytes' % (self.max_bytes,))
+
+    @property
+    def nbytes(self):
+        """Number of bytes of memory occupied by sensor data in cache (including data outside the budget)."""
+        return sum(_nbytes(data) for data in dict.itervalues(self)) + \
+            sum(_nbytes(data) for token, data in self._selected.itervalues())
+
+    @property
+    def evictable_nbytes(self):
+        """Number of bytes of memory occupied by sensor data that counts towards memory budget."""
+        return self._evictable_bytes
+
     def _set_keep(self, keep=None):
         """Set time selection for sensor values."""
         if keep is not None:
             self.keep = keep
+            for name in self._selected.keys():
+                self._discard_selected(name)
 
     def itervalues(self):
         """Custom value iterator that avoids extracting sensor data."""
@@ -352,6 +777,141 @@ class SensorCache(dict):
         """Custom item iterator that avoids extracting sensor data."""
         return iter([(key, self.get(key, extract=False)) for key in self.iterkeys()])
 
+    def _sensor_props(self, name, kwargs):
+        """Properties of sensor, combining defaults for sensor and its class with overrides in `kwargs`."""
+        # Look up properties associated with this specific sensor
+        self.props[name] = props = self.props.get(name, {})
+        # Look up properties associated with this class of sensor
+        for key, val in self.props.iteritems():
+            if key[0] == '*' and name.endswith(key[1:]):
+                props.update(val)
+        # Any properties passed directly to this method takes precedence
+        props.update(kwargs)
+        return props
+
+    def _load_stored(self, name, props):
+        """Load extracted sensor data from persistent store into cache, returning store key and data (or None)."""
+        # If this is the first time any sensor is accessed, obtain all data timestamps via indexer
+        self.timestamps = self.timestamps[:] if not isinstance(self.timestamps, np.ndarray) else self.timestamps
+        # Digest of timestamps is only recalculated when the timestamps are replaced
+        if self._timestamps_digest[0] is not self.timestamps:
+            digest = hashlib.sha1(self.timestamps.astype(np.float64).tostring()).hexdigest()
+            self._timestamps_digest = (self.timestamps, digest)
+        store_key = self.store.key(name, props, self._timestamps_digest[1])
+        sensor_data = self.store.load(store_key)
+        if sensor_data is not None:
+            # Fill in the default properties that extraction would have determined
+            props['categorical'] = categ = props.get('categorical', isinstance(sensor_data, CategoricalData))
+            if not categ:
+                props['interp_degree'] = props.get('interp_degree', 1)
+            self._discard_selected(name)
+            self._store_extracted(name, sensor_data)
+        return store_key, sensor_data
+
+    def _extract(self, name, sensor_data, shared=None, selected=False, **kwargs):
+        """Extract raw sensor data, interpolate it to data timestamps and store it in cache.
+
+        Parameters
+        ----------
+        name : string
+            Sensor name
+        sensor_data : :class:`SensorData` object
+            Raw sensor data
+        shared : dict or None, optional
+            Alignments of sensor timestamps with data timestamps, keyed by
+            sensor timestamps, which are shared between sensors with identical
+            timestamps (and filled in as new timestamps are encountered)
+        selected : {False, True}, optional
+            True if numerical data should only be interpolated onto the selected
+            timestamps, in which case the selected values are kept aside until
+            the selection changes and the cleaned raw data replaces the original
+            raw data in the cache (categorical data are always fully extracted)
+        kwargs : dict, optional
+            Sensor properties that override the defaults (see :meth:`get`)
+
+        Returns
+        -------
+        data : array or :class:`CategoricalData` object
+            Extracted sensor data (only selected if numerical and `selected`)
+
+        """
+        props = self._sensor_props(name, kwargs)
+        # Reuse sensor data extracted by an earlier session if it is available in persistent store
+        store_key, stored_data = self._load_stored(name, props) if self.store is not None else (None, None)
+        if stored_data is not None:
+            return stored_data
+        # Clean up sensor data if non-empty
+        if len(sensor_data) > 0:
+            # Sort sensor events in chronological order and discard duplicates and unreadable sensor values
+            sensor_data = remove_duplicates(sensor_data)
+            # Explicitly cast status to string type, as k7_augment produced sensors with integer statuses
+            sensor_data.data = np.atleast_1d(sensor_data[sensor_data['status'].astype('|S7') != 'failure'])
+        if len(sensor_data) == 0:
+            sensor_data = dummy_sensor_data(name, value=props.get('initial_value'), dtype=sensor_data.dtype)
+            logger.warning("No usable data found for sensor '%s' - replaced with dummy data (%r)" %
+                           (name, sensor_data['value'][0]))
+        # If this is the first time any sensor is accessed, obtain all data timestamps via indexer
+        self.timestamps = self.timestamps[:] if not isinstance(self.timestamps, np.ndarray) else self.timestamps
+        # Determine if sensor produces categorical or numerical data (by default, float data are non-categorical)
+        categ = props.get('categorical', not np.issubdtype(sensor_data.dtype, np.float))
+        props['categorical'] = categ
+        if categ:
+            sensor_timestamps, sensor_dumps = sensor_data['timestamp'], None
+            # Sensors with identical timestamps share the dumps in which their events occur
+            if shared is not None:
+                key = ('dumps', sensor_timestamps.tostring())
+                if key not in shared:
+                    shared[key] = self.timestamps.searchsorted(sensor_timestamps - 0.5 * self.dump_period)
+                sensor_dumps = shared[key]
+            sensor_data = sensor_to_categorical(sensor_timestamps, sensor_data['value'], self.timestamps,
+                                                self.dump_period, sensor_dumps=sensor_dumps, **props)
+        else:
+            # Interpolate numerical data onto data timestamps (fallback option is linear interpolation)
+            props['interp_degree'] = interp_degree = props.get('interp_degree', 1)
+            if selected:
+                # Keep cleaned raw data in memory, as the sensor will be interpolated again for each new selection
+                dict.__setitem__(self, name, sensor_data)
+            timestamps = np.atleast_1d(self.timestamps[self.keep]) if selected else self.timestamps
+            sensor_timestamps = sensor_data['timestamp']
+            # Warn if sensor data will be extrapolated to start or end of data set with potentially bogus results
+            if interp_degree > 0 and len(sensor_timestamps) > 1:
+                if sensor_timestamps[0] > self.timestamps[0]:
+                    logger.warning(("First data point for sensor '%s' only arrives %g seconds into data set" %
+                                   (name, sensor_timestamps[0] - self.timestamps[0])) +
+                                   " - extrapolation may lead to ridiculous values")
+                if sensor_timestamps[-1] < self.timestamps[-1]:
+                    logger.warning(("Last data point for sensor '%s' arrives %g seconds before end of data set" %
+                                   (name, self.timestamps[-1] - sensor_timestamps[-1])) +
+                                   " - extrapolation may lead to ridiculous values")
+            if PiecewisePolynomial1DFit is not None:
+                interp = PiecewisePolynomial1DFit(max_degree=interp_degree)
+                interp.fit(sensor_timestamps, sensor_data['value'])
+                sensor_data = interp(timestamps)
+            else:
+                if interp_degree != 1:
+                    logger.warning('Requested sensor interpolation with polynomial degree ' + str(interp_degree) +
+                                   ' but scikits.fitting not installed - falling back to linear interpolation')
+                if shared is None or selected:
+                    sensor_data = _linear_interp(sensor_timestamps, sensor_data['value'], timestamps)
+                else:
+                    # Sensors with identical timestamps share the interpolation segments
+                    key = ('segments', sensor_timestamps.tostring())
+                    if key not in shared:
+                        shared[key] = _interp_segments(sensor_timestamps, self.timestamps)
+                    start, end, end_weight = shared[key]
+                    sensor_values = sensor_data['value']
+                    sensor_data = (1.0 - end_weight) * sensor_values[start] + end_weight * sensor_values[end]
+            if selected:
+                # Scalar selection (single integer index) produces a single value, as with the full data
+                sensor_data = sensor_data[0] if np.ndim(self.timestamps[self.keep]) == 0 else sensor_data
+                self._insert_selected(name, sensor_data)
+                return sensor_data
+        self._discard_selected(name)
+        self._store_extracted(name, sensor_data)
+        if self.store is not None:
+            self.store.save(store_key, sensor_data)
+        return sensor_data
+
     def get(self, name, select=False, extract=True, **kwargs):
         """Sensor values interpolated to correlator data timestamps.
 
@@ -359,7 +919,9 @@ class SensorCache(dict):
         extraction method typically called by library routines that want to
         operate on the full array of sensor values. For additional allowed
         parameters when extracting categorical data, see the docstring for
-        :func:`sensor_to_categorical`.
+        :func:`sensor_to_categorical`. If the :attr:`interp_selected` attribute
+        is True, numerical sensors that are requested with selection enabled
+        are only interpolated onto the selected timestamps.
 
         Parameters
         ----------
@@ -395,73 +957,113 @@ class SensorCache(dict):
         """
         try:
             # First try to load the actual sensor data from cache (remember to call base class here!)
+            # If the sensor is not in cache yet, look it up in the index
+            self._lookup(name)
             sensor_data = super(SensorCache, self).__getitem__(name)
+            # Mark evictable sensor as recently used
+            if name in self._lru:
+                self._lru[name] = self._lru.pop(name)
         except KeyError:
-            # Otherwise, iterate through virtual sensor templates and look for a match
-            for pattern, create_sensor in self.virtual.iteritems():
-                # Expand variable names enclosed in braces to the relevant regular expression
-                pattern = re.sub('({[a-zA-Z_]\w*})', lambda m: '(?P<' + m.group(0)[1:-1] + '>[^//]+)', pattern)
-                match = re.match(pattern, name)
-                if match:
-                    # Call sensor creation function with extracted variables from sensor name
-                    sensor_data = create_sensor(self, name, **match.groupdict())
-                    break
-            else:
+            # Otherwise, look for a matching virtual sensor template
+            match = self._virtual_index().match(name)
+            if match is None:
                 raise KeyError("Unknown sensor '%s' (does not match actual name or virtual template)" % (name,))
+            pattern, variables = match
+            # Call sensor creation function with extracted variables from sensor name
+            self._virtual_depth += 1
+            try:
+                sensor_data = self.virtual[pattern](self, name, **variables)
+            finally:
+                self._virtual_depth -= 1
         # If this is the first time this sensor is accessed, extract its data and store it in cache, if enabled
         if isinstance(sensor_data, SensorData) and extract:
-            # Look up properties associated with this specific sensor
-            self.props[name] = props = self.props.get(name, {})
-            # Look up properties associated with this class of sensor
-            for key, val in self.props.iteritems():
-                if key[0] == '*' and name.endswith(key[1:]):
-                    props.update(val)
-            # Any properties passed directly to this method takes precedence
-            props.update(kwargs)
-            # Clean up sensor data if non-empty
-            if len(sensor_data) > 0:
-                # Sort sensor events in chronological order and discard duplicates and unreadable sensor values
-                sensor_data = remove_duplicates(sensor_data)
-                # Explicitly cast status to string type, as k7_augment produced sensors with integer statuses
-                sensor_data.data = np.atleast_1d(sensor_data[sensor_data['status'].astype('|S7') != 'failure'])
-            if len(sensor_data) == 0:
-                sensor_data = dummy_sensor_data(name, value=props.get('initial_value'), dtype=sensor_data.dtype)
-                logger.warning("No usable data found for sensor '%s' - replaced with dummy data (%r)" %
-                               (name, sensor_data['value'][0]))
-            # If this is the first time any sensor is accessed, obtain all data timestamps via indexer
-            self.timestamps = self.timestamps[:] if not isinstance(self.timestamps, np.ndarray) else self.timestamps
-            # Determine if sensor produces categorical or numerical data (by default, float data are non-categorical)
-            categ = props.get('categorical', not np.issubdtype(sensor_data.dtype, np.float))
-            props['categorical'] = categ
-            if categ:
-                sensor_data = sensor_to_categorical(sensor_data['timestamp'], sensor_data['value'],
-                                                    self.timestamps, self.dump_period, **props)
+            if select and self.interp_selected:
+                # Reuse numerical data interpolated onto the same selection (which may have been modified in place)
+                token, selected_data = self._selected.get(name, (None, None))
+                if token is not None and token == _keep_token(self.keep):
+                    self._lru[(name, 'selected')] = self._lru.pop((name, 'selected'))
+                    return selected_data
+                sensor_data = self._extract(name, sensor_data, selected=True, **kwargs)
+                if name in self._selected:
+                    # Only enforce the budget now, as this could evict the selected sensor again
+                    self._fit_budget()
+                    return sensor_data
             else:
-                # Interpolate numerical data onto data timestamps (fallback option is linear interpolation)
-                props['interp_degree'] = interp_degree = props.get('interp_degree', 1)
-                sensor_timestamps = sensor_data['timestamp']
-                # Warn if sensor data will be extrapolated to start or end of data set with potentially bogus results
-                if interp_degree > 0 and len(sensor_timestamps) > 1:
-                    if sensor_timestamps[0] > self.timestamps[0]:
-                        logger.warning(("First data point for sensor '%s' only arrives %g seconds into data set" %
-                                       (name, sensor_timestamps[0] - self.timestamps[0])) +
-                                       " - extrapolation may lead to ridiculous values")
-                    if sensor_timestamps[-1] < self.timestamps[-1]:
-                        logger.warning(("Last data point for sensor '%s' arrives %g seconds before end of data set" %
-                                       (name, self.timestamps[-1] - sensor_timestamps[-1])) +
-                                       " - extrapolation may lead to ridiculous values")
-                if PiecewisePolynomial1DFit is not None:
-                    interp = PiecewisePolynomial1DFit(max_degree=interp_degree)
-                    interp.fit(sensor_timestamps, sensor_data['value'])
-                    sensor_data = interp(self.timestamps)
-                else:
-                    if interp_degree != 1:
-                        logger.warning('Requested sensor interpolation with polynomial degree ' + str(interp_degree) +
-                                       ' but scikits.fitting not installed - falling back to linear interpolation')
-                    sensor_data = _linear_interp(sensor_timestamps, sensor_data['value'], self.timestamps)
-            self[name] = sensor_data
+                sensor_data = self._extract(name, sensor_data, **kwargs)
         return sensor_data[self.keep] if select else sensor_data
 
+    def get_many(self, names, select=False, extract=True, workers=None, as_array=False, **kwargs):
+        """Sensor values of many sensors interpolated to correlator data timestamps.
+
+        This is equivalent to calling :meth:`get` for each sensor, but more
+        efficient when extracting many sensors at once (e.g. the pointing
+        sensors of all antennas). The raw data of actual sensors that have not
+        been extracted yet are first read in bulk (in parallel threads, if
+        requested) and sensors with identical timestamps then share the
+        alignment of their timestamps with the correlator data timestamps.
+
+        Parameters
+        ----------
+        names : sequence of strings
+            Sensor names
+        select : {False, True}, optional
+            True if preset time selection will be applied to returned data
+        extract : {True, False}, optional
+            True if sensor data should be extracted from HDF5 file and cached
+        workers : int or None, optional
+            Number of threads that read raw sensor data in parallel (default
+            is the global number of I/O workers, see :func:`set_io_workers`)
+        as_array : {False, True}, optional
+            True to return a record array with one field per sensor instead of
+            a dict (which requires extraction, as all fields need one value
+            per timestamp)
+        kwargs : dict, optional
+            Additional sensor properties are passed to each extraction (see
+            :meth:`get`)
+
+        Returns
+        -------
+        data : dict mapping string to sensor data, or :class:`numpy.recarray`
+            Sensor data of each sensor, as returned by :meth:`get` (or as a
+            record array of values, one per (selected) timestamp)
+
+        Raises
+        ------
+        KeyError
+            If sensor name was not found in cache and did not match virtual template
+
+        """
+        names = list(names)
+        sensors = {}
+        # Actual sensors that still need to be extracted are read in bulk (avoid reading any sensor twice)
+        raw = [name for name in set(names) if self._lookup(name) and
+               isinstance(dict.__getitem__(self, name), SensorData)] if extract else []
+        # Sensors found in the persistent store need not be read at all
+        if raw and self.store is not None:
+            for name in raw:
+                stored_data = self._load_stored(name, self._sensor_props(name, kwargs))[1]
+                if stored_data is not None:
+                    sensors[name] = stored_data[self.keep] if select else stored_data
+            raw = [name for name in raw if name not in sensors]
+        if raw:
+            workers = get_io_workers() if workers is None else workers
+            def read(name):
+                sensor_data = dict.__getitem__(self, name)
+                return SensorData(np.atleast_1d(np.asarray(sensor_data[:])), sensor_data.name)
+            if workers > 1 and len(raw) > 1:
+                with _io_pools.lease(workers) as pool:
+                    raw_data = pool.map(read, raw)
+            else:
+                raw_data = [read(n) for n in raw]
+            shared = {}
+            for name, sensor_data in zip(raw, raw_data):
+                sensor_data = self._extract(name, sensor_data, shared, **kwargs)
+                sensors[name] = sensor_data[self.keep] if select else sensor_data
+        for name in names:
+            if name not in sensors:
+                sensors[name] = self.get(name, select, extract, **kwargs)
+        return _sensor_records(names, sensors) if as_array else sensors
+
 #--------------------------------------------------------------------------------------------------
 #--- FUNCTION :  _sensor_completer
 #--------------------------------------------------------------------------------------------------
@@ -0,0 +1,330 @@
+"""Sidecar index files and persistent stores of data derived from sensors."""
+
+import os
+import copy
+import json
+import errno
+import hashlib
+import logging
+import tempfile
+import threading
+
+import numpy as np
+import katpoint
+
+from .categorical import CategoricalData
+
+logger = logging.getLogger(__name__)
+
+# Version of sidecar index layout (bump this to invalidate all existing sidecar files)
+SIDECAR_VERSION = 2
+# Version of sensor store layout and sensor extraction (bump this to invalidate all stored sensors)
+SENSOR_STORE_VERSION = 1
+# Default directory of persistent sensor store
+DEFAULT_SENSOR_STORE = os.path.join(os.path.expanduser('~'), '.cache', 'katdal', 'sensors')
+
+
+def sidecar_filename(filename):
+    """Name of sidecar index file that accompanies data file."""
+    return filename + '.sidecar.npz'
+
+
+def _signature(filename):
+    """Signature that identifies a specific version of a data file (path, size and modification time)."""
+    stat = os.stat(filename)
+    return json.dumps([os.path.abspath(filename), stat.st_size, stat.st_mtime])
+
+
+def timestamps_digest(timestamps):
+    """Digest of data timestamps, which captures all inputs that went into their calculation."""
+    return hashlib.sha1(np.asarray(timestamps, dtype=np.float64).tostring()).hexdigest()
+
+
+def _save_categorical(name, data):
+    """Arrays that represent categorical data with target or plain values, with names prefixed by `name`."""
+    targets = len(data.unique_values) > 0 and isinstance(data.unique_values[0], katpoint.Target)
+    if targets:
+        values = np.array([value.description for value in data.unique_values], dtype=str)
+    else:
+        values = np.asarray(data.unique_values)
+        if values.dtype == np.object:
+            raise TypeError('Categorical data with values of type %s cannot be stored' %
+                            (type(data.unique_values[0]).__name__,))
+    return {name + '_values': values, name + '_targets': targets,
+            name + '_indices': data.indices, name + '_events': data.events}
+
+
+def _load_categorical(arrays, name):
+    """Categorical data represented by arrays with names prefixed by `name` (see :func:`_save_categorical`)."""
+    values = arrays[name + '_values']
+    if bool(arrays[name + '_targets']):
+        values = np.array([katpoint.Target(description) for description in values], dtype=object)
+    data = CategoricalData([], [0])
+    data.unique_values, data.indices, data.events = values, arrays[name + '_indices'], arrays[name + '_events']
+    return data
+
+
+def load_sidecar(filename, params):
+    """Load observation structure from sidecar index file, if it is still fresh.
+
+    Parameters
+    ----------
+    filename : string
+        Name of data file
+    params : dict
+        Parameters that affect the stored structure (e.g. reference antenna,
+        time offset and digest of data timestamps, see :func:`timestamps_digest`),
+        which have to match the ones used to create it
+
+    Returns
+    -------
+    categoricals : dict mapping string to :class:`CategoricalData` objects, or None
+        Stored categorical data, or None if there is no valid sidecar index
+        that matches the current version of the data file and `params`
+
+    """
+    try:
+        with np.load(sidecar_filename(filename)) as index:
+            if int(index['version']) != SIDECAR_VERSION or str(index['signature']) != _signature(filename) or \
+               str(index['params']) != json.dumps(params, sort_keys=True):
+                return None
+            return dict([(name, _load_categorical(index, name)) for name in json.loads(str(index['names']))])
+    except Exception:
+        # Any problem with the sidecar index (missing, corrupted or outdated) just means it cannot be used
+        return None
+
+
+def save_sidecar(filename, params, **categoricals):
+    """Save observation structure to sidecar index file next to data file.
+
+    Failure to write the sidecar index (e.g. in a read-only directory) is not
+    an error, as the index only speeds up subsequent opening of the file.
+
+    Parameters
+    ----------
+    filename : string
+        Name of data file
+    params : dict
+        Parameters that affect the stored structure (see :func:`load_sidecar`)
+    categoricals : dict mapping string to :class:`CategoricalData` objects
+        Categorical data to store (values are either strings or targets)
+
+    """
+    arrays = {'version': SIDECAR_VERSION, 'signature': _signature(filename),
+              'params': json.dumps(params, sort_keys=True), 'names': json.dumps(sorted(categoricals))}
+    for name, data in categoricals.iteritems():
+        arrays.update(_save_categorical(name, data))
+    try:
+        # Open file explicitly, as savez insists on adding its own .npz extension to file names otherwise
+        with open(sidecar_filename(filename), 'wb') as sidecar:
+            np.savez(sidecar, **arrays)
+    except (IOError, OSError), e:
+        logger.debug("Could not write sidecar index for '%s': %s" % (filename, e))
+
+
+def _props_signature(props):
+    """JSON representation of sensor properties, which also tracks the code of functions (e.g. transforms)."""
+    def encode(value):
+        code = getattr(value, '__code__', None)
+        if code is not None:
+            return 'function %s %s' % (code.co_code.encode('hex'), repr(code.co_consts))
+        return repr(value)
+    return json.dumps(props, sort_keys=True, default=encode)
+
+#--------------------------------------------------------------------------------------------------
+#--- CLASS :  SensorStore
+#--------------------------------------------------------------------------------------------------
+
+class SensorStore(object):
+    """Persistent store of extracted sensor data shared by all data files.
+
+    Extracting a sensor (removing duplicates, interpolating numerical sensors
+    and turning categorical ones into :class:`CategoricalData`) is repeated
+    every time a data file is opened. This store keeps the final extracted
+    sensor data in a directory (one .npz file per sensor), from where it is
+    loaded on subsequent extractions of the same sensor. Each entry is keyed
+    by the identity of the data file (path, size and modification time), the
+    sensor name, the sensor properties (e.g. interpolation degree) and the
+    data timestamps onto which the sensor is interpolated, so that a change
+    in any of these invalidates the entry. The data file is specified by
+    binding the store to it (see :meth:`bind`). When the total size of the store
+    exceeds `max_bytes`, the least recently used entries are removed.
+
+    Parameters
+    ----------
+    directory : string or None, optional
+        Directory of store, which is created if it does not exist (default is
+        :const:`DEFAULT_SENSOR_STORE`)
+    max_bytes : int, optional
+        Maximum total size of stored sensor data, in bytes
+
+    """
+    def __init__(self, directory=None, max_bytes=2 * 1024 ** 3):
+        self.directory = directory if directory is not None else DEFAULT_SENSOR_STORE
+        self.max_bytes = max_bytes
+        self.source = None
+        # Approximate total size of store, which is shared by all bound copies of the store
+        self._usage = {'size': None}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        """Short human-friendly string representation of sensor store object."""
+        return "<katdal.%s '%s' max_bytes=%d at 0x%x>" % \
+               (self.__class__.__name__, self.directory, self.max_bytes, id(self))
+
+    def bind(self, filename):
+        """Version of store that keys sensor data by the given data file.
+
+        Parameters
+        ----------
+        filename : string
+            Name of data file containing the sensors
+
+        Returns
+        -------
+        store : :class:`SensorStore` object
+            Store sharing the directory and size limit of this one, whose keys
+            include the path, size and modification time of the data file
+
+        """
+        store = copy.copy(self)
+        store.source = _signature(filename)
+        return store
+
+    def key(self, name, props, timestamps):
+        """Key of stored sensor data.
+
+        Parameters
+        ----------
+        name : string
+            Sensor name
+        props : dict
+            Sensor properties used to extract sensor
+        timestamps : string
+            Digest of data timestamps onto which sensor is interpolated
+
+        Returns
+        -------
+        key : string
+            Key of sensor data in store
+
+        """
+        digest = hashlib.sha1(json.dumps([SENSOR_STORE_VERSION, self.source, name, timestamps]))
+        digest.update(_props_signature(props))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        """Name of file storing sensor data with given key."""
+        return os.path.join(self.directory, key + '.npz')
+
+    def load(self, key):
+        """Load sensor data from store.
+
+        Parameters
+        ----------
+        key : string
+            Key of sensor data (see :meth:`key`)
+
+        Returns
+        -------
+        data : array or :class:`CategoricalData` object, or None
+            Stored sensor data, or None if the sensor is not in the store
+
+        """
+        path = self._path(key)
+        try:
+            with np.load(path) as arrays:
+                data = _load_categorical(arrays, 'sensor') if 'sensor_values' in arrays else arrays['sensor']
+            # Mark entry as recently used
+            os.utime(path, None)
+            return data
+        except Exception:
+            # Any problem with the entry (missing, corrupted or concurrently removed) just means it cannot be used
+            return None
+
+    def save(self, key, data):
+        """Save sensor data to store, removing old entries if the store is full.
+
+        Failure to write to the store (e.g. if the directory is read-only or
+        the data type is not supported) is not an error, as the store only
+        speeds up subsequent extraction of the sensor.
+
+        Parameters
+        ----------
+        key : string
+            Key of sensor data (see :meth:`key`)
+        data : array or :class:`CategoricalData` object
+            Extracted sensor data
+
+        """
+        try:
+            if isinstance(data, CategoricalData):
+                arrays = _save_categorical('sensor', data)
+            elif np.asarray(data).dtype == np.object:
+                raise TypeError('Sensor data of type object cannot be stored')
+            else:
+                arrays = {'sensor': data}
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            # Write to temporary file first, so that other processes never see a partially written entry
+            handle, temp_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+            with os.fdopen(handle, 'wb') as temp_file:
+                np.savez(temp_file, **arrays)
+            size = os.path.getsize(temp_path)
+            # An existing entry with the same key gets replaced, so only the difference in size counts
+            try:
+                size -= os.path.getsize(self._path(key))
+            except OSError:
+                pass
+            os.rename(temp_path, self._path(key))
+        except (IOError, OSError, TypeError, ValueError), e:
+            logger.debug("Could not store sensor data in '%s': %s" % (self.directory, e))
+            return
+        with self._lock:
+            if self._usage['size'] is None:
+                self._usage['size'] = self._entries()[1]
+            else:
+                self._usage['size'] += size
+            if self._usage['size'] > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        """List of (modification time, size, path) of entries in store, and their total size."""
+        entries = []
+        for filename in os.listdir(self.directory):
+            if filename.endswith('.npz'):
+                path = os.path.join(self.directory, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries, sum(size for mtime, size, path in entries)
+
+    def _evict(self):
+        """Remove least recently used entries until store fits into its size limit (call with lock held)."""
+        entries, total = self._entries()
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError, e:
+                # Another process may have removed the entry already
+                if e.errno != errno.ENOENT:
+                    continue
+            total -= size
+        self._usage['size'] = total
+
+    def clear(self):
+        """Remove all entries from store."""
+        with self._lock:
+            if os.path.isdir(self.directory):
+                for mtime, size, path in self._entries()[0]:
+                    try:
+                        os.remove(path)
+                    except OSError, e:
+                        # Another process may have removed the entry already
+                        if e.errno != errno.ENOENT:
+                            raise
+            self._usage['size'] = 0
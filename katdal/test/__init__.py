@@ -0,0 +1,24 @@
+"""Unit test suite for katdal."""
+
+import unittest
+
+# pylint: disable-msg=W0403
+import test_lazy_indexer
+import test_h5files
+import test_sidecar
+import test_sensordata
+import test_index
+
+
+def suite():
+    loader = unittest.TestLoader()
+    testsuite = unittest.TestSuite()
+    testsuite.addTests(loader.loadTestsFromModule(test_lazy_indexer))
+    testsuite.addTests(loader.loadTestsFromModule(test_h5files))
+    testsuite.addTests(loader.loadTestsFromModule(test_sidecar))
+    testsuite.addTests(loader.loadTestsFromModule(test_sensordata))
+    testsuite.addTests(loader.loadTestsFromModule(test_index))
+    return testsuite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
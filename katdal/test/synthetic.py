@@ -0,0 +1,67 @@
+"""Small synthetic HDF5 data files for the katdal tests."""
+
+import numpy as np
+import h5py
+
+
+def add_sensor(group, name, timestamps, values, status='nominal'):
+    """Add sensor dataset (timestamp, value, status records) to HDF5 group."""
+    values = np.asarray(values)
+    dtype = [('timestamp', np.float64), ('value', values.dtype), ('status', 'S7')]
+    group.create_dataset(name, data=np.array([(t, v, status) for t, v in zip(timestamps, values)], dtype=dtype))
+
+
+def make_v3_file(filename, num_dumps=100, num_chans=16, start=1.4e9, dump_period=2.0, chunks=None):
+    """Create a minimal v3 data file with two antennas tracking the Sun and then the Moon.
+
+    Parameters
+    ----------
+    filename : string
+        Name of HDF5 file to create
+    num_dumps, num_chans : int, optional
+        Number of dumps and channels in the visibility data
+    start : float, optional
+        Timestamp of the first dump, as UTC seconds since Unix epoch
+    dump_period : float, optional
+        Dump period, in seconds
+    chunks : tuple of int or None, optional
+        Chunk shape of visibility data (None for a contiguous dataset)
+
+    Returns
+    -------
+    vis : array of float32, shape (`num_dumps`, `num_chans`, 4, 2)
+        Visibility data stored in file, as (real, imag) pairs
+
+    """
+    bls = np.array([['ant1h', 'ant1h'], ['ant1v', 'ant1v'], ['ant1h', 'ant2h'], ['ant2h', 'ant2h']])
+    vis = np.random.randn(num_dumps, num_chans, len(bls), 2).astype(np.float32)
+    f = h5py.File(filename, 'w')
+    try:
+        f.attrs['version'] = '3.0'
+        f.create_dataset('Data/correlator_data', data=vis, chunks=chunks)
+        f['Data/timestamps'] = start + dump_period * np.arange(num_dumps)
+        model = f.create_group('TelescopeModel')
+        cbf = model.create_group('cbf')
+        cbf.attrs.update({'class': 'CorrelatorBeamformer', 'int_time': dump_period,
+                          'scale_factor_timestamp': 1712e6, 'sync_time': start - 1000.0,
+                          'bls_ordering': bls, 'center_freq': 1.8e9, 'n_chans': num_chans,
+                          'bandwidth': 400e6})
+        end = start + dump_period * num_dumps
+        events = np.r_[start - 5.0, start + np.array([0.2, 0.6, 1.2]) * (end - start)]
+        for ant in ('ant1', 'ant2'):
+            group = model.create_group(ant)
+            group.attrs.update({'class': 'AntennaPositioner',
+                                'description': '%s, -30:43:17.3, 21:24:38.5, 1038.0, 12.0' % (ant,)})
+            add_sensor(group, 'activity', events, ['slew', 'track', 'slew', 'track'])
+            add_sensor(group, 'target', events, ['Sun, special', 'Sun, special', 'Moon, special', 'Moon, special'])
+            pos_timestamps = np.arange(start - 1.0, end + 1.0, 1.0)
+            add_sensor(group, 'pos_actual_scan_azim', pos_timestamps, np.linspace(10, 20, len(pos_timestamps)))
+            add_sensor(group, 'pos_actual_scan_elev', pos_timestamps, np.linspace(30, 40, len(pos_timestamps)))
+        obs = model.create_group('obs')
+        obs.attrs['class'] = 'Observation'
+        add_sensor(obs, 'params', [start - 10.0] * 3, ["observer 'tester'", "description 'test obs'",
+                                                      "ants 'ant1,ant2'"])
+        add_sensor(obs, 'label', [start - 5.0], ['track'])
+    finally:
+        f.close()
+    return vis
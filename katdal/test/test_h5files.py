@@ -0,0 +1,91 @@
+"""Tests for the h5files module."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import h5py
+
+from katdal.h5files import FilePool, PooledGroup, PooledDataset, open_file
+
+
+class TestFilePool(unittest.TestCase):
+    """Files are closed once the pool is full and reopened when used again."""
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.filenames = []
+        for n in range(3):
+            filename = os.path.join(self.tempdir, 'file%d.h5' % (n,))
+            with h5py.File(filename, 'w') as f:
+                f['Data/values'] = n * np.ones((10, 2))
+                f['Data'].attrs['index'] = n
+            self.filenames.append(filename)
+        self.pool = FilePool(max_files=2)
+
+    def tearDown(self):
+        self.pool.close()
+        shutil.rmtree(self.tempdir)
+
+    def lease(self, n):
+        """Lease file number `n` and check that it is the right one."""
+        with self.pool.lease(self.filenames[n]) as h5file:
+            self.assertEqual(h5file['Data'].attrs['index'], n)
+
+    def test_eviction_and_release(self):
+        self.lease(0)
+        self.lease(1)
+        self.assertEqual((len(self.pool), self.pool.opens, self.pool.closes), (2, 2, 0))
+        # The least recently used file is closed to make space
+        self.lease(2)
+        self.assertEqual((len(self.pool), self.pool.opens, self.pool.closes), (2, 3, 1))
+        # Leasing an open file just marks it as recently used
+        self.lease(1)
+        self.assertEqual((self.pool.opens, self.pool.closes), (3, 1))
+        # The closed file is reopened on its next lease, which closes file 2 instead of file 1
+        self.lease(0)
+        self.assertEqual((len(self.pool), self.pool.opens, self.pool.closes), (2, 4, 2))
+        self.lease(1)
+        self.assertEqual(self.pool.opens, 4)
+
+    def test_busy_files_stay_open(self):
+        """The cap may be exceeded while more files are leased than it allows."""
+        with self.pool.lease(self.filenames[0]) as first:
+            with self.pool.lease(self.filenames[1]):
+                with self.pool.lease(self.filenames[2]):
+                    self.assertEqual(len(self.pool), 3)
+                    self.assertTrue(first.id.valid)
+            self.assertEqual(len(self.pool), 2)
+            self.assertTrue(first.id.valid)
+        self.assertEqual((len(self.pool), self.pool.closes), (2, 1))
+
+    def test_adopt(self):
+        """Adopted files are closed by the pool like any other."""
+        h5file = open_file(self.filenames[0])
+        pooled = self.pool.adopt(h5file)
+        self.lease(1)
+        self.lease(2)
+        self.assertFalse(h5file.id.valid)
+        np.testing.assert_array_equal(pooled['Data/values'][:], np.zeros((10, 2)))
+        self.assertEqual(self.pool.opens, 3)
+
+    def test_proxies_outlive_lease(self):
+        """Groups, datasets and attributes of pooled files remain usable after their file is closed."""
+        pooled = self.pool.adopt(open_file(self.filenames[0]))
+        group, dataset = pooled['Data'], pooled['Data/values']
+        self.assertTrue(isinstance(group, PooledGroup))
+        self.assertTrue(isinstance(dataset, PooledDataset))
+        self.assertTrue(isinstance(group['values'], PooledDataset))
+        self.assertEqual(group.attrs, {'index': 0})
+        self.assertEqual(list(group), ['values'])
+        self.assertTrue('values' in group)
+        self.assertEqual((dataset.shape, len(dataset)), ((10, 2), 10))
+        self.pool.close()
+        self.assertEqual(len(self.pool), 0)
+        np.testing.assert_array_equal(dataset[2:4], np.zeros((2, 2)))
+        # Methods of the group lease the file for the duration of the call
+        visited = []
+        group.visititems(lambda name, obj: visited.append((name, obj.shape)))
+        self.assertEqual(visited, [('values', (10, 2))])
+        self.assertEqual(len(self.pool), 1)
@@ -0,0 +1,75 @@
+"""Tests for the index module."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from katdal.index import build, query, find_files
+from katdal.test.synthetic import make_v3_file
+
+
+class TestIndex(unittest.TestCase):
+    """Catalogue database of synthetic data files."""
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.archive = os.path.join(self.tempdir, 'archive')
+        os.makedirs(os.path.join(self.archive, 'night2'))
+        self.first = os.path.join(self.archive, 'first.h5')
+        self.second = os.path.join(self.archive, 'night2', 'second.h5')
+        make_v3_file(self.first, num_dumps=40, num_chans=8, start=1.4e9)
+        make_v3_file(self.second, num_dumps=20, num_chans=8, start=1.4e9 + 1000.0)
+        self.database = os.path.join(self.tempdir, 'index.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def paths(self, **kwargs):
+        return [row['path'] for row in query(self.database, **kwargs)]
+
+    def test_build_and_query(self):
+        self.assertEqual(sorted(find_files([self.archive])), sorted([self.first, self.second]))
+        self.assertEqual(build(self.archive, self.database, workers=1), 2)
+        rows = query(self.database)
+        self.assertEqual([row['path'] for row in rows], [self.first, self.second])
+        first = rows[0]
+        self.assertEqual((first['dumps'], first['channels'], first['corrprods']), (40, 8, 4))
+        self.assertEqual((first['observer'], first['error']), ('tester', None))
+        self.assertEqual(first['antennas'], ['ant1', 'ant2'])
+        self.assertEqual(sorted(first['targets']), ['Moon', 'Sun'])
+        self.assertAlmostEqual(first['start_time'], 1.4e9)
+        self.assertAlmostEqual(first['end_time'], 1.4e9 + 80.0)
+        self.assertEqual(self.paths(target='Sun'), [self.first, self.second])
+        self.assertEqual(self.paths(target='Jupiter'), [])
+        self.assertEqual(self.paths(antenna='ant2'), [self.first, self.second])
+        self.assertEqual(self.paths(antenna='ant3'), [])
+        self.assertEqual(self.paths(start=1.4e9 + 500.0), [self.second])
+        self.assertEqual(self.paths(end=1.4e9 + 500.0), [self.first])
+        self.assertEqual(self.paths(start=1.4e9 + 50.0, end=1.4e9 + 1010.0), [self.first, self.second])
+        self.assertEqual(self.paths(paths=[self.second]), [self.second])
+
+    def test_incremental(self):
+        """Only new or modified files are summarised again."""
+        self.assertEqual(build([self.archive], self.database, workers=1), 2)
+        self.assertEqual(build([self.archive], self.database, workers=1), 0)
+        os.utime(self.first, (1.5e9, 1.5e9))
+        self.assertEqual(build([self.archive], self.database, workers=1), 1)
+        # Broken files are recorded with their error so that they are not retried until they change
+        broken = os.path.join(self.archive, 'broken.h5')
+        with open(broken, 'wb') as f:
+            f.write('not an HDF5 file')
+        self.assertEqual(build([self.archive], self.database, workers=1), 1)
+        self.assertEqual(build([self.archive], self.database, workers=1), 0)
+        self.assertEqual(self.paths(), [self.first, self.second])
+        rows = query(self.database, errors=True, paths=[broken])
+        self.assertEqual(len(rows), 1)
+        self.assertTrue(rows[0]['error'])
+
+    def test_prune(self):
+        build([self.archive], self.database, workers=1)
+        os.remove(self.second)
+        build([self.archive], self.database, workers=1)
+        self.assertEqual(self.paths(), [self.first, self.second])
+        build([self.archive], self.database, workers=1, prune=True)
+        self.assertEqual(self.paths(), [self.first])
+        self.assertEqual(self.paths(target='Sun'), [self.first])
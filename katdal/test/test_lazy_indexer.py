@@ -0,0 +1,250 @@
+"""Tests for the lazy_indexer module."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import h5py
+
+from katdal.lazy_indexer import (LazyIndexer, LazyTransform, ReadPlan, CostModel, ChunkCache, set_cost_model,
+                                 iter_blocks, _Fusion)
+
+
+class H5TestCase(unittest.TestCase):
+    """Test case with a scratch HDF5 file in a temporary directory."""
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tempdir, 'test.h5')
+        self.file = h5py.File(self.filename, 'w')
+
+    def tearDown(self):
+        self.file.close()
+        shutil.rmtree(self.tempdir)
+
+    def create(self, name, shape, chunks=None, dtype=np.float64):
+        """Create dataset filled with increasing numbers, returning dataset and its data."""
+        data = np.arange(np.prod(shape), dtype=dtype).reshape(shape)
+        return self.file.create_dataset(name, data=data, chunks=chunks), data
+
+
+class TestReadPlan(H5TestCase):
+    """Merging of segments into reads, compared to plain h5py reads."""
+    def setUp(self):
+        H5TestCase.setUp(self)
+        # Chunks of 4 rows x 64 bytes, so that gaps between chunks are multiples of 256 bytes
+        self.dataset, self.data = self.create('chunked', (64, 8), chunks=(4, 8))
+        # Rows in chunks 0, 2 and 10 (gaps of 1 chunk and 7 chunks)
+        self.keep = [0, 1, 9, 10, 40, 41]
+
+    def tearDown(self):
+        set_cost_model(None, self.filename)
+        H5TestCase.tearDown(self)
+
+    def test_gap_merging(self):
+        """Cost model decides which gaps between chunks are read across."""
+        for latency, num_reads, chunks_read in [(1e-6, 3, 3), (1e-5, 2, 4), (1.0, 1, 11)]:
+            model = CostModel(latency=latency, bandwidth=1e8)
+            plan = ReadPlan(self.dataset, [self.keep, slice(None)], cost_model=model)
+            self.assertEqual(plan.num_reads, num_reads)
+            self.assertEqual(plan.chunks_touched, chunks_read)
+            self.assertEqual(plan.bytes_read, chunks_read * 4 * 8 * 8)
+            self.assertEqual(plan.bytes_returned, len(self.keep) * 8 * 8)
+            set_cost_model(model, self.filename)
+            np.testing.assert_array_equal(LazyIndexer(self.dataset)[self.keep], self.dataset[:][self.keep])
+
+    def test_contiguous_gap_merging(self):
+        """Gaps in contiguous datasets are measured in rows instead of chunks."""
+        dataset, data = self.create('contiguous', (64, 8))
+        keep = [0, 2, 50]
+        plan = ReadPlan(dataset, [keep, slice(None)], cost_model=CostModel(latency=1e-5, bandwidth=1e8))
+        self.assertEqual(plan.num_reads, 2)
+        self.assertEqual(plan.chunks_touched, None)
+        self.assertEqual(plan.bytes_read, 4 * 8 * 8)
+        np.testing.assert_array_equal(LazyIndexer(dataset)[keep], data[keep])
+
+    def test_unsorted_and_duplicate_indices(self):
+        """Unsorted and duplicate indices are read once and reordered afterwards."""
+        keep = [41, 0, 0, 9, 40]
+        plan = ReadPlan(self.dataset, [keep, slice(None)])
+        self.assertEqual(plan.read_shape, (4, 8))
+        self.assertEqual(plan.output_shape, (5, 8))
+        np.testing.assert_array_equal(LazyIndexer(self.dataset)[keep], self.data[keep])
+        np.testing.assert_array_equal(LazyIndexer(self.dataset)[keep, [7, 1, 1]], self.data[keep][:, [7, 1, 1]])
+
+    def test_workers(self):
+        """Segments read by several workers end up in the same place."""
+        keep = np.zeros(64, dtype=np.bool)
+        keep[[3, 4, 20, 33, 34, 35, 60]] = True
+        indexer = LazyIndexer(self.dataset, workers=2)
+        set_cost_model(CostModel(latency=1e-6, bandwidth=1e8), self.filename)
+        self.assertTrue(indexer.plan(keep).num_reads > 1)
+        np.testing.assert_array_equal(indexer[keep], self.data[keep])
+
+
+class TestChunkCache(H5TestCase):
+    """Least recently used chunks are evicted once the byte budget is exceeded."""
+    def setUp(self):
+        H5TestCase.setUp(self)
+        # Each chunk has 4 x 4 x 8 = 128 bytes, and the cache holds two of them
+        self.dataset, self.data = self.create('chunked', (16, 4), chunks=(4, 4))
+        self.cache = ChunkCache(max_bytes=256)
+
+    def read_rows(self, start, end):
+        segment = self.cache.read(self.dataset, (slice(start, end), slice(None)))
+        np.testing.assert_array_equal(segment, self.data[start:end])
+
+    def test_lru_eviction(self):
+        self.read_rows(0, 4)
+        self.read_rows(4, 8)
+        self.assertEqual((self.cache.hits, self.cache.misses, self.cache.evictions), (0, 2, 0))
+        # Using the first chunk again makes the second one the least recently used
+        self.read_rows(0, 4)
+        self.read_rows(8, 12)
+        self.assertEqual((self.cache.hits, self.cache.misses, self.cache.evictions), (1, 3, 1))
+        self.assertEqual((len(self.cache), self.cache.nbytes), (2, 256))
+        self.read_rows(0, 4)
+        self.read_rows(4, 8)
+        self.assertEqual((self.cache.hits, self.cache.misses, self.cache.evictions), (2, 4, 2))
+
+    def test_partial_chunks(self):
+        """Selections that straddle chunks are assembled from the cached chunks."""
+        self.read_rows(2, 6)
+        self.assertEqual(self.cache.misses, 2)
+        segment = self.cache.read(self.dataset, (slice(3, 5), 1))
+        np.testing.assert_array_equal(segment, self.data[3:5, 1])
+        self.assertEqual(self.cache.hits, 2)
+
+    def test_oversized_chunk(self):
+        """Chunks larger than the whole budget are read but not cached."""
+        cache = ChunkCache(max_bytes=100)
+        np.testing.assert_array_equal(cache.read(self.dataset, (slice(0, 4), slice(None))), self.data[:4])
+        self.assertEqual((len(cache), cache.nbytes), (0, 0))
+
+    def test_indexer(self):
+        """Indexers sharing a cache read each chunk only once."""
+        cache = ChunkCache()
+        first, second = LazyIndexer(self.dataset, cache=cache), LazyIndexer(self.dataset, cache=cache)
+        np.testing.assert_array_equal(first[[1, 6, 9]], self.data[[1, 6, 9]])
+        misses = cache.misses
+        np.testing.assert_array_equal(second[5:10], self.data[5:10])
+        self.assertEqual(cache.misses, misses)
+
+
+class TestReadOut(H5TestCase):
+    """Reading into a caller-supplied output array."""
+    def setUp(self):
+        H5TestCase.setUp(self)
+        self.dataset, self.data = self.create('chunked', (20, 6, 3), chunks=(4, 3, 3))
+        mask = np.zeros(20, dtype=np.bool)
+        mask[[1, 2, 3, 12, 19]] = True
+        self.keeps = [np.s_[2:15], (mask, slice(None), 1), ([7, 2, 2, 11], np.s_[1:5]), (3, np.s_[1:4]),
+                      (np.s_[::3], np.s_[::2], [2, 0])]
+
+    def check(self, indexer, expected):
+        for keep in self.keeps:
+            out = np.empty(np.shape(expected[keep]), dtype=indexer.dtype)
+            result = indexer.read(keep, out=out)
+            self.assertTrue(result is out)
+            np.testing.assert_array_equal(out, expected[keep])
+            np.testing.assert_array_equal(indexer.read(keep), expected[keep])
+
+    def test_plain(self):
+        self.check(LazyIndexer(self.dataset), self.data)
+
+    def test_first_stage_selection(self):
+        self.check(LazyIndexer(self.dataset, keep=(np.arange(20)[::-1], np.s_[:])), self.data[::-1])
+
+    def test_transformed(self):
+        double = LazyTransform('double', lambda data, keep: 2 * data)
+        self.check(LazyIndexer(self.dataset, transforms=[double]), 2 * self.data)
+
+    def test_singleton_dimensions(self):
+        out = np.empty((13, 1, 6, 3))
+        LazyIndexer(self.dataset).read(np.s_[2:15], out=out)
+        np.testing.assert_array_equal(out[:, 0], self.data[2:15])
+
+    def test_wrong_shape(self):
+        self.assertRaises(ValueError, LazyIndexer(self.dataset).read, np.s_[2:15], np.empty((12, 6, 3)))
+
+
+class TestIterBlocks(H5TestCase):
+    """Block boundaries follow the chunk layout and size limits."""
+    def setUp(self):
+        H5TestCase.setUp(self)
+        # Each index along the first axis has 4 x 8 = 32 bytes
+        self.dataset, self.data = self.create('chunked', (30, 4), chunks=(4, 4))
+
+    def blocks(self, indexer, expected, **kwargs):
+        for prefetch in (0, 1):
+            blocks = list(indexer.iter_blocks(prefetch=prefetch, **kwargs))
+            self.assertEqual([(block.start, block.stop) for block, data in blocks], expected)
+            np.testing.assert_array_equal(np.concatenate([data for block, data in blocks]), indexer[:])
+
+    def test_chunk_aligned(self):
+        self.blocks(LazyIndexer(self.dataset), [(n, min(n + 4, 30)) for n in range(0, 30, 4)])
+
+    def test_block_size(self):
+        expected = [(0, 8), (8, 16), (16, 24), (24, 30)]
+        self.blocks(LazyIndexer(self.dataset), expected, block_size=10)
+        self.blocks(LazyIndexer(self.dataset), expected, max_bytes=320)
+
+    def test_oversized_chunks(self):
+        """Chunks larger than the block size are split."""
+        self.blocks(LazyIndexer(self.dataset), [(0, 3), (3, 4), (4, 7), (7, 8), (8, 11), (11, 12), (12, 15),
+                                                (15, 16), (16, 19), (19, 20), (20, 23), (23, 24), (24, 27),
+                                                (27, 30)], block_size=3)
+
+    def test_first_stage_selection(self):
+        """Blocks are aligned with the chunks of the selected indices."""
+        indexer = LazyIndexer(self.dataset, keep=np.s_[2:30])
+        self.blocks(indexer, [(0, 2)] + [(n, min(n + 4, 28)) for n in range(2, 28, 4)])
+
+    def test_lockstep(self):
+        weights, weights_data = self.create('weights', (30, 2), chunks=(8, 2))
+        indexers = [LazyIndexer(self.dataset), LazyIndexer(weights)]
+        blocks = list(iter_blocks(indexers, block_size=6))
+        self.assertEqual([(block.start, block.stop) for block, data in blocks], [(0, 4), (4, 8), (8, 12),
+                                                                                 (12, 16), (16, 20), (20, 24),
+                                                                                 (24, 30)])
+        np.testing.assert_array_equal(np.concatenate([data[1] for block, data in blocks]), weights_data)
+        short, short_data = self.create('short', (20, 2))
+        self.assertRaises(ValueError, list, iter_blocks([LazyIndexer(self.dataset), LazyIndexer(short)]))
+
+
+def _to_complex(data, keep):
+    """Turn (real, imag) pairs in last dimension into complex numbers."""
+    return data[..., 0] + 1j * data[..., 1]
+
+
+class TestFusion(H5TestCase):
+    """Chunkwise transforms fused with reads give the same results as unfused ones."""
+    def setUp(self):
+        H5TestCase.setUp(self)
+        self.dataset, self.data = self.create('vis', (24, 5, 2), chunks=(4, 5, 2), dtype=np.float32)
+        self.expected = self.data[..., 0] + 1j * self.data[..., 1]
+
+    def transform(self, chunkwise):
+        return LazyTransform('to_complex', _to_complex, lambda shape: shape[:-1], np.complex64, chunkwise=chunkwise)
+
+    def test_fused_matches_unfused(self):
+        fused = LazyIndexer(self.dataset, transforms=[self.transform(True)])
+        unfused = LazyIndexer(self.dataset, transforms=[self.transform(False)])
+        self.assertEqual(fused.shape, unfused.shape)
+        for keep in [np.s_[:], np.s_[3:17], ([9, 2, 2, 20],), (np.s_[::5], [4, 0]), 11]:
+            plan = fused.plan(keep)
+            self.assertEqual(len(_Fusion(fused.transforms, plan, self.dataset).transforms), 1)
+            self.assertEqual(len(_Fusion(unfused.transforms, plan, self.dataset).transforms), 0)
+            np.testing.assert_array_equal(fused[keep], unfused[keep])
+            np.testing.assert_array_equal(fused[keep], self.expected[keep])
+            out = np.empty(self.expected[keep].shape, dtype=np.complex64)
+            np.testing.assert_array_equal(fused.read(keep, out=out), self.expected[keep])
+        self.assertEqual(fused[7, 1], self.expected[7, 1])
+
+    def test_unfusable(self):
+        """Fusion is skipped if the transformed dimension is not read in one go."""
+        fused = LazyIndexer(self.dataset, transforms=[self.transform(True)])
+        keep = (np.s_[:], np.s_[:], [1, 0])
+        self.assertEqual(len(_Fusion(fused.transforms, fused.plan(keep), self.dataset).transforms), 0)
+        np.testing.assert_array_equal(fused[keep], self.data[..., 1] + 1j * self.data[..., 0])
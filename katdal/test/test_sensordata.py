@@ -0,0 +1,141 @@
+"""Tests for the sensordata module."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import h5py
+
+from katdal.sensordata import (SensorData, SensorCache, H5SensorIndex, VirtualSensorIndex, _is_sensor_dataset,
+                               _virtual_indices, MAX_VIRTUAL_MATCHES, MAX_VIRTUAL_INDICES)
+from katdal.test.synthetic import make_v3_file
+
+
+class SensorFileTestCase(unittest.TestCase):
+    """Test case with a synthetic data file and an index of its sensors."""
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tempdir, 'test.h5')
+        make_v3_file(self.filename, num_dumps=50)
+        self.file = h5py.File(self.filename, 'a')
+        # Add objects that look a bit like sensors, but are not
+        self.file['TelescopeModel/obs/no_status'] = np.zeros(3, dtype=[('timestamp', np.float64),
+                                                                       ('value', np.float64)])
+        self.file['TelescopeModel/cbf/counts'] = np.arange(5)
+        self.index = H5SensorIndex(self.file, '/TelescopeModel', lambda name: [name], lambda path: path)
+        self.timestamps = 1.4e9 + 2.0 * np.arange(50) + 1.0
+
+    def tearDown(self):
+        self.file.close()
+        shutil.rmtree(self.tempdir)
+
+
+class TestH5SensorIndex(SensorFileTestCase):
+    """Sensors looked up on demand match those found by visiting the whole group."""
+    def test_matches_visititems(self):
+        visited = {}
+        def visit(path, obj):
+            if _is_sensor_dataset(obj):
+                visited[path] = obj[:]
+        self.file['TelescopeModel'].visititems(visit)
+        self.assertEqual(len(visited), 10)
+        for name, data in visited.iteritems():
+            sensor_data = self.index.get(name)
+            self.assertTrue(isinstance(sensor_data, SensorData))
+            self.assertEqual(sensor_data.name, name)
+            np.testing.assert_array_equal(sensor_data[:], data)
+        # Looking up individual sensors does not visit the group
+        self.assertEqual(self.index._sensors, None)
+        sensors = self.index.sensors()
+        self.assertEqual(sorted(sensors), sorted(visited))
+        self.assertTrue(self.index.sensors() is sensors)
+
+    def test_missing(self):
+        for name in ['ant1/bogus', 'obs/no_status', 'cbf/counts', 'ant1', 'bogus/activity']:
+            self.assertEqual(self.index.get(name), None)
+        self.assertTrue(self.index)
+        self.file.create_group('Empty')
+        self.assertFalse(H5SensorIndex(self.file, '/Empty', lambda name: [name], lambda path: path))
+
+
+class TestSensorCache(SensorFileTestCase):
+    """Lazy lookup of indexed sensors and the memory budget of extracted sensors."""
+    def setUp(self):
+        SensorFileTestCase.setUp(self)
+        self.cache = SensorCache({}, self.timestamps, 2.0, index=self.index)
+        self.names = ['ant1/pos_actual_scan_azim', 'ant1/pos_actual_scan_elev',
+                      'ant2/pos_actual_scan_azim', 'ant2/pos_actual_scan_elev']
+
+    def test_lazy_lookup(self):
+        """Length and string representation only cover sensors looked up so far."""
+        self.assertTrue(self.cache)
+        self.assertEqual(len(self.cache), 0)
+        self.assertTrue(self.names[0] in self.cache)
+        self.assertFalse('ant1/bogus' in self.cache)
+        self.assertEqual(len(self.cache), 1)
+        self.assertTrue('further sensors' in str(self.cache))
+        self.assertEqual(self.index._sensors, None)
+        # Asking for the names of all sensors visits the group
+        self.assertEqual(len(self.cache.keys()), 10)
+        self.assertEqual(len(self.cache), 10)
+        self.assertFalse('further sensors' in str(self.cache))
+        self.assertFalse(SensorCache({}, self.timestamps, 2.0))
+
+    def test_budget(self):
+        """Least recently used sensors are evicted, including a latest sensor that does not fit."""
+        # Each extracted sensor occupies 50 x 8 = 400 bytes
+        self.cache.max_bytes = 1000
+        azim = self.cache.get(self.names[0])
+        np.testing.assert_allclose(azim, np.interp(self.timestamps, self.file['TelescopeModel/' + self.names[0]]
+                                                   ['timestamp'], self.file['TelescopeModel/' + self.names[0]]
+                                                   ['value']))
+        self.cache.get(self.names[1])
+        self.cache.get(self.names[0])
+        self.cache.get(self.names[2])
+        self.assertTrue(isinstance(self.cache.get(self.names[1], extract=False), SensorData))
+        self.assertFalse(isinstance(self.cache.get(self.names[0], extract=False), SensorData))
+        self.assertEqual(self.cache.evictable_nbytes, 800)
+        # Directly assigned sensors are pinned and fall outside the budget
+        self.cache['pinned'] = np.zeros(50)
+        self.assertEqual((self.cache.evictable_nbytes, self.cache.nbytes), (800, 1200))
+        self.cache.max_bytes = 300
+        np.testing.assert_array_equal(self.cache.get(self.names[3]), self.cache.get(self.names[3]))
+        self.assertEqual(self.cache.evictable_nbytes, 0)
+        np.testing.assert_array_equal(self.cache.get('pinned'), np.zeros(50))
+
+    def test_selected_budget(self):
+        """Sensors interpolated onto selected timestamps count towards the budget."""
+        self.cache.interp_selected = True
+        self.cache.max_bytes = 1000
+        self.cache._set_keep(np.arange(50) < 25)
+        selected = self.cache[self.names[0]]
+        self.assertEqual((len(selected), self.cache.evictable_nbytes), (25, 200))
+        # Changing the selection discards the selected values
+        self.cache._set_keep(slice(None))
+        self.assertEqual(self.cache.evictable_nbytes, 0)
+        np.testing.assert_allclose(selected, self.cache.get(self.names[0])[:25])
+        self.assertEqual(self.cache.evictable_nbytes, 400)
+
+
+class TestVirtualSensorIndex(unittest.TestCase):
+    """Virtual sensor templates are matched via a bounded memo."""
+    def test_match(self):
+        index = VirtualSensorIndex({'Antennas/{ant}/lst': None, 'Antennas/{ant}/{ant2}_uvw': None,
+                                    '{name}_mjd': None})
+        self.assertEqual(index.match('Antennas/ant1/lst'), ('Antennas/{ant}/lst', {'ant': 'ant1'}))
+        self.assertEqual(index.match('Antennas/ant1/ant2_uvw'), ('Antennas/{ant}/{ant2}_uvw',
+                                                                 {'ant': 'ant1', 'ant2': 'ant2'}))
+        self.assertEqual(index.match('Timestamps_mjd'), ('{name}_mjd', {'name': 'Timestamps'}))
+        self.assertEqual(index.match('Antennas/ant1/bogus'), None)
+
+    def test_bounded(self):
+        index = VirtualSensorIndex({'Antennas/{ant}/lst': None})
+        for n in range(MAX_VIRTUAL_MATCHES + 10):
+            index.match('Antennas/ant%d/lst' % (n,))
+        self.assertEqual(len(index._matches), MAX_VIRTUAL_MATCHES)
+        self.assertEqual(index.match('Antennas/ant0/lst'), ('Antennas/{ant}/lst', {'ant': 'ant0'}))
+        for n in range(MAX_VIRTUAL_INDICES + 2):
+            SensorCache({}, np.zeros(1), 1.0, virtual={'Template%d/{x}' % (n,): None})._virtual_index()
+        self.assertEqual(len(_virtual_indices), MAX_VIRTUAL_INDICES)
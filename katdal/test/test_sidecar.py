@@ -0,0 +1,144 @@
+"""Tests for the sidecar module."""
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import katpoint
+
+from katdal.categorical import CategoricalData
+from katdal.sidecar import load_sidecar, save_sidecar, sidecar_filename, SensorStore
+
+
+def _touch(filename, mtime):
+    """Set modification time of file."""
+    os.utime(filename, (mtime, mtime))
+
+
+class TestSidecar(unittest.TestCase):
+    """Sidecar index is only used while data file and parameters are unchanged."""
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tempdir, 'data.h5')
+        with open(self.filename, 'wb') as f:
+            f.write('data')
+        _touch(self.filename, 1.4e9)
+        self.params = {'ref_ant': 'ant1', 'time_offset': 0.0, 'timestamps': 'abc'}
+        self.scan = CategoricalData(['slew', 'track', 'slew'], [0, 3, 10, 20])
+        self.target = CategoricalData([katpoint.Target('Sun, special'), katpoint.Target('Moon, special')],
+                                      [0, 5, 20])
+        save_sidecar(self.filename, self.params, scan=self.scan, target=self.target)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_round_trip(self):
+        observation = load_sidecar(self.filename, dict(self.params))
+        self.assertEqual(sorted(observation), ['scan', 'target'])
+        scan, target = observation['scan'], observation['target']
+        self.assertEqual(list(scan.unique_values), ['slew', 'track'])
+        np.testing.assert_array_equal(scan.events, self.scan.events)
+        np.testing.assert_array_equal(scan.indices, self.scan.indices)
+        self.assertEqual([t.name for t in target.unique_values], ['Sun', 'Moon'])
+        np.testing.assert_array_equal(target.events, self.target.events)
+
+    def test_stale_data_file(self):
+        """Modifying the data file invalidates the sidecar index."""
+        _touch(self.filename, 1.4e9 + 1)
+        self.assertEqual(load_sidecar(self.filename, self.params), None)
+        _touch(self.filename, 1.4e9)
+        self.assertNotEqual(load_sidecar(self.filename, self.params), None)
+        with open(self.filename, 'ab') as f:
+            f.write('more')
+        _touch(self.filename, 1.4e9)
+        self.assertEqual(load_sidecar(self.filename, self.params), None)
+
+    def test_changed_params(self):
+        """Changing any parameter (e.g. the data timestamps) invalidates the sidecar index."""
+        for name, value in [('ref_ant', 'ant2'), ('time_offset', 1.0), ('timestamps', 'abd')]:
+            params = dict(self.params)
+            params[name] = value
+            self.assertEqual(load_sidecar(self.filename, params), None)
+        params = dict(self.params)
+        params['quicklook'] = True
+        self.assertEqual(load_sidecar(self.filename, params), None)
+
+    def test_corrupted(self):
+        with open(sidecar_filename(self.filename), 'wb') as f:
+            f.write('garbage')
+        self.assertEqual(load_sidecar(self.filename, self.params), None)
+
+
+class TestSensorStore(unittest.TestCase):
+    """Sensor store evicts least recently used entries once it exceeds its size limit."""
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.directory = os.path.join(self.tempdir, 'store')
+        self.store = SensorStore(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def entries(self):
+        return sorted(os.path.splitext(filename)[0] for filename in os.listdir(self.directory))
+
+    def test_round_trip(self):
+        self.assertEqual(self.store.load('missing'), None)
+        self.store.save('numerical', np.arange(10.0))
+        self.store.save('categorical', CategoricalData(['a', 'b'], [0, 4, 10]))
+        self.store.save('unsupported', np.array([object()]))
+        self.assertEqual(self.entries(), ['categorical', 'numerical'])
+        np.testing.assert_array_equal(self.store.load('numerical'), np.arange(10.0))
+        categ = self.store.load('categorical')
+        self.assertEqual((list(categ.unique_values), list(categ.events)), (['a', 'b'], [0, 4, 10]))
+
+    def test_keys(self):
+        """Keys depend on data file, sensor name, properties and timestamps."""
+        filename = os.path.join(self.tempdir, 'data.h5')
+        with open(filename, 'wb') as f:
+            f.write('data')
+        store = self.store.bind(filename)
+        key = store.key('sensor', {'interp_degree': 1}, 'abc')
+        self.assertEqual(key, self.store.bind(filename).key('sensor', {'interp_degree': 1}, 'abc'))
+        self.assertNotEqual(key, store.key('other', {'interp_degree': 1}, 'abc'))
+        self.assertNotEqual(key, store.key('sensor', {'interp_degree': 2}, 'abc'))
+        self.assertNotEqual(key, store.key('sensor', {'interp_degree': 1}, 'abd'))
+        _touch(filename, time.time() - 100)
+        self.assertNotEqual(key, self.store.bind(filename).key('sensor', {'interp_degree': 1}, 'abc'))
+
+    def test_eviction(self):
+        now = time.time()
+        self.store.save('a', np.arange(100.0))
+        self.store.save('b', np.arange(100.0))
+        entry_size = os.path.getsize(os.path.join(self.directory, 'a.npz'))
+        _touch(os.path.join(self.directory, 'a.npz'), now - 100)
+        _touch(os.path.join(self.directory, 'b.npz'), now - 50)
+        # Loading an entry marks it as recently used, which leaves b as the least recently used entry
+        np.testing.assert_array_equal(self.store.load('a'), np.arange(100.0))
+        self.store.max_bytes = int(2.5 * entry_size)
+        self.store.save('c', np.arange(100.0))
+        self.assertEqual(self.entries(), ['a', 'c'])
+        self.assertEqual(self.store.load('b'), None)
+        self.assertEqual(self.store._usage['size'], 2 * entry_size)
+
+    def test_overwrite(self):
+        """Replacing an entry does not count its size twice."""
+        self.store.save('a', np.arange(100.0))
+        self.store.save('b', np.arange(10.0))
+        total = self.store._usage['size']
+        for n in range(5):
+            self.store.save('a', np.arange(100.0))
+        self.assertEqual(self.store._usage['size'], total)
+        self.store.save('a', np.arange(10.0))
+        self.assertEqual(self.store._usage['size'], self.store._entries()[1])
+
+    def test_clear(self):
+        self.store.save('a', np.arange(10.0))
+        self.store.clear()
+        self.assertEqual((self.entries(), self.store._usage['size']), ([], 0))
+        # Clearing an empty store is fine too
+        self.store.clear()
+        self.assertEqual(self.entries(), [])
@@ -8,46 +8,61 @@
 
 import os
 import optparse
-import glob
 import logging
 
 import katdal
+import katdal.index
+import katpoint
 
 # See warnings while loading files (will appear *above* the relevant file)
 # logging.basicConfig(format='%(levelname)s %(name)s %(message)s')
 
 parser = optparse.OptionParser(usage="%prog [options] [filename or directory]*", description='List HDF5 files')
+parser.add_option('-d', '--db', help='Catalogue database that stores file summaries (updated with new or '
+                  'modified files before listing, which avoids reopening unchanged files)')
+parser.add_option('-j', '--workers', type='int', help='Number of processes that open files in parallel when '
+                  'updating catalogue database (default is number of CPUs)')
+parser.add_option('-t', '--target', help='Only list files containing this target (requires --db)')
+parser.add_option('-a', '--ant', help='Only list files containing this antenna (requires --db)')
+parser.add_option('-s', '--start', help='Only list files ending after this time (requires --db)')
+parser.add_option('-e', '--end', help='Only list files starting before this time (requires --db)')
 opts, args = parser.parse_args()
 # Lists HDF5 files in current directory if no arguments where given
 args = ['*.h5'] if not args else args
+if not opts.db and (opts.target or opts.ant or opts.start or opts.end):
+    parser.error('Selecting files by target, antenna or time requires a catalogue database (--db)')
 
 # Turn arguments (individual files, globs and directories) into a big list of HDF5 files
-files = []
-for arg in args:
-    if '*' in arg:
-        files.extend([name for name in glob.glob(arg) if name.endswith('.h5')])
-    elif arg.endswith('.h5'):
-        files.append(arg)
-    else:
-        for rootdir, subdirs, dirfiles in os.walk(arg):
-            files.extend([os.path.join(rootdir, name) for name in dirfiles if name.endswith('.h5')])
-
-# Open each file in turn and print a one-line summary
-print "Name          Ver Observer   StartTimeSAST       Shape               SizeGB DumpHz SPW CFreqMHz Ants    Tgts Scans Description"
-for f in files:
-    try:
-        d = katdal.open(f, quicklook=True)
-    except Exception, e:
-        print '%s %s - %s' % (f, e.__class__.__name__, e)
-        continue
+files = katdal.index.find_files(args)
+
+
+def print_summary(f, s):
+    """Print one-line summary of file `f` given dict `s` of summary fields."""
     name = os.path.basename(f)
     name = (name[:10] + '...') if len(name) > 13 else name
     all_ants = ('ant1', 'ant2', 'ant3', 'ant4', 'ant5', 'ant6', 'ant7')
-    file_ants = [ant.name for ant in d.ants]
-    ants = ''.join([(ant[3:] if ant in file_ants else '-') for ant in all_ants])
+    ants = ''.join([(ant[3:] if ant in s['antennas'] else '-') for ant in all_ants])
     print '%13s %3s %10s %19s (%6d,%5d,%4d) %6.2f %6.3f %3d %8.3f %s %4d %5d %s' % \
-          (name, d.version, d.observer.strip()[:10].ljust(10), d.start_time.local()[:19],
-           d.shape[0], d.shape[1], d.shape[2], d.size / 1024. / 1024. / 1024., 1.0 / d.dump_period,
-           len(d.spectral_windows), d.spectral_windows[d.spw].centre_freq / 1e6, ants,
-           len(d.catalogue), len(d.scan_indices), d.description)
-    del d
+          (name, s['version'], s['observer'].strip()[:10].ljust(10), katpoint.Timestamp(s['start_time']).local()[:19],
+           s['dumps'], s['channels'], s['corrprods'], s['data_size'] / 1024. / 1024. / 1024., s['dump_rate'],
+           s['spws'], s['centre_freq'] / 1e6, ants, len(s['targets']), s['scans'], s['description'])
+
+print "Name          Ver Observer   StartTimeSAST       Shape               SizeGB DumpHz SPW CFreqMHz Ants    Tgts Scans Description"
+if opts.db:
+    # Summarise new or modified files in parallel and list everything from the database
+    katdal.index.build(files, opts.db, workers=opts.workers)
+    for s in katdal.index.query(opts.db, target=opts.target, start=opts.start, end=opts.end,
+                                antenna=opts.ant, paths=files, errors=True):
+        if s['error']:
+            print '%s %s' % (s['path'], s['error'])
+        else:
+            print_summary(s['path'], s)
+else:
+    # Open each file in turn and print a one-line summary
+    for f in files:
+        try:
+            s = katdal.index.summarise(f)
+        except Exception, e:
+            print '%s %s - %s' % (f, e.__class__.__name__, e)
+            continue
+        print_summary(f, s)
@@ -211,6 +211,13 @@ for win in range(len(h5.spectral_windows)):
     field_names, field_centers, field_times = [], [], []
     obs_modes = ['UNKNOWN']
 
+    # Reuse the same scan data buffers for all scans (only growing them when a longer scan comes along)
+    scan_buffers = {}
+    def scan_buffer(name, dtype):
+        if name not in scan_buffers or len(scan_buffers[name]) < h5.shape[0]:
+            scan_buffers[name] = np.empty(h5.shape, dtype=dtype)
+        return scan_buffers[name][:h5.shape[0]]
+
     for scan_ind, scan_state, target in h5.scans():
         s = time.time()
         scan_len = h5.shape[0]
@@ -226,11 +233,11 @@ for win in range(len(h5.spectral_windows)):
         print "scan %3d (%4d samples) loaded. Target: '%s'. Writing to disk..." % (scan_ind, scan_len, target.name)
 
         # load all data for this scan up front, as this improves disk throughput
-        scan_data = h5.vis[:]
+        scan_data = h5.vis.read(out=scan_buffer('vis', np.complex64))
         # load the weights for this scan.
-        scan_weight_data = h5.weights()[:]
+        scan_weight_data = h5.weights().read(out=scan_buffer('weights', np.float32))
         # load flags selected from 'options.flags' for this scan
-        scan_flag_data = h5.flags(options.flags)[:]
+        scan_flag_data = h5.flags(options.flags).read(out=scan_buffer('flags', np.bool))
 
         # Get the average dump time for this scan (equal to scan length if the dump period is longer than a scan)
         dump_time_width = min(time_av,scan_len*h5.dump_period)